@@ -0,0 +1,134 @@
+"""
+Benchmark: storing a document's chunks, bulk upload path vs the old per-row ORM path
+
+Usage (from backend/):
+    python -m benchmarks.bench_chunk_insert
+    python -m benchmarks.bench_chunk_insert --size-mb 2 --repeat 3
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_chunk_insert
+
+Without DATABASE_URL a temporary SQLite file is used.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_chunks.db"
+
+from lib.Database_config import AsyncSessionLocal, async_engine, init_db  # noqa: E402
+from models.database_models import Document, DocumentChunk, FileType  # noqa: E402
+from utils.chunker import chunk_text  # noqa: E402
+from utils.database_utils import ContextDB, DocumentDB, CHUNK_BATCH_SIZE  # noqa: E402
+
+
+def make_document(size_mb: float) -> str:
+    """Build a prose-like document of roughly size_mb megabytes"""
+    paragraph = (
+        "The quarterly report covers revenue, operating costs and headcount. "
+        "Each region submitted figures that were reconciled by the finance team. "
+        "Open questions are listed at the end of the section for follow-up.\n\n"
+    )
+    return paragraph * max(1, int(size_mb * 1024 * 1024 / len(paragraph)))
+
+
+def unique_hash() -> str:
+    """A content hash no other run uses, so every run stores a new document"""
+    return DocumentDB.hash_content(uuid.uuid4().bytes)
+
+
+async def new_document(db) -> int:
+    document = Document(content_hash=unique_hash(), file_type=FileType.TEXT, byte_size=0, text_content="")
+    db.add(document)
+    await db.flush()
+    return document.id
+
+
+async def store_per_row(db, document_ids: list[int], chunks: list[str]):
+    """The previous implementation: one ORM object per chunk, one unit of work"""
+    document_id = await new_document(db)
+    for index, text in enumerate(chunks):
+        db.add(DocumentChunk(document_id=document_id, chunk_index=index, chunk_text=text))
+    await db.commit()
+    document_ids.append(document_id)
+
+
+async def store_bulk_only(db, document_ids: list[int], chunks: list[str]):
+    """The bulk write alone (no BM25 indexing or per-batch commits): batched insert_chunk_rows"""
+    document_id = await new_document(db)
+    for start in range(0, len(chunks), CHUNK_BATCH_SIZE):
+        await ContextDB.insert_chunk_rows(db, [
+            {"document_id": document_id, "chunk_index": index, "chunk_text": text, "page_number": None}
+            for index, text in enumerate(chunks[start:start + CHUNK_BATCH_SIZE], start=start)
+        ], model=DocumentChunk)
+    await db.commit()
+    document_ids.append(document_id)
+
+
+async def create_document(db, document_ids: list[int], chunks) -> int:
+    """The upload path: staged document, one commit per batch, BM25 index"""
+    document, _ = await DocumentDB.create_document(db, unique_hash(), FileType.TEXT, 0, chunks)
+    document_ids.append(document.id)
+    return document.chunks_count
+
+
+async def timed(make_call, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await make_call()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def run(args):
+    document_ids = []
+    async with AsyncSessionLocal() as db:
+        text = make_document(args.size_mb)
+        fixed_chunks = [text[i:i + args.chunk_chars] for i in range(0, len(text), args.chunk_chars)]
+        
+        print(f"📊 {len(text) / 1e6:.1f} MB document, {len(fixed_chunks)} chunks, "
+              f"{async_engine.dialect.name}, {args.repeat} runs\n")
+        
+        per_row = await timed(lambda: store_per_row(db, document_ids, fixed_chunks), args.repeat)
+        bulk_only = await timed(lambda: store_bulk_only(db, document_ids, fixed_chunks), args.repeat)
+        bulk = await timed(lambda: create_document(db, document_ids, fixed_chunks), args.repeat)
+        pipeline = await timed(lambda: create_document(db, document_ids, chunk_text(text)), args.repeat)
+        pipeline_count = (await db.get(Document, document_ids[-1])).chunks_count
+        
+        rows = [
+            ("per-row ORM (old)", per_row, len(fixed_chunks)),
+            ("bulk insert only", bulk_only, len(fixed_chunks)),
+            ("create_document", bulk, len(fixed_chunks)),
+            ("chunker + create", pipeline, pipeline_count),
+        ]
+        baseline = statistics.median(per_row)
+        print(f"{'path':<20}{'chunks':>8}{'median s':>12}{'rows/s':>12}{'speedup':>10}")
+        for name, timings, count in rows:
+            median = statistics.median(timings)
+            print(f"{name:<20}{count:>8}{median:>12.3f}{count / median:>12.0f}{baseline / median:>9.1f}x")
+        
+        for document_id in document_ids:
+            await DocumentDB.discard(db, document_id)
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=2.0, help="document size in MB")
+    parser.add_argument("--chunk-chars", type=int, default=500, help="chunk size for the per-row baseline")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    init_db()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Benchmark: chat-turn throughput with the async data layer vs blocking sync queries
+
+Each simulated request does what a document question does against the
+database - look up the conversation, read the latest file and retrieve
+chunks, commit, wait for the "model", then write the turn and commit.
+The sync variant runs the same queries with a sync Session inside the
+coroutine (how the handlers used to work), so every query blocks the
+event loop; the async variant awaits them.
+
+Usage (from backend/):
+    python -m benchmarks.bench_db_concurrency
+    python -m benchmarks.bench_db_concurrency --requests 500 --concurrency 50 --model-ms 100
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_db_concurrency
+
+Without DATABASE_URL a temporary SQLite file is used. A local SQLite file
+has no network round-trips, so --db-latency-ms (default 2) adds a simulated
+one to every statement and commit: a blocking sleep for the sync driver, an
+awaited one for the async driver - which is how real drivers wait on the
+network. Use --db-latency-ms 0 against a real PostgreSQL server.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_concurrency.db"
+
+from sqlalchemy import event, func, select, update  # noqa: E402
+from sqlalchemy.util import await_only  # noqa: E402
+
+from lib.Database_config import AsyncSessionLocal, SessionLocal, async_engine, engine, init_db  # noqa: E402
+from models.database_models import Conversation, Document, DocumentChunk, File, FileType, Message, MessageRole, utcnow  # noqa: E402
+from utils.database_utils import ConversationDB, ContextDB, DocumentDB, FileDB, MessageDB  # noqa: E402
+
+QUESTION = "What does the report say about operating costs?"
+
+# SQLite allows a single writer: queue async writes here instead of letting
+# them spin in SQLite's busy handler (PostgreSQL needs no such lock)
+sqlite_write_lock = asyncio.Lock() if async_engine.dialect.name == "sqlite" else None
+
+
+def simulate_latency(seconds: float):
+    """Add a round-trip to every statement and commit of both engines"""
+    def blocking(*_):
+        time.sleep(seconds)
+
+    def awaited(*_):
+        # Runs inside SQLAlchemy's greenlet bridge: suspends like a socket read
+        await_only(asyncio.sleep(seconds))
+
+    for target, wait in ((engine, blocking), (async_engine.sync_engine, awaited)):
+        event.listen(target, "before_cursor_execute", wait)
+        event.listen(target, "commit", wait)
+
+
+def make_chunks(count: int, document: int) -> list[str]:
+    return [
+        f"Section {i} of report {document}. Revenue, operating costs and headcount for region {i % 7} "
+        f"were reconciled by the finance team in week {i % 52}."
+        for i in range(count)
+    ]
+
+
+async def setup(conversations: int, chunks: int) -> list[str]:
+    """Create conversations with a document each, stored and attached like an upload; returns their session ids"""
+    session_ids = []
+    async with AsyncSessionLocal() as db:
+        for c in range(conversations):
+            conversation = await ConversationDB.create_conversation(db, title="bench")
+            document, _ = await DocumentDB.create_document(
+                db, DocumentDB.hash_content(f"bench report {c}".encode()), FileType.TEXT, 0, make_chunks(chunks, c)
+            )
+            await ContextDB.set_document(db, conversation.id, document.id)
+            await FileDB.create_file(
+                db, conversation.id, f"report{c}.txt", FileType.TEXT, chunks_count=chunks, document_id=document.id
+            )
+            session_ids.append(conversation.session_id)
+        await db.commit()
+    return session_ids
+
+
+def sync_turn_queries(db, session_id: str):
+    """The blocking query sequence of one turn (old style)"""
+    conversation = db.execute(select(Conversation).where(Conversation.session_id == session_id)).scalars().first()
+    db.execute(
+        select(File).where(File.conversation_id == conversation.id).order_by(File.created_at.desc()).limit(1)
+    ).scalars().first()
+    document_id, _ = db.execute(
+        select(Conversation.context_document_id, Document.chunks_count)
+        .outerjoin(Document, Document.id == Conversation.context_document_id)
+        .where(Conversation.id == conversation.id)
+    ).one()
+    db.execute(
+        select(DocumentChunk.chunk_text).where(DocumentChunk.document_id == document_id).order_by(DocumentChunk.chunk_index).limit(3)
+    ).all()
+    db.commit()
+    return conversation.id
+
+
+def sync_write_turn(db, conversation_id: int, answer: str):
+    db.add_all([
+        Message(conversation_id=conversation_id, role=MessageRole.USER, content=QUESTION),
+        Message(conversation_id=conversation_id, role=MessageRole.ASSISTANT, content=answer)
+    ])
+    db.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(message_count=Conversation.message_count + 2, updated_at=utcnow())
+    )
+    db.commit()
+
+
+async def sync_request(session_id: str, model_seconds: float):
+    db = SessionLocal()
+    try:
+        conversation_id = sync_turn_queries(db, session_id)
+        await asyncio.sleep(model_seconds)
+        sync_write_turn(db, conversation_id, "answer")
+    finally:
+        db.close()
+
+
+async def async_request(session_id: str, model_seconds: float):
+    async with AsyncSessionLocal() as db:
+        conversation = await ConversationDB.get_or_create_conversation(db, session_id)
+        await FileDB.get_latest_file(db, conversation.id)
+        await ContextDB.search_chunks(db, conversation.id, QUESTION)
+        await db.commit()
+        await asyncio.sleep(model_seconds)
+        if sqlite_write_lock is None:
+            await MessageDB.create_turn(db, conversation.id, QUESTION, "answer")
+            await db.commit()
+        else:
+            async with sqlite_write_lock:
+                await MessageDB.create_turn(db, conversation.id, QUESTION, "answer")
+                await db.commit()
+
+
+async def run_load(request, session_ids: list[str], requests: int, concurrency: int, model_seconds: float):
+    """Run `requests` requests with at most `concurrency` in flight; returns (seconds, latencies)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await request(session_ids[i % len(session_ids)], model_seconds)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - start, latencies
+
+
+async def run(args):
+    session_ids = await setup(args.conversations, args.chunks)
+    model_seconds = args.model_ms / 1000
+    if args.db_latency_ms > 0:
+        simulate_latency(args.db_latency_ms / 1000)
+
+    print(f"📊 {args.requests} requests, concurrency {args.concurrency}, "
+          f"{args.model_ms:.0f} ms simulated model call, "
+          f"{args.db_latency_ms:.1f} ms simulated DB round-trip, {async_engine.dialect.name}\n")
+    print(f"{'data layer':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+
+    results = {}
+    for name, request in (("sync (old)", sync_request), ("async", async_request)):
+        # Warm up pools and the BM25 indexes
+        await run_load(request, session_ids, len(session_ids), args.concurrency, 0)
+        elapsed, latencies = await run_load(request, session_ids, args.requests, args.concurrency, model_seconds)
+        latencies.sort()
+        results[name] = args.requests / elapsed
+        print(f"{name:<14}{results[name]:>10.1f}"
+              f"{statistics.median(latencies) * 1000:>10.1f}"
+              f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>10.1f}")
+
+    print(f"\nasync / sync throughput: {results['async'] / results['sync (old)']:.1f}x")
+    await async_engine.dispose()
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--model-ms", type=float, default=50.0, help="simulated LLM latency per request")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="simulated network round-trip per statement")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=200, help="chunks per conversation")
+    args = parser.parse_args()
+
+    init_db()
+    if engine.dialect.name == "sqlite":
+        # Readers must not block the concurrent writers
+        with engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
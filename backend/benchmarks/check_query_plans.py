@@ -0,0 +1,161 @@
+"""
+Check: the hot per-conversation queries use their composite indexes
+
+Runs the real helpers of one chat turn against a database seeded through
+the upload path (shared documents) - plus the chunk reads of a
+conversation whose chunks predate them - captures the SQL they send and
+asks the database for its plan (EXPLAIN QUERY PLAN on SQLite, EXPLAIN on
+PostgreSQL). Each query must use the index it was written for; exits
+with status 1 otherwise.
+
+Usage (from backend/):
+    python -m benchmarks.check_query_plans
+    DATABASE_URL=postgresql://... python -m benchmarks.check_query_plans
+
+Without DATABASE_URL a temporary SQLite file is used. On PostgreSQL
+sequential scans are disabled for the EXPLAIN, because a small table is
+cheaper to scan and the planner would rightly skip the index; the check is
+whether the index is usable, not whether it wins on this data.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/check_query_plans.db"
+
+from sqlalchemy import event  # noqa: E402
+
+from lib.Database_config import AsyncSessionLocal, async_engine, engine, init_db  # noqa: E402
+from models.database_models import Context, FileType  # noqa: E402
+from utils.database_utils import ContextDB, ConversationDB, DocumentDB, FileDB, MessageDB  # noqa: E402
+
+# (label, helper call, index its plan must use); calls get the seeded ids
+HOT_QUERIES = [
+    ("latest file", lambda db, ids: FileDB.get_latest_file(db, ids.conversation),
+     "ix_files_conversation_id_created_at"),
+    ("recent messages", lambda db, ids: MessageDB.get_recent_messages(db, ids.conversation),
+     "ix_messages_conversation_id_created_at"),
+    ("history page", lambda db, ids: MessageDB.get_history_page(db, ids.conversation, limit=20),
+     "ix_messages_conversation_id_id"),
+    ("older history page", lambda db, ids: MessageDB.get_history_page(db, ids.conversation, limit=20, before_id=100),
+     "ix_messages_conversation_id_id"),
+    ("first chunks", lambda db, ids: ContextDB.get_chunks(db, ids.conversation, limit=3),
+     "ix_document_chunks_document_id_chunk_index"),
+    ("chunks by index", lambda db, ids: ContextDB.get_chunks_by_index(db, ids.conversation, [5, 1, 9]),
+     "ix_document_chunks_document_id_chunk_index"),
+    ("legacy chunks version", lambda db, ids: ContextDB.get_chunks_version(db, ids.legacy),
+     "ix_contexts_conversation_id_chunk_index"),
+    ("legacy first chunks", lambda db, ids: ContextDB.get_chunks(db, ids.legacy, limit=3),
+     "ix_contexts_conversation_id_chunk_index"),
+    ("legacy chunks by index", lambda db, ids: ContextDB.get_chunks_by_index(db, ids.legacy, [5, 1, 9]),
+     "ix_contexts_conversation_id_chunk_index"),
+    ("conversation list", lambda db, ids: ConversationDB.list_conversations(db, limit=20),
+     "ix_conversations_updated_at_id"),
+]
+
+
+async def seed(conversations: int = 30, documents: int = 10, messages: int = 40, chunks: int = 50) -> SimpleNamespace:
+    """
+    Fill a few conversations so plans are not for empty tables
+
+    Documents are stored and attached like uploads (several conversations
+    share each one); the last conversation keeps its chunks in contexts, as
+    conversations from before shared documents do. Returns both ids.
+    """
+    async with AsyncSessionLocal() as db:
+        document_ids = []
+        for d in range(documents):
+            document, _ = await DocumentDB.create_document(
+                db, DocumentDB.hash_content(f"plan check document {d}".encode()), FileType.TEXT, 10,
+                [f"chunk {i} of {d}" for i in range(chunks)]
+            )
+            document_ids.append(document.id)
+
+        conversation_ids = []
+        for c in range(conversations):
+            conversation = await ConversationDB.create_conversation(db, title=f"plan check {c}")
+            conversation_ids.append(conversation.id)
+            for m in range(messages // 2):
+                await MessageDB.create_turn(db, conversation.id, f"question {m}", f"answer {m}")
+            document_id = document_ids[c % documents]
+            await FileDB.create_file(db, conversation.id, f"doc{c}.txt", FileType.TEXT, file_size=10, document_id=document_id)
+            if c < conversations - 1:
+                await ContextDB.set_document(db, conversation.id, document_id)
+            else:
+                await ContextDB.insert_chunk_rows(db, [
+                    {"conversation_id": conversation.id, "chunk_index": i, "chunk_text": f"chunk {i}", "page_number": None}
+                    for i in range(chunks)
+                ], model=Context)
+        await db.commit()
+    return SimpleNamespace(conversation=conversation_ids[-2], legacy=conversation_ids[-1])
+
+
+async def capture_sql(call, ids: SimpleNamespace) -> tuple:
+    """Run a helper and return the (statement, parameters) of its query"""
+    captured = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        async with AsyncSessionLocal() as db:
+            await call(db, ids)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", listener)
+
+    return captured[-1]
+
+
+async def explain(statement: str, parameters) -> str:
+    async with async_engine.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            await connection.exec_driver_sql("SET enable_seqscan = off")
+            result = await connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            return "\n".join(row[0] for row in result)
+        result = await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return "\n".join(row[-1] for row in result)
+
+
+async def check() -> int:
+    ids = await seed()
+    if async_engine.dialect.name == "sqlite":
+        async with async_engine.begin() as connection:
+            await connection.exec_driver_sql("ANALYZE")
+
+    print(f"🔎 Query plans on {async_engine.dialect.name}\n")
+    failures = 0
+    for label, call, index_name in HOT_QUERIES:
+        statement, parameters = await capture_sql(call, ids)
+        plan = await explain(statement, parameters)
+        ok = index_name in plan
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {label:<24} expects {index_name}")
+        if not ok:
+            print("     " + plan.replace("\n", "\n     "))
+
+    print(f"\n{len(HOT_QUERIES) - failures}/{len(HOT_QUERIES)} hot queries use their index")
+    return 1 if failures else 0
+
+
+async def run() -> int:
+    try:
+        return await check()
+    finally:
+        # aiosqlite connections run in threads that keep the process alive
+        await async_engine.dispose()
+        engine.dispose()
+
+
+def main():
+    init_db()
+    sys.exit(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Check: a cold process imports quickly and serves requests right away
+
+Measures, in fresh interpreters:
+- `import index`: wall time (median of --runs) and the slowest modules
+  (python -X importtime)
+- time until a new `uvicorn index:app` answers GET /health
+
+Fails (exit status 1) when a module that should load lazily is imported
+by `import index`, or when the time to ready exceeds --budget-ms.
+
+Usage (from backend/):
+    python -m benchmarks.check_startup
+    python -m benchmarks.check_startup --runs 5 --budget-ms 1000 --top 15
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported on first use or by the background warm-up, never by `import index`
+LAZY_MODULES = ("groq", "PyPDF2", "docx", "numpy", "cloudinary", "sentence_transformers", "torch", "requests")
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env["STARTUP_WARMUP"] = "false"
+    return env
+
+
+def time_import() -> float:
+    code = "import time; t = time.perf_counter(); import index; print(time.perf_counter() - t)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=child_env(),
+        capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def import_profile() -> list:
+    """(cumulative microseconds, depth, module) for every module `import index` loads, index last"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import index"], cwd=BACKEND_DIR, env=child_env(),
+        capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        depth = (len(match.group(3)) - 1) // 2
+        if depth == 0 and match.group(4) != "index":
+            # Loaded by the interpreter before index (children come before their parent)
+            modules = []
+            continue
+        modules.append((int(match.group(2)), depth, match.group(4)))
+    return modules
+
+
+def time_to_ready(port: int, timeout: float = 30.0) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "index:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"server not ready after {timeout:.0f}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="max time from process start to /health")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    import_seconds = statistics.median(time_import() for _ in range(args.runs))
+    print(f"import index: {import_seconds * 1000:.0f} ms (median of {args.runs})")
+
+    modules = import_profile()
+    loaded = {name.split(".")[0] for _, _, name in modules}
+    print("\nslowest direct imports of index:")
+    for cumulative, _, name in sorted((m for m in modules if m[1] == 1), reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failures = 0
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager:
+        failures += 1
+        print(f"\nFAIL imported eagerly (should load on first use): {', '.join(eager)}")
+
+    ready_seconds = statistics.median(time_to_ready(args.port) for _ in range(args.runs))
+    status = "OK  " if ready_seconds * 1000 <= args.budget_ms else "FAIL"
+    if status == "FAIL":
+        failures += 1
+    print(f"\n{status} process start to first /health: {ready_seconds * 1000:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Local stand-in for the Groq chat completions API (for load tests)
+
+Serves POST /openai/v1/chat/completions - the path the groq SDK calls -
+with answers of a fixed length, after a configurable time to first token
+and at a configurable token rate, streamed (SSE) or not. No API key is
+checked and nothing leaves the machine.
+
+Usage (from backend/):
+    python -m benchmarks.fake_groq --port 8090 --latency-ms 300 --tokens-per-second 250
+    GROQ_BASE_URL=http://127.0.0.1:8090 GROQ_API_KEY=fake uvicorn index:app
+
+benchmarks.load_test starts it by itself.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "the report shows revenue operating costs and headcount for each region "
+    "with figures reconciled by the finance team and open questions listed"
+).split()
+
+
+class FakeGroqSettings:
+    """Timing of the fake model (shared by all requests of the server)"""
+
+    def __init__(self, latency_ms: float = 300, jitter_ms: float = 50, tokens_per_second: float = 250,
+                 completion_tokens: int = 120, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+
+    def first_token_delay(self) -> float:
+        return max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+def prompt_tokens(messages: list) -> int:
+    """Rough prompt size (words), good enough for usage numbers"""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            total += len(content.split())
+        elif isinstance(content, list):
+            total += sum(len(part.get("text", "").split()) if part.get("type") == "text" else 1000 for part in content)
+    return total
+
+
+def create_app(settings: FakeGroqSettings) -> FastAPI:
+    app = FastAPI(title="Fake Groq API")
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake-model")
+        tokens = min(settings.completion_tokens, body.get("max_tokens") or settings.completion_tokens)
+        prompt = prompt_tokens(body.get("messages", []))
+        usage = {"prompt_tokens": prompt, "completion_tokens": tokens, "total_tokens": prompt + tokens}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        await asyncio.sleep(settings.first_token_delay())
+        if random.random() < settings.error_rate:
+            return JSONResponse(
+                {"error": {"message": "fake upstream error", "type": "internal_server_error"}},
+                status_code=500
+            )
+
+        words = [WORDS[i % len(WORDS)] for i in range(tokens)]
+
+        if not body.get("stream"):
+            # The whole answer is generated before it is returned
+            await asyncio.sleep(settings.token_delay() * tokens)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            }
+
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for position, word in enumerate(words):
+                if position:
+                    await asyncio.sleep(settings.token_delay())
+                yield chunk({"content": word if position == 0 else " " + word})
+            yield chunk({}, finish_reason="stop", x_groq={"id": completion_id, "usage": usage})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=300, help="time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--tokens-per-second", type=float, default=250, help="0 = answer at once")
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with HTTP 500")
+    args = parser.parse_args()
+
+    import uvicorn
+    settings = FakeGroqSettings(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""
+Load test: latency and throughput of the API at rising concurrency
+
+Starts the real app (index:app under uvicorn) and a fake Groq server
+(benchmarks.fake_groq) as subprocesses, then runs scripted scenarios with
+N concurrent virtual users, each in its own conversation:
+
+    chat     general chat question (POST /chat/)
+    pdf      upload a new multi-page PDF together with a question
+    image    question about an image uploaded during setup
+    history  get_history and get_conversations, alternating
+
+For every scenario and concurrency level it reports p50/p95/p99 latency,
+requests per second, errors and the server's memory (RSS of the app
+process and of its children, i.e. the extraction workers; Linux only).
+
+Results can be saved as a baseline and later runs compared against it;
+a p95 more than --tolerance above the baseline, or a throughput more than
+--tolerance below it, is a regression (exit status 1).
+
+Usage (from backend/):
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --scenarios chat,history --concurrency 1,8,32 --requests 200
+    python -m benchmarks.load_test --save-baseline benchmarks/load_baseline.json
+    python -m benchmarks.load_test --compare benchmarks/load_baseline.json
+    DATABASE_URL=postgresql://... python -m benchmarks.load_test
+
+Without DATABASE_URL the app uses a temporary SQLite file. Client-side rate
+limiting is off unless --rate-limit is given (the real per-model limits
+would make this a test of the limiter). Compare only runs made on the same
+machine with the same settings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timezone
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("chat", "pdf", "image", "history")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_pdf(pages: list[str]) -> bytes:
+    """A minimal text PDF (one Helvetica text block per page)"""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages)
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    for i, page in enumerate(pages):
+        lines = " ".join(f"({line}) Tj T*" for line in page.split("\n"))
+        content = f"BT /F1 10 Tf 40 800 Td 12 TL {lines} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return out
+
+
+def make_report_pdf(number: int, pages: int) -> bytes:
+    """A distinct document per request, so every upload is really extracted"""
+    return make_pdf([
+        "\n".join(
+            f"Report {number} page {page} line {line}: revenue operating costs and headcount for region {line % 7}"
+            for line in range(50)
+        )
+        for page in range(pages)
+    ])
+
+
+def make_png(width: int = 32, height: int = 32) -> bytes:
+    """A small solid-colour RGB PNG"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + b"\x40\x80\xc0" * width for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def process_rss(pid: int) -> int:
+    """Resident memory of a process in bytes (0 if unknown)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def child_pids(pid: int) -> list[int]:
+    children = []
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command may contain spaces; the ppid follows its closing parenthesis
+                ppid = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def memory_usage(pid: int) -> dict:
+    """RSS in MB of the app process and of all its children"""
+    children = child_pids(pid)
+    return {
+        "app_rss_mb": round(process_rss(pid) / 1024 ** 2, 1),
+        "children_rss_mb": round(sum(process_rss(child) for child in children) / 1024 ** 2, 1)
+    }
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Servers:
+    """The fake Groq server and the app, as subprocesses"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="load_test_")
+        self.groq_port = free_port()
+        self.app_port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.app_port}"
+        self.processes = []
+
+    def environment(self) -> dict:
+        env = dict(os.environ)
+        env.setdefault("DATABASE_URL", f"sqlite:///{self.workdir}/load_test.db")
+        env.update({
+            "GROQ_API_KEY": "fake-key",
+            "GROQ_BASE_URL": f"http://127.0.0.1:{self.groq_port}",
+            "GROQ_MAX_RETRIES": "0",
+            "RATE_LIMIT_ENABLED": "true" if self.args.rate_limit else "false",
+            "BLOB_STORE": "local",
+            "BLOB_STORE_DIR": os.path.join(self.workdir, "blobs"),
+            "VECTOR_INDEX_DIR": os.path.join(self.workdir, "vector_indexes"),
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING")
+        })
+        return env
+
+    def start(self):
+        log = open(os.path.join(self.workdir, "servers.log"), "w")
+        self.processes.append(subprocess.Popen(
+            [
+                sys.executable, "-m", "benchmarks.fake_groq",
+                "--port", str(self.groq_port),
+                "--latency-ms", str(self.args.model_latency_ms),
+                "--tokens-per-second", str(self.args.tokens_per_second),
+                "--completion-tokens", str(self.args.completion_tokens)
+            ],
+            cwd=BACKEND_DIR, stdout=log, stderr=subprocess.STDOUT
+        ))
+        self.processes.append(subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "index:app",
+                "--host", "127.0.0.1", "--port", str(self.app_port),
+                "--log-level", "warning", "--no-access-log"
+            ],
+            cwd=BACKEND_DIR, env=self.environment(), stdout=log, stderr=subprocess.STDOUT
+        ))
+        self.wait_ready(f"http://127.0.0.1:{self.groq_port}/docs")
+        self.wait_ready(f"{self.base_url}/")
+
+    def wait_ready(self, url: str, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for process in self.processes:
+                if process.poll() is not None:
+                    raise RuntimeError(f"A server exited during startup, see {self.workdir}/servers.log")
+            try:
+                if httpx.get(url, timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{url} not ready after {timeout:.0f}s, see {self.workdir}/servers.log")
+
+    @property
+    def app_pid(self) -> int:
+        return self.processes[-1].pid
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class LoadTest:
+    """Scenario setup and request scripts against a running app"""
+
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.sessions: dict = {}  # scenario -> one session id per virtual user
+        self.counter = 0
+
+    async def post(self, params: dict = None, data: dict = None, files: dict = None) -> httpx.Response:
+        response = await self.client.post("/chat/", params=params, data=data, files=files)
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        return response
+
+    async def new_session(self) -> str:
+        response = await self.post(params={"action": "get_context"})
+        return response.json()["session_id"]
+
+    async def setup(self, scenario: str, users: int):
+        """Give every virtual user a conversation prepared for the scenario"""
+        sessions = self.sessions.setdefault(scenario, [])
+        semaphore = asyncio.Semaphore(16)
+
+        async def prepare() -> str:
+            async with semaphore:
+                session_id = await self.new_session()
+                if scenario == "image":
+                    await self.post(params={"session_id": session_id}, files={"file": ("photo.png", make_png(), "image/png")})
+                elif scenario == "history":
+                    for turn in range(self.args.history_turns):
+                        await self.post(params={"session_id": session_id}, data={"message": f"Seed question {turn}"})
+                return session_id
+
+        missing = users - len(sessions)
+        if missing > 0:
+            sessions.extend(await asyncio.gather(*(prepare() for _ in range(missing))))
+
+    async def request(self, scenario: str, user: int):
+        self.counter += 1
+        number = self.counter
+        session_id = self.sessions[scenario][user]
+        params = {"session_id": session_id}
+
+        if scenario == "chat":
+            await self.post(params=params, data={"message": f"Question {number}: what should I check before a deploy?"})
+        elif scenario == "pdf":
+            await self.post(
+                params=params,
+                data={"message": f"Summarize the costs in report {number}"},
+                files={"file": (f"report-{number}.pdf", make_report_pdf(number, self.args.pdf_pages), "application/pdf")}
+            )
+        elif scenario == "image":
+            await self.post(params=params, data={"message": f"Describe the image ({number})"})
+        elif scenario == "history":
+            if number % 2:
+                await self.post(params={**params, "action": "get_history", "limit": 50})
+            else:
+                await self.post(params={"action": "get_conversations", "limit": 20})
+
+    async def run_level(self, scenario: str, concurrency: int, requests: int) -> dict:
+        """Closed loop: `concurrency` users send `requests` requests in total"""
+        await self.setup(scenario, concurrency)
+        latencies = []
+        errors = []
+        remaining = iter(range(requests))
+
+        async def user(index: int):
+            for _ in remaining:
+                start = time.perf_counter()
+                try:
+                    await self.request(scenario, index)
+                except (RuntimeError, httpx.HTTPError) as e:
+                    errors.append(str(e) or type(e).__name__)
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(index) for index in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            "requests": requests,
+            "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+            "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0
+        }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions of results against a saved baseline"""
+    regressions = []
+    for scenario, levels in results.items():
+        for level, result in levels.items():
+            before = baseline.get("results", {}).get(scenario, {}).get(level)
+            if not before:
+                continue
+            if before["p95_ms"] and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{scenario} @ {level}: p95 {result['p95_ms']:.1f} ms vs {before['p95_ms']:.1f} ms"
+                )
+            if before["rps"] and result["rps"] < before["rps"] * (1 - tolerance):
+                regressions.append(
+                    f"{scenario} @ {level}: {result['rps']:.1f} req/s vs {before['rps']:.1f} req/s"
+                )
+            if result["errors"] > before["errors"]:
+                regressions.append(f"{scenario} @ {level}: {result['errors']} errors vs {before['errors']}")
+    return regressions
+
+
+async def run_scenarios(servers: Servers, args) -> dict:
+    results = {}
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 8)
+    async with httpx.AsyncClient(base_url=servers.base_url, timeout=args.timeout, limits=limits) as client:
+        load_test = LoadTest(client, args)
+        for scenario in args.scenarios:
+            print(f"\n{scenario}")
+            print(f"{'users':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'app MB':>9}{'workers MB':>12}")
+            results[scenario] = {}
+
+            # Warm-up: pools, caches, first extraction worker spawn
+            await load_test.run_level(scenario, 1, args.warmup)
+            for concurrency in args.concurrency:
+                requests = max(args.requests, concurrency * 2)
+                result = await load_test.run_level(scenario, concurrency, requests)
+                result.update(memory_usage(servers.app_pid))
+                results[scenario][str(concurrency)] = result
+                print(f"{concurrency:>6}{result['rps']:>9.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+                      f"{result['p99_ms']:>9.1f}{result['errors']:>8}{result['app_rss_mb']:>9.1f}"
+                      f"{result['children_rss_mb']:>12.1f}")
+                if result["first_error"]:
+                    print(f"      first error: {result['first_error']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,4,16,32", help="comma-separated virtual user counts")
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level (at least 2 per user)")
+    parser.add_argument("--warmup", type=int, default=5, help="requests per scenario before measuring")
+    parser.add_argument("--model-latency-ms", type=float, default=300, help="fake model time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=250, help="fake model output rate")
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--pdf-pages", type=int, default=5)
+    parser.add_argument("--history-turns", type=int, default=10, help="turns seeded per history conversation")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds per request")
+    parser.add_argument("--rate-limit", action="store_true", help="keep client-side rate limiting on")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95/throughput change")
+    args = parser.parse_args()
+
+    args.scenarios = [scenario.strip() for scenario in args.scenarios.split(",") if scenario.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+
+    servers = Servers(args)
+    database = os.getenv("DATABASE_URL", "sqlite (temporary)").split(":", 1)[0]
+    print(f"📊 Load test: {database}, fake model {args.model_latency_ms:.0f} ms + "
+          f"{args.completion_tokens} tokens at {args.tokens_per_second:.0f}/s, concurrency {args.concurrency}")
+    try:
+        servers.start()
+        results = asyncio.run(run_scenarios(servers, args))
+    finally:
+        servers.stop()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "database": database,
+            "model_latency_ms": args.model_latency_ms,
+            "tokens_per_second": args.tokens_per_second,
+            "completion_tokens": args.completion_tokens,
+            "pdf_pages": args.pdf_pages,
+            "rate_limit": args.rate_limit
+        },
+        "results": results
+    }
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        print(f"\n💾 Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        changed = [
+            key for key in ("database", "model_latency_ms", "tokens_per_second", "completion_tokens", "pdf_pages", "rate_limit")
+            if baseline.get("meta", {}).get(key) != report["meta"][key]
+        ]
+        if changed:
+            print(f"\n⚠️ Settings differ from the baseline ({', '.join(changed)}) - numbers are not comparable")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.compare}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regression against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,51 @@
 from fastapi import UploadFile, HTTPException, Depends
-from sqlalchemy.orm import Session
-import io
-import PyPDF2
-import base64
-from lib.Database_config import get_db, DB_ENABLED
-from lib.Groq_config import get_groq_client
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import json
+import logging
+import os
+import time
+from lib.Database_config import get_db, DB_ENABLED, SessionLocal, AsyncSessionLocal
+from lib.Groq_config import get_llm_client
 from lib.Groq_models_config import ModelConfig
+from utils.extraction_pool import extraction_pool, ExtractionQueueFull, ExtractionTimeout
+from utils.text_extractor import parse_word_bytes
+from utils.pdf_extraction import iter_pdf_pages
+from utils.chunker import chunk_text, achunk_pages
+from utils.vector_index import embedder, vector_indexes
+from utils.response_cache import response_cache, make_cache_key
+from utils.blob_store import blob_store
+from utils.conversation_memory import conversation_memory
+from utils.ingestion_queue import (
+    ingestion_queue, IngestionJob, IngestionQueueFull, INGESTION_ASYNC, INGESTION_WAIT_SECONDS, INDEXING
+)
+from utils.metrics import LLM_LATENCY, LLM_TOKENS, STAGE_LATENCY, timed_iter
+from utils.model_router import model_router, ModelUnavailable, MODEL_DEADLINE_SECONDS, MODEL_FIRST_TOKEN_SECONDS
+from utils.rate_limiter import (
+    rate_limiter, estimate_request_tokens, retry_after_header, RateLimited, AdmissionQueueFull,
+    PRIORITY_INTERACTIVE, PRIORITY_BATCH, PRIORITY_BACKGROUND, RATE_LIMIT_MAX_WAIT
+)
 import re
 
 from typing import Optional
 
-# Conditional imports
+logger = logging.getLogger(__name__)
+
+# Batch questions: size of one batch, and completions in flight per batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+# Batch questions may wait this long for rate-limit capacity (not interactive)
+BATCH_DEADLINE_SECONDS = float(os.getenv("BATCH_DEADLINE_SECONDS", "120"))
+
+from models.database_models import FileType
+
+# Same helper interface either way: database tables or the bounded in-memory store
 if DB_ENABLED:
-    from models.database_models import MessageRole, FileType
-    from utils.database_utils import ConversationDB, MessageDB, FileDB, ContextDB
+    from utils.database_utils import ConversationDB, MessageDB, FileDB, ContextDB, DocumentDB
 else:
-    # Fallback to in-memory storage
-    from utils.rag_store import VECTOR_STORE
+    from utils.memory_store import ConversationDB, MessageDB, FileDB, ContextDB, DocumentDB
 
 
 class ChatBot:
@@ -47,72 +76,604 @@ class ChatBot:
             return FileType.UNKNOWN
 
     @staticmethod
-    async def extract_text_from_pdf(content: bytes) -> str:
-        """Extract text from PDF"""
-        pdf_file = io.BytesIO(content)
-        reader = PyPDF2.PdfReader(pdf_file)
-        
-        if len(reader.pages) == 0:
-            raise ValueError("PDF has no pages")
-        
-        text = ""
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        
-        if not text.strip():
-            raise ValueError("No text could be extracted from PDF")
-        
-        return text
+    async def run_extraction(parser, content: bytes) -> str:
+        """Run a parser from utils.text_extractor in the extraction process pool"""
+        try:
+            return await extraction_pool.run(parser, content)
+        except ExtractionQueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ExtractionTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
+
+    @staticmethod
+    async def stream_pdf_pages(content: bytes):
+        """Yield the text of each PDF page in order, extracted by page ranges in parallel"""
+        try:
+            async for page in iter_pdf_pages(content):
+                yield page
+        except ExtractionQueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ExtractionTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
 
     @staticmethod
     async def extract_text_from_word(content: bytes) -> str:
-        """Extract text from Word document"""
+        """Extract text from Word document (in a worker process)"""
+        return await ChatBot.run_extraction(parse_word_bytes, content)
+
+    @staticmethod
+    async def lookup_cache(task_type: str, messages: list, use_cache: bool) -> tuple[str, Optional[tuple]]:
+        """Return (cache_key, (answer, model) or None) for a completion request"""
+        cache_key = make_cache_key(ModelConfig.get_model_for_task(task_type), messages)
+        if not use_cache:
+            response_cache.record_bypass()
+            return cache_key, None
+        
+        cached = await response_cache.get(cache_key)
+        if cached:
+            logger.info("Cache hit", extra={"task_type": task_type})
+        return cache_key, cached
+
+    @staticmethod
+    def admission_error(error) -> HTTPException:
+        """429 (rate limited) or 503 (admission queue full), with Retry-After"""
+        return HTTPException(
+            status_code=429 if isinstance(error, RateLimited) else 503,
+            detail=f"AI busy. {str(error)}",
+            headers=retry_after_header(error.retry_after)
+        )
+
+    @staticmethod
+    def note_provider_rate_limit(model: str, error: BaseException):
+        """On a provider 429, stop sending to the model for its Retry-After"""
+        if getattr(error, "status_code", None) != 429:
+            return
+        response = getattr(error, "response", None)
         try:
-            import docx
-            doc_file = io.BytesIO(content)
-            doc = docx.Document(doc_file)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            
-            if not text.strip():
-                raise ValueError("No text found in Word document")
-            
-            return text
-        except ImportError:
-            raise ValueError("python-docx not installed. Run: pip install python-docx")
+            retry_after = float(response.headers.get("retry-after", 1))
+        except (AttributeError, TypeError, ValueError):
+            retry_after = 1.0
+        rate_limiter.pause(model, retry_after)
 
     @staticmethod
-    async def call_ai_with_fallback(client, task_type: str, messages: list) -> tuple[str, str]:
-        """Call AI with automatic fallback"""
+    async def call_ai_with_fallback(
+        client,
+        task_type: str,
+        messages: list,
+        use_cache: bool = True,
+        priority: int = PRIORITY_INTERACTIVE,
+        deadline: float = MODEL_DEADLINE_SECONDS,
+        max_wait: float = RATE_LIMIT_MAX_WAIT
+    ) -> tuple[str, str, bool]:
+        """
+        Call AI with automatic fallback (client is the shared AsyncGroq)
+        
+        Returns (answer, model_used, cached). Identical requests are served
+        from the response cache unless use_cache is False. Routing - open
+        circuits, the deadline and hedging to the fallback - is done by
+        utils.model_router; each model call first waits for rate-limit
+        capacity (utils.rate_limiter) in priority order, for at most
+        max_wait seconds and within the deadline.
+        """
         config = ModelConfig.get_model_for_task(task_type)
         
-        try:
-            print(f"🤖 Using {config['model']} for {task_type}")
-            response = client.chat.completions.create(
-                model=config['model'],
-                messages=messages,
-                **config['settings']
-            )
-            return response.choices[0].message.content, config['model']
+        cache_key, cached = await ChatBot.lookup_cache(task_type, messages, use_cache)
+        if cached:
+            return cached[0], cached[1], True
         
-        except Exception as e:
-            print(f"⚠️ Primary model failed: {e}")
-            print(f"🔄 Trying fallback: {config['fallback']}")
-            
+        cost = estimate_request_tokens(messages, config['settings'].get('max_tokens', 0))
+        
+        async def admit(model: str, remaining: float):
+            await rate_limiter.acquire(model, cost, priority, min(remaining, max_wait))
+        
+        async def call(model: str) -> str:
             try:
-                response = client.chat.completions.create(
-                    model=config['fallback'],
+                response = await client.chat.completions.create(
+                    model=model,
                     messages=messages,
                     **config['settings']
                 )
-                return response.choices[0].message.content, config['fallback']
+            except BaseException as e:
+                # Failed, timed out or cancelled (hedge loser): nothing was used
+                rate_limiter.settle(model, cost, 0)
+                ChatBot.note_provider_rate_limit(model, e)
+                raise
+            usage = getattr(response, "usage", None)
+            rate_limiter.settle(model, cost, getattr(usage, "total_tokens", None))
+            if usage is not None:
+                LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model, direction="in")
+                LLM_TOKENS.inc(usage.completion_tokens or 0, model=model, direction="out")
+            return response.choices[0].message.content
+        
+        try:
+            answer, model_used = await model_router.complete(
+                call, [config['model'], config['fallback']], deadline=deadline, admit=admit
+            )
+        except (RateLimited, AdmissionQueueFull) as e:
+            raise ChatBot.admission_error(e)
+        except ModelUnavailable as e:
+            raise HTTPException(
+                status_code=504 if e.timed_out else 500,
+                detail=f"AI failed. {str(e)}"
+            )
+        
+        await response_cache.put(cache_key, answer, model_used)
+        return answer, model_used, False
+
+    @staticmethod
+    async def stream_ai_with_fallback(client, task_type: str, messages: list):
+        """
+        Stream AI tokens with automatic fallback
+        
+        Yields (token, model) tuples. The fallback model is only tried when the
+        primary fails before producing its first token - once tokens have been
+        relayed to the client we can't switch models mid-answer. Models with
+        an open circuit are skipped, and a model that sends no token within
+        MODEL_FIRST_TOKEN_SECONDS, or ends its stream without content,
+        counts as failed.
+        
+        Token usage is estimated (one token per streamed delta) and settled
+        with the rate limiter once the stream ends; an attempt that fails
+        before its first token gives its whole reservation back.
+        """
+        config = ModelConfig.get_model_for_task(task_type)
+        max_tokens = config['settings'].get('max_tokens', 0)
+        cost = estimate_request_tokens(messages, max_tokens)
+        errors = []
+        refused = None
+        
+        for model in model_router.candidates([config['model'], config['fallback']]):
+            started = False
+            role = "primary" if model == config['model'] else "fallback"
+            try:
+                await rate_limiter.acquire(
+                    model, cost, PRIORITY_INTERACTIVE, min(RATE_LIMIT_MAX_WAIT, MODEL_FIRST_TOKEN_SECONDS)
+                )
+            except (RateLimited, AdmissionQueueFull) as e:
+                logger.warning("Model refused by rate limiter", extra={"model": model, "error": str(e)})
+                refused = e
+                errors.append(f"{model}: {str(e)}")
+                continue
+            model_router.acquire(model)
+            start = time.monotonic()
+            first_token_by = start + MODEL_FIRST_TOKEN_SECONDS
+            streamed = 0
+            settled = False
+            try:
+                logger.info("Streaming model", extra={"model": model, "role": role, "task_type": task_type})
+                stream = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        stream=True,
+                        **config['settings']
+                    ),
+                    timeout=MODEL_FIRST_TOKEN_SECONDS
+                )
+                try:
+                    chunks = stream.__aiter__()
+                    while True:
+                        try:
+                            if started:
+                                chunk = await chunks.__anext__()
+                            else:
+                                chunk = await asyncio.wait_for(
+                                    chunks.__anext__(),
+                                    timeout=max(first_token_by - time.monotonic(), 0.001)
+                                )
+                        except StopAsyncIteration:
+                            break
+                        if not chunk.choices:
+                            continue
+                        token = chunk.choices[0].delta.content
+                        if token:
+                            if not started:
+                                started = True
+                                model_router.record(model, None, ok=True)
+                                LLM_LATENCY.observe(time.monotonic() - start, model=model, role=role, outcome="ok")
+                            streamed += 1
+                            yield token, model
+                finally:
+                    # Release the pooled connection even if the client went away
+                    await stream.close()
+                    LLM_TOKENS.inc(cost - max_tokens, model=model, direction="in")
+                    LLM_TOKENS.inc(streamed, model=model, direction="out")
+                    rate_limiter.settle(model, cost, (cost - max_tokens) + streamed if started else 0)
+                    settled = True
+                if not started:
+                    # Handled below like any failure before the first token
+                    raise RuntimeError("empty response")
+                return
             
-            except Exception as fallback_error:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"AI failed. Primary: {str(e)}, Fallback: {str(fallback_error)}"
+            except (asyncio.CancelledError, GeneratorExit):
+                if not started:
+                    model_router.release(model)
+                    if not settled:
+                        rate_limiter.settle(model, cost, 0)
+                raise
+            except Exception as e:
+                if started:
+                    raise
+                if not settled:
+                    rate_limiter.settle(model, cost, 0)
+                kind = "no first token in time" if isinstance(e, asyncio.TimeoutError) else str(e)
+                ChatBot.note_provider_rate_limit(model, e)
+                model_router.record(model, None, ok=False)
+                LLM_LATENCY.observe(
+                    time.monotonic() - start, model=model, role=role,
+                    outcome="timeout" if isinstance(e, asyncio.TimeoutError) else "error"
                 )
+                logger.warning("Model failed before first token", extra={"model": model, "error": kind})
+                errors.append(f"{model}: {kind}")
+        
+        if refused is not None:
+            raise ChatBot.admission_error(refused)
+        raise HTTPException(
+            status_code=500,
+            detail=f"AI failed. {' | '.join(errors)}"
+        )
+
+    @staticmethod
+    async def ingest_document(db: AsyncSession, file_type: FileType, content: bytes, job: Optional[IngestionJob] = None) -> tuple:
+        """
+        Get the stored document for uploaded bytes (content-addressed)
+        
+        Extraction and chunking only run the first time a given file is
+        seen; later uploads are a SHA-256 lookup. New documents are stored
+        batch by batch while they are extracted (create_document commits
+        each batch). A background job is kept up to date with the pages and
+        chunks processed so far, and with the partially stored document.
+        
+        Returns (document, reused).
+        """
+        content_hash = await asyncio.to_thread(DocumentDB.hash_content, content)
+        async with AsyncSessionLocal() as lookup_db:
+            document = await DocumentDB.get_by_hash(lookup_db, content_hash)
+        if document is not None:
+            logger.info("Reusing extracted document", extra={"content_hash": content_hash[:12]})
+            return document, True
+        
+        # Chunks are produced lazily and consumed by create_document; only
+        # the chunker's share of the interleaved insert is timed as "chunk"
+        offsets = None
+        if file_type == FileType.PDF:
+            # Pages are chunked and stored while later ones are still being
+            # extracted; only where each page starts in the text is kept
+            offsets = []
+            end = 0
+            
+            async def collected_pages():
+                nonlocal end
+                async for page in ChatBot.stream_pdf_pages(content):
+                    offsets.append(end)
+                    end += len(page) + 1
+                    if job is not None:
+                        job.page_done()
+                    yield page
+            
+            chunks = achunk_pages(
+                collected_pages(), on_done=lambda seconds: STAGE_LATENCY.observe(seconds, stage="chunk")
+            )
+        elif file_type == FileType.TEXT:
+            text = content.decode('utf-8')
+            chunks = timed_iter(chunk_text(text), "chunk")
+        else:
+            text = await ChatBot.extract_text_from_word(content)
+            chunks = timed_iter(chunk_text(text), "chunk")
+        if job is not None:
+            chunks = job.track(chunks)
+        
+        document, created = await DocumentDB.create_document(
+            db, content_hash, file_type, len(content), chunks,
+            offsets=offsets, on_staged=job.staged if job is not None else None
+        )
+        return document, not created
+
+    @staticmethod
+    def build_document_vector_index(document_id: int, chunks_count: int):
+        """Embed a document's stored chunks batch by batch (runs in a thread)"""
+        source = DocumentDB.source(document_id, chunks_count)
+        db = SessionLocal()
+        try:
+            vector_indexes.build(source.key, DocumentDB.iter_chunk_batches(db, document_id), version=source.version)
+        finally:
+            db.close()
+
+    @staticmethod
+    async def index_document_vectors(document_id: int, chunks_count: int, new_document: bool):
+        """
+        Embed a (committed) document once, batch by batch in a thread
+        
+        Every conversation of the document searches this one index. A
+        reused document is only embedded if its vectors are missing here.
+        """
+        if not chunks_count or not embedder.available:
+            return
+        if new_document or not vector_indexes.has(DocumentDB.index_key(document_id)):
+            with STAGE_LATENCY.time(stage="embed"):
+                await asyncio.to_thread(ChatBot.build_document_vector_index, document_id, chunks_count)
+
+    @staticmethod
+    async def embed_query(db: AsyncSession, conversation_id: int, message: str):
+        """Embed a question if the conversation's chunks have a vector index, else None"""
+        vectors = await ChatBot.embed_queries(db, conversation_id, [message])
+        return None if vectors is None else vectors[0]
+
+    @staticmethod
+    async def embed_queries(db: AsyncSession, conversation_id: int, messages: list[str]):
+        """Embed several questions in one batch, or None without a vector index"""
+        if not embedder.available:
+            return None
+        source = await ContextDB.get_source(db, conversation_id)
+        if not vector_indexes.has(source.key):
+            return None
+        
+        return await asyncio.to_thread(embedder.embed, messages)
+
+    @staticmethod
+    async def attach_document(db: AsyncSession, conversation_id: int, filename: str, file_type: FileType, content: bytes, job: Optional[IngestionJob] = None) -> tuple:
+        """
+        Make an uploaded document the conversation's context (one commit, then embedding)
+        
+        Returns (chunks_count, reused).
+        """
+        document, reused = await ChatBot.ingest_document(db, file_type, content, job=job)
+        document_id = document.id
+        chunks_count = await ContextDB.set_document(db, conversation_id, document_id)
+        
+        # Save to database (the file references the shared document)
+        await FileDB.create_file(
+            db, conversation_id, filename, file_type,
+            file_size=len(content), chunks_count=chunks_count, document_id=document_id
+        )
+        
+        # Context reference and file row land in one commit; the
+        # embedding thread reads the committed chunks
+        await db.commit()
+        if job is not None:
+            job.status = INDEXING
+            job.chunks_count = chunks_count
+            job.deduplicated = reused
+        await ChatBot.index_document_vectors(document_id, chunks_count, new_document=not reused)
+        return chunks_count, reused
+
+    @staticmethod
+    async def run_ingestion_job(job: IngestionJob):
+        """Ingest an uploaded document in the background, with a session of its own"""
+        async with AsyncSessionLocal() as db:
+            await ChatBot.attach_document(
+                db, job.conversation_id, job.filename, job.file_type, job.content, job=job
+            )
+
+    @staticmethod
+    def ingestion_status(job_id: str) -> dict:
+        """Progress of a background upload job of this worker"""
+        job = ingestion_queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired ingestion job")
+        return job.snapshot()
+
+    @staticmethod
+    async def process_file(db: AsyncSession, conversation, file: UploadFile, message: str | None = None) -> Optional[dict]:
+        """
+        Store an uploaded file and its chunks for a conversation
+        
+        Images are stored at once. Documents are ingested by a background
+        job (INGESTION_ASYNC) - the upload response carries its job_id and
+        questions wait for it briefly in build_ai_request - or inline in
+        one commit.
+        
+        Returns the upload response when there is no message to answer,
+        otherwise None so the caller can continue with the question.
+        """
+        content = await file.read()
+        if not content:
+            raise HTTPException(status_code=400, detail="Empty file")
+        
+        file_type = ChatBot.get_file_type(file.filename)
+        logger.info("File received", extra={"file_name": file.filename, "file_type": file_type.value, "size_bytes": len(content)})
+        
+        conversation_id = conversation.id
+        session_id = conversation.session_id
+        
+        # Process based on file type
+        if file_type == FileType.IMAGE:
+            ext = file.filename.lower().split('.')[-1]
+            media_type = {
+                'jpg': 'image/jpeg', 'jpeg': 'image/jpeg',
+                'png': 'image/png', 'webp': 'image/webp',
+                'gif': 'image/gif', 'bmp': 'image/bmp'
+            }.get(ext, 'image/jpeg')
+            
+            # Raw bytes go to the blob store; the DB keeps only the reference
+            blob_ref = await asyncio.to_thread(blob_store.put, content, media_type)
+            await FileDB.create_file(
+                db, conversation_id, file.filename, file_type,
+                file_size=len(content), is_image=True,
+                blob_ref=blob_ref, media_type=media_type,
+                cloudinary_url=blob_ref if blob_store.is_remote(blob_ref) else None
+            )
+            await db.commit()
+            
+            if not message:
+                return {
+                    "status": "success",
+                    "session_id": session_id,
+                    "message": f"Image '{file.filename}' uploaded!",
+                    "size_bytes": len(content)
+                }
+        
+        elif file_type in (FileType.PDF, FileType.TEXT, FileType.WORD):
+            label = {
+                FileType.PDF: "PDF",
+                FileType.TEXT: "Text file",
+                FileType.WORD: "Word document"
+            }[file_type]
+            
+            if INGESTION_ASYNC:
+                # A new conversation must exist before the job's session uses it
+                await db.commit()
+                try:
+                    job = ingestion_queue.submit(
+                        IngestionJob(conversation_id, session_id, file.filename, file_type, content),
+                        ChatBot.run_ingestion_job
+                    )
+                except IngestionQueueFull as e:
+                    raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+                
+                if not message:
+                    return {
+                        "status": "processing",
+                        "session_id": session_id,
+                        "message": f"{label} '{file.filename}' received, processing",
+                        "job_id": job.id,
+                        "ingestion": job.snapshot()
+                    }
+                return None
+            
+            chunks_count, reused = await ChatBot.attach_document(
+                db, conversation_id, file.filename, file_type, content
+            )
+            
+            if not message:
+                return {
+                    "status": "success",
+                    "session_id": session_id,
+                    "message": f"{label} '{file.filename}' uploaded!",
+                    "chunks_count": chunks_count,
+                    "deduplicated": reused
+                }
+        
+        return None
+
+    @staticmethod
+    async def build_ai_request(db: AsyncSession, conversation, message: str) -> dict:
+        """
+        Pick the task and build the model messages for a question
+        
+        Returns a dict with task_type, messages, mode and source
+        (source is None for general chat). While the conversation's upload
+        is still being ingested, the question waits for it up to
+        INGESTION_WAIT_SECONDS, then is answered from the chunks stored so
+        far (the request then also carries the job's status in "ingestion").
+        """
+        job = ingestion_queue.active(conversation.id)
+        if job is not None:
+            with STAGE_LATENCY.time(stage="ingest_wait"):
+                await job.wait(INGESTION_WAIT_SECONDS)
+            # Indexing: the chunks are committed, only the vectors are missing
+            if not job.done and job.status != INDEXING:
+                chunks = []
+                if job.document_id is not None:
+                    chunks = await DocumentDB.get_chunks_by_index(db, job.document_id, job.search(message))
+                if chunks:
+                    logger.info("Document analysis (partial)", extra={"conversation_id": conversation.id, "chunks": len(chunks), "job_id": job.id})
+                    return {**ChatBot.document_request(message, chunks, job.filename), "ingestion": job.snapshot()}
+                # Nothing extracted yet: answered from what was there before
+                ai_request = await ChatBot.build_stored_request(db, conversation, message)
+                return {**ai_request, "ingestion": job.snapshot()}
+        
+        return await ChatBot.build_stored_request(db, conversation, message)
+
+    @staticmethod
+    async def build_stored_request(db: AsyncSession, conversation, message: str) -> dict:
+        """build_ai_request from the conversation's stored file, chunks and memory"""
+        with STAGE_LATENCY.time(stage="latest_file"):
+            latest_file = await FileDB.get_latest_file(db, conversation.id)
+        
+        # IMAGE ANALYSIS (no retrieval: the chunks would not be used)
+        if latest_file and latest_file.is_image:
+            logger.info("Image analysis", extra={"conversation_id": conversation.id, "file_name": latest_file.filename})
+            image_url = await ChatBot.load_image_url(db, latest_file)
+            return ChatBot.image_request(message, image_url, latest_file.filename)
+        
+        # The chunks most relevant to the question
+        with STAGE_LATENCY.time(stage="retrieve"):
+            query_vector = await ChatBot.embed_query(db, conversation.id, message)
+            chunks = await ContextDB.search_chunks(db, conversation.id, message, query_vector=query_vector)
+        
+        # DOCUMENT ANALYSIS
+        if chunks:
+            logger.info("Document analysis", extra={"conversation_id": conversation.id, "chunks": len(chunks)})
+            return ChatBot.document_request(message, chunks, latest_file.filename if latest_file else "document")
+        
+        # GENERAL CHAT (with the conversation's summary and recent turns)
+        else:
+            logger.info("General chat", extra={"conversation_id": conversation.id})
+            with STAGE_LATENCY.time(stage="memory"):
+                memory = await conversation_memory.load(db, conversation)
+            
+            return {
+                "task_type": "chat",
+                "mode": "general_chat",
+                "source": None,
+                "messages": conversation_memory.build_messages(
+                    "You are a helpful AI assistant.", memory, message
+                ),
+                "refresh_memory": memory.needs_refresh
+            }
+
+    @staticmethod
+    async def load_image_url(db: AsyncSession, image_file) -> str:
+        """URL of an uploaded image for a vision request (bytes are only loaded here)"""
+        if image_file.blob_ref:
+            return await asyncio.to_thread(
+                blob_store.image_url, image_file.blob_ref, image_file.media_type
+            )
+        image_base64 = await FileDB.get_legacy_image(db, image_file.id)
+        return f"data:{image_file.media_type};base64,{image_base64}"
+
+    @staticmethod
+    def image_request(message: str, image_url: str, source: str) -> dict:
+        """AI request for a question about an image"""
+        return {
+            "task_type": "vision",
+            "mode": "image_analysis",
+            "source": source,
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": message},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url
+                        }
+                    }
+                ]
+            }]
+        }
+
+    @staticmethod
+    def document_request(message: str, chunks: list, source: str) -> dict:
+        """AI request for a question answered from document chunks"""
+        context = "\n\n".join(chunks)
+        return {
+            "task_type": "document",
+            "mode": "document_analysis",
+            "source": source,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "Answer based on document context. Be accurate."
+                },
+                {
+                    "role": "user",
+                    "content": f"""Document Context:\n{context}\n\nQuestion: {message}"""
+                }
+            ]
+        }
+
+    @staticmethod
+    def refresh_memory_later(client, conversation_id: int):
+        """Fold turns that left the memory window into the summary, after the response"""
+        async def summarize(messages: list) -> str:
+            answer, _, _ = await ChatBot.call_ai_with_fallback(
+                client, "summary", messages, priority=PRIORITY_BACKGROUND
+            )
+            return answer
+        
+        conversation_memory.schedule_refresh(conversation_id, summarize)
 
     @staticmethod
     async def handle_request(
@@ -120,7 +681,13 @@ class ChatBot:
         message: str | None = None,
         action: str | None = None,
         session_id: str | None = None,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db),
+        client=Depends(get_llm_client),
+        use_cache: bool = True,
+        cursor: str | None = None,
+        limit: int = 50,
+        before: int | None = None,
+        after: int | None = None
     ):
         """
         🎯 UNIFIED HANDLER with Database Persistence
@@ -131,17 +698,48 @@ class ChatBot:
             action: Optional action command
             session_id: Optional conversation session ID
             db: Database session (injected by FastAPI)
+            client: Shared async Groq client (injected by FastAPI)
+            use_cache: Serve identical requests from the response cache
+            cursor: Pagination cursor returned by the previous page
+            limit: Page size for listings
+            before: History page of messages older than this message id
+            after: History page of messages newer than this message id
         """
         
         try:
+            # Listing does not need (or create) a conversation
+            if action == "get_conversations":
+                try:
+                    conversations, next_cursor = await ConversationDB.list_conversations(db, limit=limit, cursor=cursor)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                return {
+                    "status": "success",
+                    "conversations": [
+                        {
+                            "session_id": conv["session_id"],
+                            "title": conv["title"],
+                            "created_at": str(conv["created_at"]),
+                            "updated_at": str(conv["updated_at"]),
+                            "message_count": conv["message_count"]
+                        }
+                        for conv in conversations
+                    ],
+                    "next_cursor": next_cursor
+                }
+            
             # Get or create conversation
-            conversation = ConversationDB.get_or_create_conversation(db, session_id)
+            conversation = await ConversationDB.get_or_create_conversation(db, session_id)
+            if action and conversation.session_id != session_id:
+                # A new session is only worth returning if it exists
+                await db.commit()
             
             # ═══════════════════════════════════════════════════
             # 🛠️ HANDLE SPECIAL ACTIONS
             # ═══════════════════════════════════════════════════
             if action == "clear_context":
-                ContextDB.clear_chunks(db, conversation.id)
+                await ContextDB.clear_chunks(db, conversation.id)
+                await db.commit()
                 return {
                     "status": "success",
                     "action": "context_cleared",
@@ -150,21 +748,25 @@ class ChatBot:
                 }
             
             elif action == "get_context":
-                chunks = ContextDB.get_chunks(db, conversation.id)
-                latest_file = FileDB.get_latest_file(db, conversation.id)
+                chunks_count, _ = await ContextDB.get_chunks_version(db, conversation.id)
+                latest_file = await FileDB.get_latest_file(db, conversation.id)
+                job = ingestion_queue.latest(conversation.id)
                 
-                if not chunks and not latest_file:
-                    return {
-                        "status": "empty",
+                if not chunks_count and not latest_file:
+                    response = {
+                        "status": "processing" if job and not job.done else "empty",
                         "session_id": conversation.session_id,
                         "has_context": False
                     }
+                    if job:
+                        response["ingestion"] = job.snapshot()
+                    return response
                 
                 response = {
                     "status": "active",
                     "session_id": conversation.session_id,
                     "has_context": True,
-                    "chunks_count": len(chunks)
+                    "chunks_count": chunks_count
                 }
                 
                 if latest_file:
@@ -173,243 +775,69 @@ class ChatBot:
                         "type": latest_file.file_type.value,
                         "size": latest_file.file_size
                     }
+                if job:
+                    response["ingestion"] = job.snapshot()
                 
                 return response
             
             elif action == "get_history":
-                messages = MessageDB.get_conversation_messages(db, conversation.id)
+                messages, has_more = await MessageDB.get_history_page(
+                    db, conversation.id, limit=limit, before_id=before, after_id=after
+                )
                 return {
                     "status": "success",
                     "session_id": conversation.session_id,
-                    "messages": [
-                        {
-                            "role": msg.role.value,
-                            "content": msg.content,
-                            "model": msg.model_used,
-                            "created_at": str(msg.created_at)
-                        }
-                        for msg in messages
-                    ]
+                    "messages": [ChatBot.format_history_message(msg) for msg in messages],
+                    "has_more": has_more
                 }
             
-            elif action == "get_conversations":
-                conversations = ConversationDB.get_all_conversations(db)
-                return {
-                    "status": "success",
-                    "conversations": [
-                        {
-                            "session_id": conv.session_id,
-                            "title": conv.title,
-                            "created_at": str(conv.created_at),
-                            "message_count": len(conv.messages)
-                        }
-                        for conv in conversations
-                    ]
-                }
-
             # ═══════════════════════════════════════════════════
             # 📁 HANDLE FILE UPLOAD
             # ═══════════════════════════════════════════════════
             if file:
-                content = await file.read()
-                if not content:
-                    raise HTTPException(status_code=400, detail="Empty file")
-                
-                file_type = ChatBot.get_file_type(file.filename)
-                print(f"📁 File: {file.filename} (type: {file_type.value})")
-                
-                # Process based on file type
-                if file_type == FileType.PDF:
-                    text = await ChatBot.extract_text_from_pdf(content)
-                    chunks = [text[i:i+500] for i in range(0, len(text), 500)]
-                    
-                    # Save to database
-                    FileDB.create_file(
-                        db, conversation.id, file.filename, file_type,
-                        file_size=len(content), text_content=text, chunks_count=len(chunks)
-                    )
-                    ContextDB.save_chunks(db, conversation.id, chunks)
-                    
-                    if not message:
-                        return {
-                            "status": "success",
-                            "session_id": conversation.session_id,
-                            "message": f"PDF '{file.filename}' uploaded!",
-                            "chunks_count": len(chunks)
-                        }
-                
-                elif file_type == FileType.IMAGE:
-                    base64_image = base64.b64encode(content).decode('utf-8')
-                    ext = file.filename.lower().split('.')[-1]
-                    media_type = {
-                        'jpg': 'image/jpeg', 'jpeg': 'image/jpeg',
-                        'png': 'image/png', 'webp': 'image/webp',
-                        'gif': 'image/gif', 'bmp': 'image/bmp'
-                    }.get(ext, 'image/jpeg')
-                    
-                    # Save to database
-                    FileDB.create_file(
-                        db, conversation.id, file.filename, file_type,
-                        file_size=len(content), is_image=True,
-                        image_base64=base64_image, media_type=media_type
-                    )
-                    
-                    if not message:
-                        return {
-                            "status": "success",
-                            "session_id": conversation.session_id,
-                            "message": f"Image '{file.filename}' uploaded!",
-                            "size_bytes": len(content)
-                        }
-                
-                elif file_type == FileType.TEXT:
-                    text = content.decode('utf-8')
-                    chunks = [text[i:i+500] for i in range(0, len(text), 500)]
-                    
-                    FileDB.create_file(
-                        db, conversation.id, file.filename, file_type,
-                        file_size=len(content), text_content=text, chunks_count=len(chunks)
-                    )
-                    ContextDB.save_chunks(db, conversation.id, chunks)
-                    
-                    if not message:
-                        return {
-                            "status": "success",
-                            "session_id": conversation.session_id,
-                            "message": f"Text file '{file.filename}' uploaded!",
-                            "chunks_count": len(chunks)
-                        }
-                
-                elif file_type == FileType.WORD:
-                    text = await ChatBot.extract_text_from_word(content)
-                    chunks = [text[i:i+500] for i in range(0, len(text), 500)]
-                    
-                    FileDB.create_file(
-                        db, conversation.id, file.filename, file_type,
-                        file_size=len(content), text_content=text, chunks_count=len(chunks)
-                    )
-                    ContextDB.save_chunks(db, conversation.id, chunks)
-                    
-                    if not message:
-                        return {
-                            "status": "success",
-                            "session_id": conversation.session_id,
-                            "message": f"Word document '{file.filename}' uploaded!",
-                            "chunks_count": len(chunks)
-                        }
+                upload_response = await ChatBot.process_file(db, conversation, file, message)
+                if upload_response:
+                    return upload_response
 
             # ═══════════════════════════════════════════════════
             # 💬 HANDLE MESSAGE/QUESTION
             # ═══════════════════════════════════════════════════
             if message:
-                # Save user message
-                MessageDB.create_message(
-                    db, conversation.id, MessageRole.USER, message
-                )
-                
-                client = get_groq_client()
                 if not client:
                     raise HTTPException(status_code=500, detail="Groq API missing")
                 
-                # Get latest file and chunks
-                latest_file = FileDB.get_latest_file(db, conversation.id)
-                chunks = ContextDB.get_chunks(db, conversation.id, limit=3)
+                ai_request = await ChatBot.build_ai_request(db, conversation, message)
                 
-                # IMAGE ANALYSIS
-                if latest_file and latest_file.is_image:
-                    print(f"📸 Analyzing: {latest_file.filename}")
-                    
-                    messages_ai = [{
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": message},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:{latest_file.media_type};base64,{latest_file.image_base64}"
-                                }
-                            }
-                        ]
-                    }]
-                    
-                    answer, model_used = await ChatBot.call_ai_with_fallback(client, "vision", messages_ai)
-                    
-                    # Save assistant response
-                    MessageDB.create_message(
-                        db, conversation.id, MessageRole.ASSISTANT, answer,
-                        model_used=model_used, mode="image_analysis"
-                    )
-                    
-                    return {
-                        "answer": answer,
-                        "session_id": conversation.session_id,
-                        "source": latest_file.filename,
-                        "mode": "image_analysis",
-                        "model_used": model_used
-                    }
+                # End the transaction so the pooled connection is not held
+                # while waiting on the model
+                await db.commit()
                 
-                # DOCUMENT ANALYSIS
-                elif chunks:
-                    context = "\n\n".join(chunks)
-                    print(f"📄 Using chunks from conversation")
-                    
-                    messages_ai = [
-                        {
-                            "role": "system",
-                            "content": "Answer based on document context. Be accurate."
-                        },
-                        {
-                            "role": "user",
-                            "content": f"""Document Context:\n{context}\n\nQuestion: {message}"""
-                        }
-                    ]
-                    
-                    answer, model_used = await ChatBot.call_ai_with_fallback(client, "document", messages_ai)
-                    
-                    MessageDB.create_message(
-                        db, conversation.id, MessageRole.ASSISTANT, answer,
-                        model_used=model_used, mode="document_analysis"
-                    )
-                    
-                    return {
-                        "answer": answer,
-                        "session_id": conversation.session_id,
-                        "source": latest_file.filename if latest_file else "document",
-                        "mode": "document_analysis",
-                        "model_used": model_used
-                    }
+                answer, model_used, cached = await ChatBot.call_ai_with_fallback(
+                    client, ai_request["task_type"], ai_request["messages"], use_cache=use_cache
+                )
                 
-                # GENERAL CHAT
-                else:
-                    print("💬 General chat mode")
-                    
-                    messages_ai = [
-                        {
-                            "role": "system",
-                            "content": "You are a helpful AI assistant."
-                        },
-                        {
-                            "role": "user",
-                            "content": message
-                        }
-                    ]
-                    
-                    
-                    answer, model_used = await ChatBot.call_ai_with_fallback(client, "chat", messages_ai)
-                    
-                    MessageDB.create_message(
-                        db, conversation.id, MessageRole.ASSISTANT, answer,
-                        model_used=model_used, mode="general_chat"
-                    )
-                    
-                    return {
-                        "answer": answer,
-                        "session_id": conversation.session_id,
-                        "mode": "general_chat",
-                        "model_used": model_used
-                    }
+                # Question and answer are written together, in one commit
+                await MessageDB.create_turn(
+                    db, conversation.id, message, answer,
+                    model_used=model_used, mode=ai_request["mode"], cached=cached
+                )
+                await db.commit()
+                if ai_request.get("refresh_memory"):
+                    ChatBot.refresh_memory_later(client, conversation.id)
                 
-
+                response = {
+                    "answer": answer,
+                    "session_id": conversation.session_id,
+                    "mode": ai_request["mode"],
+                    "model_used": model_used,
+                    "cached": cached
+                }
+                if ai_request["source"]:
+                    response["source"] = ai_request["source"]
+                if ai_request.get("ingestion"):
+                    response["ingestion"] = ai_request["ingestion"]
+                
+                return response
 
             raise HTTPException(
                 status_code=400,
@@ -419,7 +847,364 @@ class ChatBot:
         except HTTPException:
             raise
         except Exception as e:
-            print(f"❌ Error: {e}")
-            import traceback
-            traceback.print_exc()
-            raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
\ No newline at end of file
+            logger.exception("Request failed")
+            raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+    @staticmethod
+    def format_history_message(message: dict) -> dict:
+        """JSON shape of one history message"""
+        return {
+            "id": message["id"],
+            "role": message["role"].value,
+            "content": message["content"],
+            "model": message["model_used"],
+            "created_at": str(message["created_at"])
+        }
+
+    @staticmethod
+    async def export_history(session_id: str, db: AsyncSession = Depends(get_db)):
+        """
+        📤 Stream a conversation's full history as NDJSON (one message per line)
+        
+        Rows are read in batches with their own session while the response
+        is written, so memory stays flat for any conversation length.
+        """
+        conversation = await ConversationDB.get_conversation(db, session_id)
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        conversation_id = conversation.id
+        
+        async def lines():
+            # The request's session is closed once the response starts
+            async with AsyncSessionLocal() as export_db:
+                async for message in MessageDB.iter_history(export_db, conversation_id):
+                    yield json.dumps(ChatBot.format_history_message(message), ensure_ascii=False) + "\n"
+        
+        return StreamingResponse(
+            lines(),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="conversation-{session_id}.ndjson"'}
+        )
+
+    @staticmethod
+    def format_stream_event(event: dict, stream_format: str) -> str:
+        """Encode one stream event as an SSE frame or an NDJSON line"""
+        payload = json.dumps(event, ensure_ascii=False)
+        if stream_format == "sse":
+            return f"event: {event['type']}\ndata: {payload}\n\n"
+        return payload + "\n"
+
+    @staticmethod
+    async def handle_stream_request(
+        file: UploadFile | None = None,
+        message: str | None = None,
+        session_id: str | None = None,
+        stream_format: str = "ndjson",
+        db: AsyncSession = Depends(get_db),
+        client=Depends(get_llm_client),
+        use_cache: bool = True
+    ):
+        """
+        ⚡ STREAMING HANDLER - relays answer tokens as they arrive
+        
+        Events (NDJSON lines or SSE frames):
+            start: session_id, mode, model, source
+            token: content
+            done:  full answer, model_used and cached (after the Message is saved)
+            error: detail, if the model fails mid-answer
+        
+        The first token is fetched before the response starts, so a failure
+        of both models still comes back as a normal HTTP error. A cached
+        answer is sent as a single token.
+        """
+        if stream_format not in ("ndjson", "sse"):
+            raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+        
+        try:
+            conversation = await ConversationDB.get_or_create_conversation(db, session_id)
+            
+            if file:
+                upload_response = await ChatBot.process_file(db, conversation, file, message)
+                if upload_response:
+                    return upload_response
+            
+            if not message:
+                raise HTTPException(status_code=400, detail="Provide a message to stream an answer")
+            
+            if not client:
+                raise HTTPException(status_code=500, detail="Groq API missing")
+            
+            ai_request = await ChatBot.build_ai_request(db, conversation, message)
+            await db.commit()
+            cache_key, cached = await ChatBot.lookup_cache(
+                ai_request["task_type"], ai_request["messages"], use_cache
+            )
+            if cached:
+                first_token, model_used = cached
+                tokens = None
+            else:
+                tokens = ChatBot.stream_ai_with_fallback(
+                    client, ai_request["task_type"], ai_request["messages"]
+                )
+                try:
+                    first_token, model_used = await tokens.__anext__()
+                except StopAsyncIteration:
+                    raise HTTPException(status_code=502, detail="AI failed. The model returned no answer")
+        
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception("Request failed")
+            raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+        
+        conversation_id = conversation.id
+        conversation_session_id = conversation.session_id
+        
+        async def event_stream():
+            parts = [first_token]
+            start_event = {
+                "type": "start",
+                "session_id": conversation_session_id,
+                "mode": ai_request["mode"],
+                "model": model_used
+            }
+            if ai_request["source"]:
+                start_event["source"] = ai_request["source"]
+            if ai_request.get("ingestion"):
+                start_event["ingestion"] = ai_request["ingestion"]
+            yield ChatBot.format_stream_event(start_event, stream_format)
+            yield ChatBot.format_stream_event({"type": "token", "content": first_token}, stream_format)
+            
+            if tokens is not None:
+                try:
+                    async for token, _ in tokens:
+                        parts.append(token)
+                        yield ChatBot.format_stream_event({"type": "token", "content": token}, stream_format)
+                except Exception as e:
+                    logger.exception("Stream failed", extra={"conversation_id": conversation_id})
+                    yield ChatBot.format_stream_event({"type": "error", "detail": str(e)}, stream_format)
+                    return
+            
+            answer = "".join(parts)
+            if not cached:
+                await response_cache.put(cache_key, answer, model_used)
+            
+            # The request's session is closed once the response starts,
+            # so the finished turn gets its own session (one commit)
+            async with AsyncSessionLocal() as stream_db:
+                await MessageDB.create_turn(
+                    stream_db, conversation_id, message, answer,
+                    model_used=model_used, mode=ai_request["mode"], cached=bool(cached)
+                )
+                await stream_db.commit()
+            if ai_request.get("refresh_memory"):
+                ChatBot.refresh_memory_later(client, conversation_id)
+            
+            yield ChatBot.format_stream_event({
+                "type": "done",
+                "session_id": conversation_session_id,
+                "answer": answer,
+                "model_used": model_used,
+                "cached": bool(cached)
+            }, stream_format)
+        
+        media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+        return StreamingResponse(
+            event_stream(),
+            media_type=media_type,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    @staticmethod
+    async def build_batch_requests(db: AsyncSession, conversation, questions: list[str]) -> list[dict]:
+        """
+        AI requests for a batch of questions about the conversation's document
+        
+        The file, the retrieval index and every selected chunk are loaded
+        once for the whole batch; questions are embedded in one call. A
+        batch waits for a running upload job, as long as a question would.
+        """
+        job = ingestion_queue.active(conversation.id)
+        if job is not None:
+            with STAGE_LATENCY.time(stage="ingest_wait"):
+                await job.wait(INGESTION_WAIT_SECONDS)
+            if not job.done and job.status != INDEXING:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"The document is still being processed (job {job.id}); retry when it is done"
+                )
+        
+        with STAGE_LATENCY.time(stage="latest_file"):
+            latest_file = await FileDB.get_latest_file(db, conversation.id)
+        if latest_file and latest_file.is_image:
+            image_url = await ChatBot.load_image_url(db, latest_file)
+            return [ChatBot.image_request(question, image_url, latest_file.filename) for question in questions]
+        
+        with STAGE_LATENCY.time(stage="retrieve"):
+            query_vectors = await ChatBot.embed_queries(db, conversation.id, questions)
+            chunk_sets = await ContextDB.search_chunks_many(
+                db, conversation.id, questions, query_vectors=query_vectors
+            )
+        if not any(chunk_sets):
+            raise HTTPException(status_code=400, detail="Upload a document to this session before asking a batch of questions")
+        
+        source = latest_file.filename if latest_file else "document"
+        return [
+            ChatBot.document_request(question, chunks, source)
+            for question, chunks in zip(questions, chunk_sets)
+        ]
+
+    @staticmethod
+    async def save_batch_turns(db: AsyncSession, conversation_id: int, questions: list[str], requests: list[dict], results: list[dict]):
+        """Write the answered questions of a batch in question order (one commit)"""
+        for result in sorted(results, key=lambda result: result["index"]):
+            if "answer" not in result:
+                continue
+            await MessageDB.create_turn(
+                db, conversation_id, questions[result["index"]], result["answer"],
+                model_used=result["model_used"], mode=requests[result["index"]]["mode"], cached=result["cached"]
+            )
+        await db.commit()
+
+    @staticmethod
+    async def handle_batch_request(
+        session_id: str,
+        questions: list[str],
+        concurrency: int | None = None,
+        stream_format: str | None = None,
+        db: AsyncSession = Depends(get_db),
+        client=Depends(get_llm_client),
+        use_cache: bool = True
+    ):
+        """
+        📚 BATCH HANDLER - many questions about one document
+        
+        Context is loaded once, then the completions run concurrently (at
+        most `concurrency` at a time, behind interactive traffic in the rate
+        limiter). A failed question doesn't fail the batch: its result
+        carries error and status_code instead of answer.
+        
+        Without stream_format all results are returned together, in question
+        order. With "ndjson" or "sse" they are streamed as they finish:
+            start:  session_id, mode, source, questions
+            result: index, question, answer, model_used, cached, elapsed_ms (or error, status_code)
+            done:   answered, failed, elapsed_ms (after the turns are saved)
+        """
+        if stream_format not in (None, "ndjson", "sse"):
+            raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+        
+        questions = [question.strip() for question in questions if question and question.strip()]
+        if not questions:
+            raise HTTPException(status_code=400, detail="Provide at least one question")
+        if len(questions) > BATCH_MAX_QUESTIONS:
+            raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+        if not client:
+            raise HTTPException(status_code=500, detail="Groq API missing")
+        
+        try:
+            conversation = await ConversationDB.get_conversation(db, session_id)
+            if not conversation:
+                raise HTTPException(status_code=404, detail="Conversation not found")
+            
+            requests = await ChatBot.build_batch_requests(db, conversation, questions)
+            # Nothing is held open while the model answers
+            await db.commit()
+        
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception("Request failed")
+            raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+        
+        conversation_id = conversation.id
+        mode = requests[0]["mode"]
+        source = requests[0]["source"]
+        semaphore = asyncio.Semaphore(max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY)))
+        batch_start = time.monotonic()
+        logger.info("Batch started", extra={"conversation_id": conversation_id, "questions": len(questions), "mode": mode})
+        
+        async def answer(position: int) -> dict:
+            async with semaphore:
+                start = time.monotonic()
+                request = requests[position]
+                try:
+                    text, model_used, cached = await ChatBot.call_ai_with_fallback(
+                        client, request["task_type"], request["messages"],
+                        use_cache=use_cache, priority=PRIORITY_BATCH,
+                        deadline=BATCH_DEADLINE_SECONDS, max_wait=BATCH_DEADLINE_SECONDS
+                    )
+                except HTTPException as e:
+                    return {
+                        "index": position,
+                        "question": questions[position],
+                        "error": e.detail,
+                        "status_code": e.status_code
+                    }
+                return {
+                    "index": position,
+                    "question": questions[position],
+                    "answer": text,
+                    "model_used": model_used,
+                    "cached": cached,
+                    "elapsed_ms": round((time.monotonic() - start) * 1000)
+                }
+        
+        tasks = [asyncio.create_task(answer(position)) for position in range(len(questions))]
+        
+        if stream_format is None:
+            try:
+                results = await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+            await ChatBot.save_batch_turns(db, conversation_id, questions, requests, results)
+            answered = sum(1 for result in results if "answer" in result)
+            return {
+                "status": "success",
+                "session_id": session_id,
+                "mode": mode,
+                "source": source,
+                "results": results,
+                "answered": answered,
+                "failed": len(results) - answered,
+                "elapsed_ms": round((time.monotonic() - batch_start) * 1000)
+            }
+        
+        async def event_stream():
+            results = []
+            try:
+                yield ChatBot.format_stream_event({
+                    "type": "start",
+                    "session_id": session_id,
+                    "mode": mode,
+                    "source": source,
+                    "questions": len(questions)
+                }, stream_format)
+                
+                for finished in asyncio.as_completed(tasks):
+                    result = await finished
+                    results.append(result)
+                    yield ChatBot.format_stream_event({"type": "result", **result}, stream_format)
+            finally:
+                # The client went away: stop the remaining completions
+                for task in tasks:
+                    task.cancel()
+            
+            # The request's session is closed once the response starts
+            async with AsyncSessionLocal() as batch_db:
+                await ChatBot.save_batch_turns(batch_db, conversation_id, questions, requests, results)
+            
+            answered = sum(1 for result in results if "answer" in result)
+            yield ChatBot.format_stream_event({
+                "type": "done",
+                "answered": answered,
+                "failed": len(results) - answered,
+                "elapsed_ms": round((time.monotonic() - batch_start) * 1000)
+            }, stream_format)
+        
+        media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+        return StreamingResponse(
+            event_stream(),
+            media_type=media_type,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
@@ -1,11 +1,32 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from dotenv import load_dotenv
-from routers.Chat_route import router as ChatRouter
-from lib.Database_config import init_db, test_connection
-import lib.Cloudinary_config
+from lib.logging_config import setup_logging
 
 load_dotenv()
+# Before the other imports: modules log while they configure themselves
+setup_logging()
+
+# Parsers, SDKs and models are imported on first use or by the warm-up
+# below - not here (see benchmarks/check_startup.py for the import cost)
+import logging
+from routers.Chat_route import router as ChatRouter
+from lib.Database_config import warm_up_db, dispose_engines, DB_ENABLED
+from lib.Groq_config import warm_up_llm_client, close_async_groq_client
+from lib.startup import startup_timings, warmup, STARTUP_WARMUP
+from utils.extraction_pool import extraction_pool
+from utils.text_extractor import preload_parsers
+from utils.vector_index import embedder
+from utils.conversation_memory import conversation_memory
+from utils.ingestion_queue import ingestion_queue
+from utils.metrics import metrics, MetricsMiddleware, CONTENT_TYPE
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="AI Chatbot API with Database",
@@ -20,24 +41,65 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+# Background preloading, started once the server accepts traffic
+warmup.add("database", warm_up_db)
+# One pooled async client per worker, shared by every request
+warmup.add("llm_client", warm_up_llm_client)
+# Spawn the extraction workers so the first upload doesn't pay for it
+warmup.add("extraction", lambda: extraction_pool.warm(preload_parsers))
+warmup.add("embeddings", lambda: asyncio.to_thread(embedder.load))
+
+startup_timings.record("import", time.perf_counter() - IMPORT_STARTED)
+
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
-    print("\n🚀 Starting AI Chatbot API...")
-    
-    
-    if test_connection():
+    """Start serving at once; the database and clients are prepared in the background"""
+    with startup_timings.phase("startup"):
+        if not DB_ENABLED:
+            from utils.memory_store import session_store
+            logger.info("Using the in-memory session store", extra=session_store.stats())
         
-        init_db()
-        print("✅ Database initialized successfully!\n")
-    else:
-        print("⚠️ Database connection failed! Check your DATABASE_URL\n")
+        if STARTUP_WARMUP:
+            warmup.start()
+    
+    startup_timings.record("ready", time.perf_counter() - IMPORT_STARTED)
+    logger.info("Starting AI Chatbot API", extra=startup_timings.summary())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close shared clients on shutdown"""
+    await warmup.stop()
+    await ingestion_queue.shutdown()
+    await conversation_memory.shutdown()
+    await close_async_groq_client()
+    extraction_pool.shutdown()
+    await dispose_engines()
 
 
 app.include_router(ChatRouter)
 
 
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Liveness/readiness: answers as soon as the server runs (with startup timings)"""
+    return {
+        "status": "ok",
+        "warm": warmup.done,
+        "warmup": warmup.status,
+        "startup_seconds": startup_timings.summary()
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Per-stage latency histograms and counters (Prometheus text format)"""
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/")
 async def root():
     """API Root"""
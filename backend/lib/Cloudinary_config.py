@@ -1,7 +1,10 @@
 import cloudinary
+import logging
 import os
 
 
+logger = logging.getLogger(__name__)
+
 cloudinary.config(
     cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),  # ✅ Fixed from CLOUDINARY_API_NAME
     api_key=os.getenv("CLOUDINARY_API_KEY"),
@@ -9,17 +12,11 @@ cloudinary.config(
     secure=True,
 )
 
-# Optional: Debug print to verify config loads
-print("✅ Cloudinary configured:")
-print(f"  Cloud Name: {os.getenv('CLOUDINARY_CLOUD_NAME')}")
-print(
-    f"  API Key: {os.getenv('CLOUDINARY_API_KEY')[:10]}..."
-    if os.getenv("CLOUDINARY_API_KEY")
-    else "  API Key: None"
+# Credentials themselves are never logged
+logger.info(
+    "Cloudinary configured",
+    extra={
+        "cloud_name": os.getenv("CLOUDINARY_CLOUD_NAME"),
+        "api_key_set": bool(os.getenv("CLOUDINARY_API_KEY"))
+    }
 )
-
-
-me = os.getenv("SANTUSHT")
-
-
-print("this is me = ", me)
@@ -1,74 +1,194 @@
+import asyncio
+import logging
 import os
 from dotenv import load_dotenv
 load_dotenv()
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from utils.metrics import instrument_engine
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+DB_ENABLED = DATABASE_URL is not None
 
-print(DATABASE_URL)
+# Base class for models (also imported without a database: the enums live there)
+Base = declarative_base()
+
+
+def to_async_url(url: str):
+    """
+    Async driver URL for DATABASE_URL: asyncpg for PostgreSQL, aiosqlite for SQLite
+    
+    Returns (url, connect_args). libpq's sslmode is not understood by
+    asyncpg, so it is translated to the ssl connect argument.
+    """
+    parsed = make_url(url)
+    connect_args = {}
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        query = dict(parsed.query)
+        sslmode = query.pop("sslmode", None)
+        if sslmode and sslmode != "disable":
+            connect_args["ssl"] = sslmode
+        parsed = parsed.set(drivername="postgresql+asyncpg", query=query)
+    elif backend == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed, connect_args
+
+
+class MemorySession:
+    """
+    Stand-in for a database session when DATABASE_URL is unset
+    
+    Writes to the in-memory store apply immediately, so commit and
+    rollback do nothing. Usable with `async with` and from worker threads,
+    like the session factories it replaces.
+    """
+    
+    async def commit(self):
+        pass
+    
+    async def rollback(self):
+        pass
+    
+    async def flush(self):
+        pass
+    
+    def close(self):
+        pass
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
 
-DB_ENABLED = DATABASE_URL is not None
 
 if DB_ENABLED:
+    # Request handlers use the async engine; the sync engine is kept for
+    # table creation and worker threads (e.g. embedding document chunks)
     engine = create_engine(
         DATABASE_URL,
         pool_pre_ping=True,
+        pool_size=2,
+        max_overflow=8
+    )
+    
+    # Objects stay loaded after commit - no refresh round-trip per access
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+    
+    async_url, async_connect_args = to_async_url(DATABASE_URL)
+    async_engine = create_async_engine(
+        async_url,
+        connect_args=async_connect_args,
+        # aiosqlite defaults to NullPool (a new connection and thread per session)
+        poolclass=AsyncAdaptedQueuePool,
+        pool_pre_ping=True,
         pool_size=10,
         max_overflow=20
     )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
     
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Statement timings for /metrics (read vs write)
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
     
-    # Base class for models
-    Base = declarative_base()
-    
-    print("✅ Database configuration loaded")
+    logger.info(
+        "Database configuration loaded",
+        extra={"database": make_url(DATABASE_URL).render_as_string(hide_password=True)}
+    )
 else:
+    # Sessions live in a bounded in-process store (utils/memory_store.py);
+    # its helpers take these no-op sessions in place of database sessions
     engine = None
-    SessionLocal = None
-    Base = None
-    print("⚠️ DATABASE_URL not found - running without database persistence")
+    async_engine = None
+    SessionLocal = MemorySession
+    AsyncSessionLocal = MemorySession
+    logger.warning("DATABASE_URL not found - sessions are kept in memory only (lost on restart)")
 
 # Dependency to get database session
-def get_db():
-    """Get database session"""
-    if not DB_ENABLED:
-        # Return None if database is not configured
-        yield None
-        return
+async def get_db():
+    """Get an async database session (an in-memory one without DATABASE_URL)"""
+    if DB_ENABLED and not db_prepared():
+        # Only requests that arrive before the startup warm-up finished wait
+        await prepare_db()
     
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-# Initialize database (create tables)
+# Initialize database (create tables, apply migrations)
 def init_db():
-    """Create all database tables"""
+    """Create missing tables and apply pending schema migrations"""
     if not DB_ENABLED:
-        print("⚠️ Database not configured - skipping table creation")
+        logger.warning("Database not configured - skipping table creation")
         return False
     
     from models import database_models
+    from lib.migrations import run_migrations
     Base.metadata.create_all(bind=engine)
-    print("✅ Database tables created successfully!")
+    logger.info("Database tables created")
+    run_migrations(engine)
     return True
 
+def _prepare_db_sync() -> bool:
+    if test_connection():
+        init_db()
+        logger.info("Database initialized")
+        return True
+    logger.warning("Database connection failed - check DATABASE_URL")
+    return False
+
+_prepare_task = None
+
+def db_prepared() -> bool:
+    """Whether prepare_db has finished (successfully or not)"""
+    return _prepare_task is not None and _prepare_task.done()
+
+async def prepare_db() -> bool:
+    """
+    Check the connection and create/migrate tables, once per process
+    
+    Runs in a thread so the server accepts traffic meanwhile; concurrent
+    callers share the one run. Returns whether the database is usable.
+    """
+    global _prepare_task
+    
+    if not DB_ENABLED:
+        return False
+    if _prepare_task is None:
+        _prepare_task = asyncio.ensure_future(asyncio.to_thread(_prepare_db_sync))
+    return await asyncio.shield(_prepare_task)
+
+async def warm_up_db():
+    """Prepare the database and open a first pooled connection (startup warm-up)"""
+    if await prepare_db():
+        async with async_engine.connect():
+            pass
+
+async def dispose_engines():
+    """Close pooled connections on shutdown"""
+    if async_engine is not None:
+        await async_engine.dispose()
+    if engine is not None:
+        engine.dispose()
+
 # Test database connection
 def test_connection():
     """Test database connection"""
     if not DB_ENABLED:
-        print("⚠️ Database not configured")
+        logger.warning("Database not configured")
         return False
     
     try:
         with engine.connect() as conn:
-            print("✅ Database connection successful!")
+            logger.info("Database connection successful")
             return True
     except Exception as e:
-        print(f"❌ Database connection failed: {e}")
+        logger.error("Database connection failed", extra={"error": str(e)})
         return False
\ No newline at end of file
@@ -1,26 +1,110 @@
+import asyncio
+import importlib
+import logging
 import os
-from groq import Groq
+from typing import TYPE_CHECKING, Optional
+
+# The SDK (and httpx under it) is imported when the client is created - it
+# is a large import, and startup creates the client in the background
+if TYPE_CHECKING:
+    from groq import AsyncGroq
+
+
+logger = logging.getLogger(__name__)
+
+
+# Connection pool for the shared async client - one pool per worker process,
+# reused by every in-flight completion
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "200"))
+GROQ_MAX_KEEPALIVE = int(os.getenv("GROQ_MAX_KEEPALIVE", "50"))
+GROQ_KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "30"))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "1"))
+
+_async_client: Optional["AsyncGroq"] = None
 
 
 def get_groq_client():
     """
-    Get Groq API client
-    
+    Get a synchronous Groq API client (scripts and one-off jobs)
+
     Returns:
         Groq client if API key exists, None otherwise
     """
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
-        print("⚠️ GROQ_API_KEY not found in environment variables")
+        logger.warning("GROQ_API_KEY not found in environment variables")
         return None  # ✅ Return None, not a string
-    
-    print(f"✅ Groq API Key loaded: {api_key[:20]}...")
+
+    from groq import Groq
     return Groq(api_key=api_key)
 
 
+def init_async_groq_client() -> Optional["AsyncGroq"]:
+    """
+    Create the process-wide async Groq client
+
+    Called once at startup. The client owns a pooled httpx.AsyncClient, so
+    keep-alive connections are shared by all concurrent requests.
+
+    Returns:
+        AsyncGroq client if API key exists, None otherwise
+    """
+    global _async_client
+
+    if _async_client is not None:
+        return _async_client
+
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        logger.warning("GROQ_API_KEY not found in environment variables")
+        return None
+
+    import httpx
+    from groq import AsyncGroq
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=GROQ_MAX_CONNECTIONS,
+            max_keepalive_connections=GROQ_MAX_KEEPALIVE,
+            keepalive_expiry=GROQ_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(GROQ_TIMEOUT, connect=5.0)
+    )
+    _async_client = AsyncGroq(
+        api_key=api_key,
+        http_client=http_client,
+        max_retries=GROQ_MAX_RETRIES
+    )
+    logger.info("Groq async client ready", extra={"max_connections": GROQ_MAX_CONNECTIONS})
+    return _async_client
+
+
+async def warm_up_llm_client():
+    """Import the SDK off the event loop, then create the shared client (startup warm-up)"""
+    await asyncio.to_thread(importlib.import_module, "groq")
+    init_async_groq_client()
+
+
+async def close_async_groq_client():
+    """Close the shared async client and its connection pool"""
+    global _async_client
+
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+def get_llm_client() -> Optional["AsyncGroq"]:
+    """Get the shared async Groq client (FastAPI dependency)"""
+    if _async_client is None:
+        return init_async_groq_client()
+    return _async_client
+
+
 # Debug prints (optional, can remove in production)
 if __name__ == "__main__":
     print("CLOUD_NAME:", os.getenv("CLOUDINARY_CLOUD_NAME"))
     print("API_KEY:", os.getenv("CLOUDINARY_API_KEY"))
     print("API_SECRET:", os.getenv("CLOUDINARY_API_SECRET"))
-    print("GROQ_API_KEY:", "Found" if os.getenv("GROQ_API_KEY") else "Missing")
\ No newline at end of file
+    print("GROQ_API_KEY:", "Found" if os.getenv("GROQ_API_KEY") else "Missing")
@@ -30,6 +30,23 @@ class ModelConfig:
         "temperature": 0.7,
         "max_tokens": 500
     }
+    
+    # 🧠 Conversation summaries (background memory refresh)
+    SUMMARY_MODEL = CHAT_MODEL
+    SUMMARY_FALLBACK = CHAT_FALLBACK
+    SUMMARY_SETTINGS = {
+        "temperature": 0.2,
+        "max_tokens": 400
+    }
+
+    # 🚦 Provider rate limits per model (requests and tokens per minute, per API key)
+    RATE_LIMITS = {
+        "meta-llama/llama-4-scout-17b-16e-instruct": {"rpm": 30, "tpm": 30000},
+        "meta-llama/llama-4-maverick-17b-128e-instruct": {"rpm": 30, "tpm": 6000},
+        "llama-3.3-70b-versatile": {"rpm": 30, "tpm": 12000},
+        "llama-3.1-70b-versatile": {"rpm": 30, "tpm": 6000},
+        "llama-3.1-8b-instant": {"rpm": 30, "tpm": 6000}
+    }
 
     @staticmethod
     def get_model_for_task(task_type: str) -> dict:
@@ -46,6 +63,12 @@ class ModelConfig:
                 "fallback": ModelConfig.DOCUMENT_FALLBACK,
                 "settings": ModelConfig.DOCUMENT_SETTINGS
             }
+        elif task_type == "summary":
+            return {
+                "model": ModelConfig.SUMMARY_MODEL,
+                "fallback": ModelConfig.SUMMARY_FALLBACK,
+                "settings": ModelConfig.SUMMARY_SETTINGS
+            }
         elif task_type == "chat":
             return {
                 "model": ModelConfig.CHAT_MODEL,
@@ -0,0 +1,76 @@
+import json
+import logging
+import os
+import sys
+import time
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" for readable key=value lines, "json" for one object per line (log shippers)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# Attributes every LogRecord has; anything else was passed with extra=
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_configured = False
+
+
+def record_fields(record: logging.LogRecord) -> dict:
+    """The structured fields of a record (its extra= dict)"""
+    return {key: value for key, value in vars(record).items() if key not in STANDARD_ATTRS}
+
+
+def format_timestamp(record: logging.LogRecord) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and the extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": format_timestamp(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """time level logger: message key=value ..."""
+
+    @staticmethod
+    def format_field(value) -> str:
+        text = str(value)
+        if not text or any(char in text for char in ' "='):
+            return json.dumps(text, ensure_ascii=False)
+        return text
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{format_timestamp(record)} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={self.format_field(value)}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def setup_logging():
+    """Send application logs to stderr in LOG_FORMAT at LOG_LEVEL (idempotent)"""
+    global _configured
+
+    if _configured:
+        return
+    _configured = True
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else KeyValueFormatter())
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
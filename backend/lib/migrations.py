@@ -0,0 +1,145 @@
+"""
+Schema migrations
+
+create_all() only creates missing tables, so columns and indexes added to
+existing tables never reach a deployed database. Each migration below runs
+once, in order; applied versions are recorded in schema_migrations.
+
+Migrations must be idempotent: a fresh database already has the current
+schema from create_all(), and the same steps then only record the version.
+"""
+import logging
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from models.database_models import Context, Conversation, Document, DocumentChunk, File, Message, utcnow
+
+
+logger = logging.getLogger(__name__)
+
+
+migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False)
+)
+
+# Serializes migrations across workers starting at the same time (PostgreSQL)
+ADVISORY_LOCK_ID = 720_915_001
+
+
+def add_column(connection: Connection, model, name: str, default: str = None, references: str = None):
+    """ALTER TABLE ... ADD COLUMN for a model column, unless it already exists"""
+    table = model.__table__
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    if name in existing:
+        return
+
+    column = table.c[name]
+    ddl = f"ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(dialect=connection.dialect)}"
+    if default is not None:
+        ddl += f" DEFAULT {default}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    if references:
+        ddl += f" REFERENCES {references}"
+    connection.execute(text(ddl))
+
+
+def create_indexes(connection: Connection, *models):
+    """Create every index declared on the models that does not exist yet"""
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def drop_index(connection: Connection, table_name: str, index_name: str):
+    existing = {index["name"] for index in inspect(connection).get_indexes(table_name)}
+    if index_name in existing:
+        connection.execute(text(f"DROP INDEX {index_name}"))
+
+
+def add_columns_since_initial_schema(connection: Connection):
+    add_column(connection, Conversation, "message_count", default="0")
+    add_column(connection, Message, "cached", default="false")
+    add_column(connection, File, "document_id", references="documents(id)")
+    add_column(connection, File, "blob_ref")
+    add_column(connection, Context, "page_number")
+
+
+def backfill_conversation_activity(connection: Connection):
+    conversations = Conversation.__table__
+    messages = Message.__table__
+    connection.execute(
+        conversations.update()
+        .where(conversations.c.updated_at.is_(None))
+        .values(updated_at=conversations.c.created_at)
+    )
+    connection.execute(
+        conversations.update().values(
+            message_count=select(func.count())
+            .select_from(messages)
+            .where(messages.c.conversation_id == conversations.c.id)
+            .scalar_subquery(),
+            # Not activity: keep the column's onupdate from firing
+            updated_at=conversations.c.updated_at
+        )
+    )
+
+
+def add_hot_query_indexes(connection: Connection):
+    create_indexes(connection, Conversation, Message, File, Context, DocumentChunk)
+    # Covered by the (document_id, chunk_index) index
+    drop_index(connection, "document_chunks", "ix_document_chunks_document_id")
+
+
+def add_conversation_summary(connection: Connection):
+    add_column(connection, Conversation, "summary")
+    add_column(connection, Conversation, "summary_message_id", default="0")
+
+
+def add_document_page_offsets(connection: Connection):
+    add_column(connection, Document, "page_offsets")
+
+
+def add_conversation_context_document(connection: Connection):
+    add_column(connection, Conversation, "context_document_id", references="documents(id)")
+
+
+# (version, description, step) - append only, never renumber
+MIGRATIONS = [
+    (1, "Add columns introduced after the initial schema", add_columns_since_initial_schema),
+    (2, "Backfill conversations.updated_at and message_count", backfill_conversation_activity),
+    (3, "Composite indexes for messages, files, contexts and document chunks", add_hot_query_indexes),
+    (4, "Conversation summary for token-budgeted memory", add_conversation_summary),
+    (5, "Per-page text offsets of PDF documents", add_document_page_offsets),
+    (6, "Conversations reference their context document instead of copying its chunks", add_conversation_context_document),
+]
+
+
+def run_migrations(engine: Engine) -> list:
+    """Apply pending migrations in one transaction; returns the applied versions"""
+    applied_now = []
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+
+        schema_migrations.create(connection, checkfirst=True)
+        applied = set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+        for version, description, step in MIGRATIONS:
+            if version in applied:
+                continue
+            step(connection)
+            connection.execute(
+                schema_migrations.insert().values(version=version, description=description, applied_at=utcnow())
+            )
+            applied_now.append(version)
+            logger.info("Migration applied", extra={"version": version, "description": description})
+
+    return applied_now
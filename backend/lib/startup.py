@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Preload the database pool, LLM client, parsers and embedding model in the
+# background once the server accepts traffic (false: everything loads on first use)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+
+STARTUP_SECONDS = metrics.gauge(
+    "chatbot_startup_seconds", "Duration of each startup phase and warm-up task", ("phase",)
+)
+
+
+class StartupTimings:
+    """Durations of the startup phases of this process (seconds)"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def record(self, phase: str, seconds: float):
+        self.phases[phase] = seconds
+        STARTUP_SECONDS.set(seconds, phase=phase)
+
+    @contextmanager
+    def phase(self, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - started)
+
+    def summary(self) -> Dict[str, float]:
+        return {phase: round(seconds, 4) for phase, seconds in self.phases.items()}
+
+
+class Warmup:
+    """
+    Background preloading after startup
+
+    Tasks run concurrently once the server is accepting requests, so a
+    cold process is ready at once and heavy initialization (connections,
+    SDK imports, models) happens off the request path. Every subsystem
+    still initializes itself on first use, so a request arriving before
+    its task finished just does that work itself (or waits for it, like
+    the database schema). Failures are logged, never raised.
+    """
+
+    def __init__(self, timings: StartupTimings):
+        self.timings = timings
+        self._tasks: List[Tuple[str, Callable[[], Awaitable]]] = []
+        self.status: Dict[str, str] = {}
+        self._runner: Optional[asyncio.Task] = None
+
+    def add(self, name: str, fn: Callable[[], Awaitable]):
+        self._tasks.append((name, fn))
+        self.status[name] = "pending"
+
+    @property
+    def done(self) -> bool:
+        return self._runner is not None and self._runner.done()
+
+    async def _run_task(self, name: str, fn: Callable[[], Awaitable]):
+        self.status[name] = "running"
+        started = time.perf_counter()
+        try:
+            await fn()
+        except Exception as e:
+            self.status[name] = "failed"
+            logger.warning("Warm-up task failed", extra={"task": name, "error": str(e)})
+        else:
+            self.status[name] = "done"
+        finally:
+            self.timings.record(f"warmup.{name}", time.perf_counter() - started)
+
+    async def _run(self):
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run_task(name, fn) for name, fn in self._tasks))
+        self.timings.record("warmup", time.perf_counter() - started)
+        logger.info("Warm-up finished", extra={**self.status, **self.timings.summary()})
+
+    def start(self):
+        """Start the tasks in the background (returns at once)"""
+        if self._runner is None and self._tasks:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None and not self._runner.done():
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+
+
+startup_timings = StartupTimings()
+warmup = Warmup(startup_timings)
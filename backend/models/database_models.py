@@ -1,10 +1,16 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Enum, Index
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from lib.Database_config import Base
+from datetime import datetime, timezone
 import enum
 
 
+def utcnow() -> datetime:
+    """Application-side timestamp (same precision on every backend, safe for keyset cursors)"""
+    return datetime.now(timezone.utc)
+
+
 class FileType(str, enum.Enum):
     """File type enum"""
     IMAGE = "image"
@@ -32,12 +38,22 @@ class Conversation(Base):
     session_id = Column(String(255), unique=True, index=True, nullable=False)
     title = Column(String(500), default="New Conversation")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)  # Last activity
+    message_count = Column(Integer, default=0, server_default="0", nullable=False)  # Maintained by MessageDB
+    summary = Column(Text, nullable=True)  # Rolling summary of older turns (conversation memory)
+    summary_message_id = Column(Integer, default=0, server_default="0", nullable=False)  # Last message folded into the summary
+    # Shared document whose chunks are the context (None: legacy rows in contexts, or no context)
+    context_document_id = Column(Integer, ForeignKey("documents.id"), nullable=True)
     
     # Relationships
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     files = relationship("File", back_populates="conversation", cascade="all, delete-orphan")
 
+    # Keyset pagination of the conversation list
+    __table_args__ = (
+        Index("ix_conversations_updated_at_id", "updated_at", "id"),
+    )
+
     def __repr__(self):
         return f"<Conversation {self.session_id}>"
 
@@ -55,11 +71,18 @@ class Message(Base):
     content = Column(Text, nullable=False)
     model_used = Column(String(255), nullable=True)  # Which AI model was used
     mode = Column(String(100), nullable=True)  # chat, document_analysis, image_analysis
+    cached = Column(Boolean, default=False, nullable=False)  # Answer served from the LLM response cache
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
 
+    # Recent messages (created_at) and keyset history pages (id)
+    __table_args__ = (
+        Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at"),
+        Index("ix_messages_conversation_id_id", "conversation_id", "id"),
+    )
+
     def __repr__(self):
         return f"<Message {self.id} - {self.role}>"
 
@@ -79,12 +102,14 @@ class File(Base):
     cloudinary_url = Column(String(1000), nullable=True)  # If stored in Cloudinary
     
     # For text-based files
-    text_content = Column(Text, nullable=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=True)  # Shared extracted content
+    text_content = deferred(Column(Text, nullable=True))  # Legacy rows only - new uploads use documents
     chunks_count = Column(Integer, nullable=True)
     
     # For images
     is_image = Column(Boolean, default=False)
-    image_base64 = Column(Text, nullable=True)  # Base64 encoded image
+    blob_ref = Column(String(1000), nullable=True)  # Reference into the blob store (bytes live outside the DB)
+    image_base64 = deferred(Column(Text, nullable=True))  # Legacy rows only - loaded on access
     media_type = Column(String(100), nullable=True)  # image/jpeg, image/png, etc.
     
     # Metadata
@@ -92,15 +117,66 @@ class File(Base):
     
     # Relationships
     conversation = relationship("Conversation", back_populates="files")
+    document = relationship("Document")
+
+    # Latest file of a conversation
+    __table_args__ = (
+        Index("ix_files_conversation_id_created_at", "conversation_id", "created_at"),
+    )
 
     def __repr__(self):
         return f"<File {self.filename}>"
 
 
+class Document(Base):
+    """
+    Document table
+    Extracted content of uploaded documents, stored once per unique file
+    (content-addressed by SHA-256 of the uploaded bytes)
+    """
+    __tablename__ = "documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True, nullable=False)  # SHA-256 hex
+    file_type = Column(Enum(FileType), nullable=False)
+    byte_size = Column(Integer, nullable=False)
+    text_content = Column(Text, nullable=False)  # Empty since chunks are stored batch by batch: chunks hold the text
+    # PDFs: JSON list of where each page starts in the extracted text (pages joined by "\n"), for citations
+    page_offsets = Column(Text, nullable=True)
+    chunks_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<Document {self.content_hash[:12]}>"
+
+
+class DocumentChunk(Base):
+    """
+    Document chunk table
+    Chunks of a document, read by every conversation whose context it is
+    """
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    chunk_text = Column(Text, nullable=False)
+    page_number = Column(Integer, nullable=True)
+
+    # A document's chunks in order
+    __table_args__ = (
+        Index("ix_document_chunks_document_id_chunk_index", "document_id", "chunk_index"),
+    )
+
+    def __repr__(self):
+        return f"<DocumentChunk {self.document_id}:{self.chunk_index}>"
+
+
 class Context(Base):
     """
     Context table
-    Stores current active context/chunks for each conversation
+    Chunks of conversations whose context predates shared documents
+    (new uploads set conversations.context_document_id instead)
     """
     __tablename__ = "contexts"
 
@@ -108,7 +184,13 @@ class Context(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
     chunk_index = Column(Integer, nullable=False)  # Order of chunks
     chunk_text = Column(Text, nullable=False)
+    page_number = Column(Integer, nullable=True)  # 1-based source page (PDFs)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Chunk lookups, counts and ordering per conversation
+    __table_args__ = (
+        Index("ix_contexts_conversation_id_chunk_index", "conversation_id", "chunk_index"),
+    )
+
     def __repr__(self):
         return f"<Context chunk {self.chunk_index}>"
\ No newline at end of file
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, UploadFile, File, Form, Query, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, UploadFile, File, Form, Query, Body, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from controllers.Chat_controller import ChatBot
+from utils.response_cache import response_cache
+from utils.model_router import model_router
+from utils.rate_limiter import rate_limiter
 from lib.Database_config import get_db
-from typing import Optional
+from lib.Groq_config import get_llm_client
+from typing import List, Optional
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
@@ -13,7 +17,13 @@ async def unified_chat_endpoint(
     message: Optional[str] = Form(None),
     action: Optional[str] = Query(None, description="Action: clear_context, get_context, get_history, get_conversations"),
     session_id: Optional[str] = Query(None, description="Conversation session ID (auto-generated if not provided)"),
-    db: Session = Depends(get_db)
+    no_cache: bool = Query(False, description="Skip the LLM response cache for this request"),
+    cursor: Optional[str] = Query(None, description="Pagination cursor (next_cursor of the previous page)"),
+    limit: int = Query(50, ge=1, le=200, description="Page size for listings"),
+    before: Optional[int] = Query(None, description="get_history: messages older than this message id"),
+    after: Optional[int] = Query(None, description="get_history: messages newer than this message id"),
+    db: AsyncSession = Depends(get_db),
+    client=Depends(get_llm_client)
 ):
     """
     🎯 UNIFIED CHAT ENDPOINT with Database Persistence
@@ -30,12 +40,15 @@ async def unified_chat_endpoint(
     - `message`: Your question or message
     - `action`: Special commands (see below)
     - `session_id`: Continue existing conversation (optional)
+    - `no_cache`: Ask the model even if an identical request was answered before
+    - `cursor` / `limit`: Page through listings (`next_cursor` is null on the last page)
+    - `before` / `after`: Page through history by message id
     
     ## Actions:
     - `clear_context`: Clear file context for session
     - `get_context`: Get current context info
-    - `get_history`: Get all messages in conversation
-    - `get_conversations`: List all conversations
+    - `get_history`: Get messages in conversation (latest `limit` by default)
+    - `get_conversations`: List conversations, most recently active first
     
     ## Usage Examples:
     
@@ -58,6 +71,9 @@ async def unified_chat_endpoint(
     file: document.pdf
     ```
     
+    Documents are processed in the background: the response has
+    `status: "processing"` and a `job_id` for `GET /chat/ingestion/{job_id}`.
+    
     ### Upload and ask:
     ```bash
     POST /chat/?session_id=abc-123-def
@@ -68,11 +84,16 @@ async def unified_chat_endpoint(
     ### Get conversation history:
     ```bash
     POST /chat/?action=get_history&session_id=abc-123-def
+    # Older messages: pass the id of the first message you have
+    POST /chat/?action=get_history&session_id=abc-123-def&before=120
     ```
     
-    ### List all conversations:
+    Full export: `GET /chat/history/export?session_id=abc-123-def`
+    
+    ### List conversations (paginated):
     ```bash
-    POST /chat/?action=get_conversations
+    POST /chat/?action=get_conversations&limit=50
+    POST /chat/?action=get_conversations&limit=50&cursor=<next_cursor>
     ```
     """
     
@@ -81,5 +102,158 @@ async def unified_chat_endpoint(
         message=message,
         action=action,
         session_id=session_id,
-        db=db
-    )
\ No newline at end of file
+        db=db,
+        client=client,
+        use_cache=not no_cache,
+        cursor=cursor,
+        limit=limit,
+        before=before,
+        after=after
+    )
+
+@router.post("/stream")
+async def streaming_chat_endpoint(
+    file: Optional[UploadFile] = File(None),
+    message: Optional[str] = Form(None),
+    session_id: Optional[str] = Query(None, description="Conversation session ID (auto-generated if not provided)"),
+    format: str = Query("ndjson", description="Stream format: ndjson or sse"),
+    no_cache: bool = Query(False, description="Skip the LLM response cache for this request"),
+    db: AsyncSession = Depends(get_db),
+    client=Depends(get_llm_client)
+):
+    """
+    ⚡ STREAMING CHAT ENDPOINT
+    
+    Same inputs as `POST /chat/`, but the answer is relayed token by token
+    while the model generates it. The assistant message is saved once the
+    stream finishes.
+    
+    ## Formats:
+    - `ndjson` (default): one JSON event per line
+    - `sse`: Server-Sent Events (`event: <type>` + `data: <json>`)
+    
+    ## Events:
+    - `start`: session_id, mode, model (and source for file questions)
+    - `token`: next piece of the answer in `content`
+    - `done`: full `answer` and `model_used`
+    - `error`: the model failed after the stream started
+    
+    ### Example:
+    ```bash
+    curl -N -X POST "http://localhost:8000/chat/stream?session_id=abc-123-def" \\
+      -F "message=Summarize this"
+    ```
+    """
+    
+    return await ChatBot.handle_stream_request(
+        file=file,
+        message=message,
+        session_id=session_id,
+        stream_format=format,
+        db=db,
+        client=client,
+        use_cache=not no_cache
+    )
+
+
+@router.post("/batch")
+async def batch_questions_endpoint(
+    questions: List[str] = Body(..., embed=True, description="Questions about the session's document"),
+    session_id: str = Query(..., description="Conversation session ID (with an uploaded document or image)"),
+    concurrency: Optional[int] = Query(None, ge=1, description="Completions in flight at once (default BATCH_CONCURRENCY)"),
+    format: Optional[str] = Query(None, description="Stream results as they finish: ndjson or sse"),
+    no_cache: bool = Query(False, description="Skip the LLM response cache for this request"),
+    db: AsyncSession = Depends(get_db),
+    client=Depends(get_llm_client)
+):
+    """
+    📚 BATCH QUESTIONS
+    
+    Ask many questions about the document (or image) of a session at once.
+    The context is loaded once and the answers are generated concurrently,
+    so a question set takes about as long as its slowest question. Every
+    answered question is saved to the conversation history.
+    
+    Without `format` the response holds all `results` in question order;
+    with `format=ndjson` or `sse` each result is sent as soon as it is
+    ready (`start`, `result`..., `done` events).
+    
+    ### Example:
+    ```bash
+    curl -X POST "http://localhost:8000/chat/batch?session_id=abc-123-def&format=ndjson" \\
+      -H "Content-Type: application/json" \\
+      -d '{"questions": ["Who are the parties?", "When does it terminate?"]}'
+    ```
+    """
+    return await ChatBot.handle_batch_request(
+        session_id=session_id,
+        questions=questions,
+        concurrency=concurrency,
+        stream_format=format,
+        db=db,
+        client=client,
+        use_cache=not no_cache
+    )
+
+
+@router.get("/history/export")
+async def export_history_endpoint(
+    session_id: str = Query(..., description="Conversation session ID"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    📤 EXPORT CONVERSATION HISTORY
+    
+    Streams every message as NDJSON, oldest first:
+    `{"id", "role", "content", "model", "created_at"}` per line.
+    
+    ### Example:
+    ```bash
+    curl -N "http://localhost:8000/chat/history/export?session_id=abc-123-def" > history.ndjson
+    ```
+    """
+    return await ChatBot.export_history(session_id=session_id, db=db)
+
+
+@router.get("/ingestion/{job_id}")
+async def ingestion_status_endpoint(job_id: str):
+    """
+    📥 UPLOAD PROCESSING STATUS
+    
+    Progress of a document upload (`job_id` from the upload response):
+    `status` is queued, extracting, indexing, done or failed, with
+    `pages_done` / `chunks_done` so far, `chunks_count` once stored and
+    `error` if it failed. Questions asked before `done` wait briefly,
+    then are answered from the chunks processed so far.
+    
+    Jobs are tracked by the worker that accepted the upload and kept for
+    INGESTION_JOB_TTL seconds after they finish.
+    
+    ### Example:
+    ```bash
+    curl "http://localhost:8000/chat/ingestion/3f2a..."
+    ```
+    """
+    return ChatBot.ingestion_status(job_id)
+
+
+@router.get("/cache")
+async def cache_stats_endpoint():
+    """
+    📊 LLM RESPONSE CACHE STATS
+    
+    Hit/miss counters, evictions and size of this worker's cache.
+    """
+    return response_cache.stats()
+
+
+@router.get("/models")
+async def model_health_endpoint():
+    """
+    🩺 MODEL HEALTH
+    
+    Circuit state, rolling p50/p95 latency, error rate and hedge wins per
+    model, as seen by this worker, plus each model's rate-limit buckets and
+    admission queue.
+    """
+    return {**model_router.snapshot(), "rate_limits": rate_limiter.snapshot()}
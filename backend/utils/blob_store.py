@@ -0,0 +1,128 @@
+import base64
+import hashlib
+import io
+import os
+from typing import Optional
+
+
+# "local" (filesystem, default) or "cloudinary"
+BLOB_STORE = os.getenv("BLOB_STORE", "local").lower()
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", os.path.join(os.getcwd(), "blobs"))
+
+LOCAL_PREFIX = "local:"
+
+
+class LocalBlobStore:
+    """
+    Content-addressed files on local disk
+
+    Blobs are named by the SHA-256 of their bytes, so the same image
+    uploaded twice is stored once. Writes are atomic (temp file + rename).
+    """
+
+    def __init__(self, directory: str = BLOB_STORE_DIR):
+        self.directory = directory
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, content: bytes, media_type: str) -> str:
+        """Store bytes and return their reference (blocking)"""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return f"{LOCAL_PREFIX}{digest}"
+
+    def get(self, ref: str) -> bytes:
+        """Read the bytes behind a reference (blocking)"""
+        with open(self._path(ref[len(LOCAL_PREFIX):]), "rb") as f:
+            return f.read()
+
+    def image_url(self, ref: str, media_type: str) -> str:
+        """URL the vision model can read - a data URL for local blobs (blocking)"""
+        return f"data:{media_type};base64,{base64.b64encode(self.get(ref)).decode('utf-8')}"
+
+
+class CloudinaryBlobStore:
+    """
+    Images uploaded to Cloudinary (configured in lib/Cloudinary_config.py)
+
+    The reference is the secure URL, which is handed to the model directly,
+    so the bytes never pass through this server again.
+    """
+
+    def __init__(self):
+        import lib.Cloudinary_config  # noqa: F401 - applies the credentials
+        import cloudinary.uploader
+        self._uploader = cloudinary.uploader
+
+    def put(self, content: bytes, media_type: str) -> str:
+        """Upload bytes and return their URL (blocking)"""
+        digest = hashlib.sha256(content).hexdigest()
+        result = self._uploader.upload(
+            io.BytesIO(content),
+            resource_type="image",
+            public_id=digest,
+            overwrite=False
+        )
+        return result["secure_url"]
+
+    def get(self, ref: str) -> bytes:
+        """Download the bytes behind a URL (blocking)"""
+        import httpx
+        response = httpx.get(ref, timeout=30)
+        response.raise_for_status()
+        return response.content
+
+    def image_url(self, ref: str, media_type: str) -> str:
+        return ref
+
+
+class BlobStore:
+    """
+    Stores uploaded image bytes outside the database
+
+    Only the returned reference is kept in the files table. Local
+    references ("local:<sha256>") are always readable, so files uploaded
+    before switching to Cloudinary keep working.
+    """
+
+    def __init__(self, backend: str = BLOB_STORE):
+        self.local = LocalBlobStore()
+        self._backend_name = backend
+        self._remote: Optional[CloudinaryBlobStore] = None
+
+    @property
+    def backend(self):
+        if self._backend_name == "cloudinary":
+            if self._remote is None:
+                self._remote = CloudinaryBlobStore()
+            return self._remote
+        return self.local
+
+    def _for(self, ref: str):
+        return self.local if ref.startswith(LOCAL_PREFIX) else self.backend
+
+    def put(self, content: bytes, media_type: str) -> str:
+        """Store bytes with the configured backend and return a reference (blocking)"""
+        return self.backend.put(content, media_type)
+
+    def get(self, ref: str) -> bytes:
+        """Read the bytes behind a reference (blocking)"""
+        return self._for(ref).get(ref)
+
+    def image_url(self, ref: str, media_type: str) -> str:
+        """URL (remote or data:) for a vision request (blocking)"""
+        return self._for(ref).image_url(ref, media_type)
+
+    @staticmethod
+    def is_remote(ref: str) -> bool:
+        return not ref.startswith(LOCAL_PREFIX)
+
+
+blob_store = BlobStore()
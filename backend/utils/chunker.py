@@ -0,0 +1,207 @@
+import os
+import re
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+
+# Chunk size and overlap in (estimated) model tokens
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+# Word pieces and punctuation - close to BPE token counts for English text
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+PARAGRAPH_BREAK = re.compile(r"\n[ \t\r\f\v]*\n\s*")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+
+class Chunk(NamedTuple):
+    """One chunk of a document"""
+    index: int
+    text: str
+    page: Optional[int] = None  # 1-based page the chunk starts on (PDFs)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of model tokens in a text"""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def iter_sentences(text: str) -> Iterator[Tuple[str, bool]]:
+    """
+    Yield (sentence, ends_paragraph) pairs without copying the whole text
+
+    Paragraphs are separated by blank lines; inside a paragraph, line
+    breaks are folded into spaces.
+    """
+    def paragraph_sentences(paragraph: str):
+        sentences = [" ".join(sentence.split()) for sentence in SENTENCE_BREAK.split(paragraph)]
+        sentences = [sentence for sentence in sentences if sentence]
+        for position, sentence in enumerate(sentences):
+            yield sentence, position == len(sentences) - 1
+
+    start = 0
+    for paragraph_break in PARAGRAPH_BREAK.finditer(text):
+        yield from paragraph_sentences(text[start:paragraph_break.start()])
+        start = paragraph_break.end()
+    yield from paragraph_sentences(text[start:])
+
+
+def split_long_sentence(sentence: str, max_tokens: int) -> Iterator[str]:
+    """Split a sentence that alone exceeds the budget on word boundaries"""
+    words: List[str] = []
+    tokens = 0
+    for word in sentence.split(" "):
+        word_tokens = estimate_tokens(word)
+        if words and tokens + word_tokens > max_tokens:
+            yield " ".join(words)
+            words, tokens = [], 0
+        words.append(word)
+        tokens += word_tokens
+    if words:
+        yield " ".join(words)
+
+
+class Chunker:
+    """
+    Incremental chunking on sentence and paragraph boundaries
+
+    Segments are added one at a time and the chunks they complete are
+    returned right away, so a document can be chunked while later pages
+    are still being extracted. finish() returns the last chunk.
+    """
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        # Current chunk as (sentence, tokens, page, ends_paragraph) units
+        self.units: List[Tuple[str, int, Optional[int], bool]] = []
+        self.unit_tokens = 0
+        self.index = 0
+        self.has_new_text = False
+
+    def build_text(self) -> str:
+        parts = []
+        for position, (sentence, _, _, ends_paragraph) in enumerate(self.units):
+            parts.append(sentence)
+            if position < len(self.units) - 1:
+                parts.append("\n\n" if ends_paragraph else " ")
+        return "".join(parts)
+
+    def add(self, page: Optional[int], text: str) -> Iterator[Chunk]:
+        """Add one segment (a PDF page, or a whole document); yields the chunks it completes"""
+        max_tokens = self.max_tokens
+        for sentence, ends_paragraph in iter_sentences(text):
+            tokens = estimate_tokens(sentence)
+            pieces = [(sentence, tokens)] if tokens <= max_tokens else [
+                (piece, estimate_tokens(piece)) for piece in split_long_sentence(sentence, max_tokens)
+            ]
+
+            for position, (piece, piece_tokens) in enumerate(pieces):
+                if self.units and self.unit_tokens + piece_tokens > max_tokens:
+                    yield Chunk(self.index, self.build_text(), self.units[0][2])
+                    self.index += 1
+                    self.has_new_text = False
+
+                    # Carry trailing sentences over as overlap
+                    kept: List[Tuple[str, int, Optional[int], bool]] = []
+                    kept_tokens = 0
+                    for unit in reversed(self.units):
+                        if kept_tokens + unit[1] > self.overlap_tokens or kept_tokens + unit[1] + piece_tokens > max_tokens:
+                            break
+                        kept.insert(0, unit)
+                        kept_tokens += unit[1]
+                    self.units, self.unit_tokens = kept, kept_tokens
+
+                is_last_piece = position == len(pieces) - 1
+                self.units.append((piece, piece_tokens, page, ends_paragraph and is_last_piece))
+                self.unit_tokens += piece_tokens
+                self.has_new_text = True
+
+    def finish(self) -> Iterator[Chunk]:
+        """Yield the last, partly filled chunk (if it has text not already emitted)"""
+        if self.units and self.has_new_text:
+            yield Chunk(self.index, self.build_text(), self.units[0][2])
+            self.index += 1
+            self.has_new_text = False
+
+
+def iter_chunks(
+    segments: Iterable[Tuple[Optional[int], str]],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+) -> Iterator[Chunk]:
+    """
+    Lazily chunk a document on sentence and paragraph boundaries
+
+    Args:
+        segments: (page_number, text) pairs - PDF pages, or a single
+            (None, text) pair for other documents
+        max_tokens: token budget per chunk
+        overlap_tokens: tokens of trailing sentences repeated at the start
+            of the next chunk
+
+    Yields:
+        Chunk(index, text, page) in document order
+    """
+    chunker = Chunker(max_tokens, overlap_tokens)
+    for page, text in segments:
+        yield from chunker.add(page, text)
+    yield from chunker.finish()
+
+
+def chunk_text(text: str, **kwargs) -> Iterator[Chunk]:
+    """Lazily chunk a plain text document"""
+    return iter_chunks([(None, text)], **kwargs)
+
+
+def chunk_pages(pages: Iterable[str], **kwargs) -> Iterator[Chunk]:
+    """Lazily chunk PDF pages, keeping 1-based page numbers"""
+    return iter_chunks(enumerate(pages, start=1), **kwargs)
+
+
+async def achunk_pages(
+    pages: AsyncIterable[str],
+    on_done: Optional[Callable[[float], None]] = None,
+    **kwargs
+) -> AsyncIterator[Chunk]:
+    """
+    chunk_pages for pages that arrive over time
+
+    Chunks are yielded as soon as they are complete. on_done receives the
+    seconds spent chunking (not waiting for pages) once all are chunked.
+    """
+    chunker = Chunker(**kwargs)
+    page_number = 0
+    elapsed = 0.0
+
+    def timed(chunks: Iterator[Chunk]) -> Iterator[Chunk]:
+        nonlocal elapsed
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            elapsed += time.perf_counter() - start
+            if chunk is None:
+                return
+            yield chunk
+
+    async for text in pages:
+        page_number += 1
+        for chunk in timed(chunker.add(page_number, text)):
+            yield chunk
+    for chunk in timed(chunker.finish()):
+        yield chunk
+    if on_done is not None:
+        on_done(elapsed)
+
+
+async def aiter_chunks(chunks: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    """Iterate a sync or an async chunk source alike"""
+    if hasattr(chunks, "__aiter__"):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        for chunk in chunks:
+            yield chunk
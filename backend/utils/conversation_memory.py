@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+from utils.chunker import TOKEN_PATTERN, estimate_tokens
+
+
+logger = logging.getLogger(__name__)
+
+# Tokens of recent turns sent verbatim with a chat question
+MEMORY_WINDOW_TOKENS = int(os.getenv("MEMORY_WINDOW_TOKENS", "1500"))
+# Upper bound on recent messages, whatever their size
+MEMORY_WINDOW_MESSAGES = int(os.getenv("MEMORY_WINDOW_MESSAGES", "20"))
+# Older messages folded into the summary per summarization call
+MEMORY_SUMMARY_BATCH_TOKENS = int(os.getenv("MEMORY_SUMMARY_BATCH_TOKENS", "3000"))
+# Summarization calls per background refresh (later turns continue the backlog)
+MEMORY_SUMMARY_MAX_STEPS = int(os.getenv("MEMORY_SUMMARY_MAX_STEPS", "3"))
+# Words the summary is asked to stay within
+MEMORY_SUMMARY_WORDS = int(os.getenv("MEMORY_SUMMARY_WORDS", "250"))
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain the running summary of a conversation between a user and an AI assistant. "
+    "Update the current summary with the new messages. Keep facts, names, numbers, decisions, "
+    "the user's preferences and open questions; drop greetings and small talk. "
+    f"Reply with the updated summary only, in at most {MEMORY_SUMMARY_WORDS} words."
+)
+
+# (messages) -> summary text; the controller passes its model call
+Summarize = Callable[[list], Awaitable[str]]
+
+
+class Memory(NamedTuple):
+    """What a question is sent with: the summary of older turns and recent messages"""
+    summary: Optional[str]
+    messages: List[dict]  # {"role", "content"}, oldest first
+    needs_refresh: bool   # unsummarized messages fell out of the window
+
+
+def role_name(role) -> str:
+    return getattr(role, "value", role)
+
+
+def fit_window(rows_newest_first: List[dict]) -> List[dict]:
+    """
+    Newest messages that fit the token budget, oldest first
+
+    The window never starts with an assistant message, so the model
+    doesn't see an answer without its question.
+    """
+    window = []
+    tokens = 0
+    for row in rows_newest_first[:MEMORY_WINDOW_MESSAGES]:
+        row_tokens = estimate_tokens(row["content"])
+        if tokens + row_tokens > MEMORY_WINDOW_TOKENS:
+            break
+        window.append(row)
+        tokens += row_tokens
+
+    window.reverse()
+    while window and role_name(window[0]["role"]) != "user":
+        window.pop(0)
+    return window
+
+
+def storage_helpers():
+    """(ConversationDB, MessageDB) of the configured backend (imported late to avoid cycles)"""
+    from lib.Database_config import DB_ENABLED
+    if DB_ENABLED:
+        from utils.database_utils import ConversationDB, MessageDB
+    else:
+        from utils.memory_store import ConversationDB, MessageDB
+    return ConversationDB, MessageDB
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut a text after roughly max_tokens (keeps the beginning)"""
+    for position, match in enumerate(TOKEN_PATTERN.finditer(text)):
+        if position == max_tokens:
+            return text[:match.start()].rstrip() + " …"
+    return text
+
+
+class ConversationMemory:
+    """
+    Token-budgeted conversation memory
+
+    A question is sent with the conversation's cached summary plus the
+    most recent turns that fit MEMORY_WINDOW_TOKENS, so the prompt stays
+    bounded however long the conversation runs. Turns that drop out of
+    the window are folded into the summary by a background task after the
+    answer is saved - never on the request path. Until that catches up
+    they are simply left out.
+    """
+
+    def __init__(self):
+        self._refreshing: dict = {}  # conversation id -> task
+
+    async def load(self, db, conversation) -> Memory:
+        """Summary and recent window for a conversation (one indexed query)"""
+        _, MessageDB = storage_helpers()
+
+        rows = await MessageDB.get_memory_messages(
+            db, conversation.id,
+            after_id=conversation.summary_message_id or 0,
+            limit=MEMORY_WINDOW_MESSAGES + 1
+        )
+        window = fit_window(rows)
+        return Memory(
+            summary=conversation.summary,
+            messages=[{"role": role_name(row["role"]), "content": row["content"]} for row in window],
+            needs_refresh=len(window) < len(rows)
+        )
+
+    @staticmethod
+    def build_messages(system_prompt: str, memory: Memory, question: str) -> list:
+        """Model messages: system prompt, summary, recent turns, question"""
+        messages = [{"role": "system", "content": system_prompt}]
+        if memory.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{memory.summary}"
+            })
+        messages.extend(memory.messages)
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    def schedule_refresh(self, conversation_id: int, summarize: Summarize):
+        """Fold older turns into the summary in the background (one task per conversation)"""
+        task = self._refreshing.get(conversation_id)
+        if task is not None and not task.done():
+            return
+
+        task = asyncio.create_task(self._refresh_safely(conversation_id, summarize))
+        self._refreshing[conversation_id] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(conversation_id, None))
+
+    async def _refresh_safely(self, conversation_id: int, summarize: Summarize):
+        try:
+            steps = await self.refresh(conversation_id, summarize)
+            if steps:
+                logger.info("Conversation summary refreshed", extra={"conversation_id": conversation_id, "steps": steps})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Summary refresh failed", extra={"conversation_id": conversation_id, "error": str(e)})
+
+    async def refresh(self, conversation_id: int, summarize: Summarize) -> int:
+        """
+        Fold messages older than the current window into the summary
+
+        Each step summarizes at most MEMORY_SUMMARY_BATCH_TOKENS of new
+        messages together with the previous summary, so the summarizer's
+        prompt is bounded too. The connection is released while the model
+        runs. Returns the number of steps taken.
+        """
+        from lib.Database_config import AsyncSessionLocal
+        ConversationDB, MessageDB = storage_helpers()
+
+        steps = 0
+        while steps < MEMORY_SUMMARY_MAX_STEPS:
+            async with AsyncSessionLocal() as db:
+                summary, summarized_id = await ConversationDB.get_summary(db, conversation_id)
+                recent = await MessageDB.get_memory_messages(
+                    db, conversation_id, after_id=summarized_id, limit=MEMORY_WINDOW_MESSAGES + 1
+                )
+                window = fit_window(recent)
+                if len(window) == len(recent):
+                    return steps
+                window_start = window[0]["id"] if window else recent[0]["id"] + 1
+
+                older = await MessageDB.get_memory_messages(
+                    db, conversation_id, after_id=summarized_id, before_id=window_start,
+                    limit=MEMORY_WINDOW_MESSAGES * 4, newest_first=False
+                )
+            # The session is closed - no connection is held during the model call
+
+            batch = []
+            tokens = 0
+            for row in older:
+                content = truncate_tokens(row["content"], MEMORY_SUMMARY_BATCH_TOKENS)
+                row_tokens = estimate_tokens(content)
+                if batch and tokens + row_tokens > MEMORY_SUMMARY_BATCH_TOKENS:
+                    break
+                batch.append((row["id"], role_name(row["role"]), content))
+                tokens += row_tokens
+            if not batch:
+                return steps
+
+            transcript = "\n\n".join(
+                f"{'User' if role == 'user' else 'Assistant'}: {content}" for _, role, content in batch
+            )
+            new_summary = await summarize([
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {
+                    "role": "user",
+                    "content": f"Current summary:\n{summary or '(none yet)'}\n\nNew messages:\n{transcript}"
+                }
+            ])
+
+            async with AsyncSessionLocal() as db:
+                saved = await ConversationDB.save_summary(
+                    db, conversation_id, new_summary.strip(), batch[-1][0], summarized_id
+                )
+                await db.commit()
+            if not saved:
+                # Another refresh moved the summary on
+                return steps
+            steps += 1
+
+        return steps
+
+    async def shutdown(self):
+        """Cancel pending refreshes (they are redone after the next turn)"""
+        tasks = [task for task in self._refreshing.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+conversation_memory = ConversationMemory()
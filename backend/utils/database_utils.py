@@ -1,113 +1,363 @@
+from sqlalchemy import func, select, insert, update, delete, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from models.database_models import Conversation, Message, File, Context, MessageRole, FileType
-from typing import Optional, List
+from models.database_models import Conversation, Message, File, Document, DocumentChunk, Context, MessageRole, FileType, utcnow
+from utils.lexical_index import BM25Index, lexical_indexes, RETRIEVAL_TOP_K
+from utils.vector_index import vector_indexes
+from utils.chunker import Chunk, aiter_chunks
+from datetime import datetime
+from typing import Optional, List, Callable, Iterable, Iterator, AsyncIterable, AsyncIterator, NamedTuple, Tuple, Union
+import base64
+import hashlib
+import json
 import uuid
 
 
+# Helpers take an AsyncSession and are awaited from the request path. Write
+# helpers stage their changes with flush() and never commit: the caller owns
+# the transaction and commits once per request (one unit of work).
+# DocumentDB.create_document is the exception: it commits chunk batches as
+# they are produced, so a large upload never holds one long transaction.
+# The few helpers that take a sync Session are for worker threads only.
+
+# Chunk rows written per bulk INSERT/COPY while consuming a chunk stream
+CHUNK_BATCH_SIZE = 1000
+# Upper bound for one page of a listing
+MAX_PAGE_SIZE = 200
+# Messages fetched per round-trip when exporting a history
+HISTORY_BATCH_SIZE = 500
+
+
+class ChunkSource(NamedTuple):
+    """Where a conversation's chunks are stored"""
+    key: Union[int, str]  # key of the BM25/vector indexes: conversation id or DocumentDB.index_key
+    version: tuple  # (chunk count, ...) - changes whenever the chunks do
+    document_id: Optional[int]  # shared document, or None for the conversation's own contexts rows
+
+
+def encode_cursor(*values) -> str:
+    """Opaque, URL-safe pagination cursor from the sort key of the last row"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
 class ConversationDB:
     """Database operations for conversations"""
     
     @staticmethod
-    def create_conversation(db: Session, title: str = "New Conversation") -> Conversation:
-        """Create a new conversation"""
+    async def create_conversation(db: AsyncSession, title: str = "New Conversation") -> Conversation:
+        """Create a new conversation (flushed, so its id is set)"""
         conversation = Conversation(
             session_id=str(uuid.uuid4()),
             title=title
         )
         db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
+        await db.flush()
         return conversation
     
     @staticmethod
-    def get_conversation(db: Session, session_id: str) -> Optional[Conversation]:
+    async def get_conversation(db: AsyncSession, session_id: str) -> Optional[Conversation]:
         """Get conversation by session_id"""
-        return db.query(Conversation).filter(Conversation.session_id == session_id).first()
+        result = await db.execute(select(Conversation).where(Conversation.session_id == session_id))
+        return result.scalars().first()
     
     @staticmethod
-    def get_or_create_conversation(db: Session, session_id: Optional[str] = None) -> Conversation:
+    async def get_or_create_conversation(db: AsyncSession, session_id: Optional[str] = None) -> Conversation:
         """Get existing conversation or create new one"""
         if session_id:
-            conversation = ConversationDB.get_conversation(db, session_id)
+            conversation = await ConversationDB.get_conversation(db, session_id)
             if conversation:
                 return conversation
         
         # Create new conversation
-        return ConversationDB.create_conversation(db)
+        return await ConversationDB.create_conversation(db)
     
     @staticmethod
-    def get_all_conversations(db: Session, limit: int = 50) -> List[Conversation]:
-        """Get all conversations"""
-        return db.query(Conversation).order_by(Conversation.updated_at.desc()).limit(limit).all()
+    async def list_conversations(
+        db: AsyncSession,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        One page of conversations, most recently active first
+        
+        Keyset pagination on (updated_at, id) served by an index, so a page
+        costs the same however deep it is. Message counts come from the
+        maintained counter column - no messages are loaded.
+        
+        Returns (rows, next_cursor); next_cursor is None on the last page.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = select(
+            Conversation.id,
+            Conversation.session_id,
+            Conversation.title,
+            Conversation.created_at,
+            Conversation.updated_at,
+            Conversation.message_count
+        ).where(Conversation.updated_at.is_not(None))
+        
+        if cursor:
+            values = decode_cursor(cursor)
+            try:
+                after_updated_at = datetime.fromisoformat(values[0])
+                after_id = int(values[1])
+            except (IndexError, TypeError, ValueError):
+                raise ValueError("Invalid cursor")
+            query = query.where(or_(
+                Conversation.updated_at < after_updated_at,
+                and_(Conversation.updated_at == after_updated_at, Conversation.id < after_id)
+            ))
+        
+        result = await db.execute(
+            query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1)
+        )
+        rows = result.mappings().all()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"])
+        return [dict(row) for row in rows], next_cursor
     
     @staticmethod
-    def delete_conversation(db: Session, session_id: str) -> bool:
+    async def get_summary(db: AsyncSession, conversation_id: int) -> Tuple[Optional[str], int]:
+        """Get (summary, id of the last message folded into it)"""
+        result = await db.execute(
+            select(Conversation.summary, Conversation.summary_message_id)
+            .where(Conversation.id == conversation_id)
+        )
+        row = result.first()
+        return (row[0], row[1]) if row else (None, 0)
+    
+    @staticmethod
+    async def save_summary(
+        db: AsyncSession,
+        conversation_id: int,
+        summary: str,
+        message_id: int,
+        previous_message_id: int
+    ) -> bool:
+        """
+        Stage a new summary covering messages up to message_id
+        
+        Only applies if the summary still covers previous_message_id, so a
+        concurrent refresh can't be overwritten by an older one. Returns
+        whether the summary was saved.
+        """
+        result = await db.execute(
+            update(Conversation)
+            .where(
+                Conversation.id == conversation_id,
+                Conversation.summary_message_id == previous_message_id
+            )
+            # A summary is not activity: keep updated_at as it is
+            .values(summary=summary, summary_message_id=message_id, updated_at=Conversation.updated_at)
+        )
+        return result.rowcount == 1
+    
+    @staticmethod
+    async def delete_conversation(db: AsyncSession, session_id: str) -> bool:
         """Delete a conversation"""
-        conversation = ConversationDB.get_conversation(db, session_id)
+        conversation = await ConversationDB.get_conversation(db, session_id)
         if conversation:
-            db.delete(conversation)
-            db.commit()
+            await db.delete(conversation)
+            await db.flush()
             return True
         return False
 
 
+# Columns a history page or export needs (no ORM objects)
+HISTORY_COLUMNS = (Message.id, Message.role, Message.content, Message.model_used, Message.created_at)
+
+
 class MessageDB:
     """Database operations for messages"""
     
     @staticmethod
-    def create_message(
-        db: Session,
+    async def create_message(
+        db: AsyncSession,
         conversation_id: int,
         role: MessageRole,
         content: str,
         model_used: Optional[str] = None,
-        mode: Optional[str] = None
+        mode: Optional[str] = None,
+        cached: bool = False
     ) -> Message:
-        """Create a new message"""
+        """Stage a new message (and bump the conversation's counter and activity time)"""
         message = Message(
             conversation_id=conversation_id,
             role=role,
             content=content,
             model_used=model_used,
-            mode=mode
+            mode=mode,
+            cached=cached
         )
         db.add(message)
-        db.commit()
-        db.refresh(message)
+        await MessageDB.bump_conversation(db, conversation_id, 1)
+        await db.flush()
         return message
     
     @staticmethod
-    def get_conversation_messages(
-        db: Session,
+    async def create_turn(
+        db: AsyncSession,
+        conversation_id: int,
+        question: str,
+        answer: str,
+        model_used: Optional[str] = None,
+        mode: Optional[str] = None,
+        cached: bool = False
+    ) -> Tuple[Message, Message]:
+        """Stage a question and its answer together (one flush, one counter update)"""
+        user_message = Message(
+            conversation_id=conversation_id,
+            role=MessageRole.USER,
+            content=question
+        )
+        assistant_message = Message(
+            conversation_id=conversation_id,
+            role=MessageRole.ASSISTANT,
+            content=answer,
+            model_used=model_used,
+            mode=mode,
+            cached=cached
+        )
+        db.add_all([user_message, assistant_message])
+        await MessageDB.bump_conversation(db, conversation_id, 2)
+        await db.flush()
+        return user_message, assistant_message
+    
+    @staticmethod
+    async def bump_conversation(db: AsyncSession, conversation_id: int, added: int):
+        """Maintain the conversation's message counter and activity time"""
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(message_count=Conversation.message_count + added, updated_at=utcnow())
+        )
+    
+    @staticmethod
+    async def get_conversation_messages(
+        db: AsyncSession,
         conversation_id: int,
         limit: Optional[int] = None
     ) -> List[Message]:
         """Get all messages for a conversation"""
-        query = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at)
+        query = select(Message).where(Message.conversation_id == conversation_id).order_by(Message.created_at)
         if limit:
             query = query.limit(limit)
-        return query.all()
+        result = await db.execute(query)
+        return list(result.scalars().all())
     
     @staticmethod
-    def get_recent_messages(
-        db: Session,
+    async def get_history_page(
+        db: AsyncSession,
+        conversation_id: int,
+        limit: int = 50,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None
+    ) -> Tuple[List[dict], bool]:
+        """
+        One page of a conversation's messages in chronological order
+        
+        Keyset pagination on the message id: before_id pages towards older
+        messages, after_id towards newer ones, neither gives the latest page.
+        
+        Returns (rows, has_more) where has_more refers to the paging direction.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = select(*HISTORY_COLUMNS).where(Message.conversation_id == conversation_id)
+        
+        if after_id is not None:
+            query = query.where(Message.id > after_id).order_by(Message.id.asc())
+        else:
+            if before_id is not None:
+                query = query.where(Message.id < before_id)
+            query = query.order_by(Message.id.desc())
+        
+        result = await db.execute(query.limit(limit + 1))
+        rows = [dict(row) for row in result.mappings()]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if after_id is None:
+            rows.reverse()
+        return rows, has_more
+    
+    @staticmethod
+    async def iter_history(db: AsyncSession, conversation_id: int, batch_size: int = HISTORY_BATCH_SIZE) -> AsyncIterator[dict]:
+        """
+        Stream all messages of a conversation, oldest first
+        
+        Rows are fetched in batches of batch_size from a streaming result (a
+        server-side cursor on PostgreSQL), so memory does not grow with the
+        conversation.
+        """
+        result = await db.stream(
+            select(*HISTORY_COLUMNS)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.id.asc())
+            .execution_options(yield_per=batch_size)
+        )
+        try:
+            async for row in result.mappings():
+                yield dict(row)
+        finally:
+            await result.close()
+    
+    @staticmethod
+    async def get_memory_messages(
+        db: AsyncSession,
+        conversation_id: int,
+        after_id: int = 0,
+        before_id: Optional[int] = None,
+        limit: int = 50,
+        newest_first: bool = True
+    ) -> List[dict]:
+        """(id, role, content) of messages with after_id < id < before_id"""
+        query = select(Message.id, Message.role, Message.content)\
+            .where(Message.conversation_id == conversation_id, Message.id > after_id)
+        if before_id is not None:
+            query = query.where(Message.id < before_id)
+        query = query.order_by(Message.id.desc() if newest_first else Message.id.asc())
+        
+        result = await db.execute(query.limit(limit))
+        return [dict(row) for row in result.mappings()]
+    
+    @staticmethod
+    async def get_recent_messages(
+        db: AsyncSession,
         conversation_id: int,
         limit: int = 10
     ) -> List[Message]:
         """Get recent messages for conversation history"""
-        return db.query(Message)\
-            .filter(Message.conversation_id == conversation_id)\
-            .order_by(Message.created_at.desc())\
-            .limit(limit)\
-            .all()[::-1]  # Reverse to get chronological order
+        result = await db.execute(
+            select(Message)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.desc())
+            .limit(limit)
+        )
+        return list(result.scalars().all())[::-1]  # Reverse to get chronological order
 
 
 class FileDB:
     """Database operations for files"""
     
     @staticmethod
-    def create_file(
-        db: Session,
+    async def create_file(
+        db: AsyncSession,
         conversation_id: int,
         filename: str,
         file_type: FileType,
@@ -115,75 +365,415 @@ class FileDB:
         text_content: Optional[str] = None,
         chunks_count: Optional[int] = None,
         is_image: bool = False,
-        image_base64: Optional[str] = None,
-        media_type: Optional[str] = None
+        blob_ref: Optional[str] = None,
+        media_type: Optional[str] = None,
+        document_id: Optional[int] = None,
+        cloudinary_url: Optional[str] = None
     ) -> File:
-        """Create a new file record"""
+        """Stage a new file record"""
         file_record = File(
             conversation_id=conversation_id,
             filename=filename,
             file_type=file_type,
             file_size=file_size,
+            document_id=document_id,
             text_content=text_content,
             chunks_count=chunks_count,
             is_image=is_image,
-            image_base64=image_base64,
-            media_type=media_type
+            blob_ref=blob_ref,
+            media_type=media_type,
+            cloudinary_url=cloudinary_url
         )
         db.add(file_record)
-        db.commit()
-        db.refresh(file_record)
+        await db.flush()
         return file_record
     
     @staticmethod
-    def get_conversation_files(db: Session, conversation_id: int) -> List[File]:
+    async def get_conversation_files(db: AsyncSession, conversation_id: int) -> List[File]:
         """Get all files for a conversation"""
-        return db.query(File).filter(File.conversation_id == conversation_id).all()
+        result = await db.execute(select(File).where(File.conversation_id == conversation_id))
+        return list(result.scalars().all())
     
     @staticmethod
-    def get_latest_file(db: Session, conversation_id: int) -> Optional[File]:
+    async def get_latest_file(db: AsyncSession, conversation_id: int) -> Optional[File]:
         """Get the most recent file for a conversation"""
-        return db.query(File)\
-            .filter(File.conversation_id == conversation_id)\
-            .order_by(File.created_at.desc())\
-            .first()
+        result = await db.execute(
+            select(File)
+            .where(File.conversation_id == conversation_id)
+            .order_by(File.created_at.desc())
+            .limit(1)
+        )
+        return result.scalars().first()
+    
+    @staticmethod
+    async def get_legacy_image(db: AsyncSession, file_id: int) -> Optional[str]:
+        """Load the deferred base64 payload of a file stored before the blob store"""
+        result = await db.execute(select(File.image_base64).where(File.id == file_id))
+        return result.scalar()
 
 
 class ContextDB:
     """Database operations for context chunks"""
     
     @staticmethod
-    def save_chunks(db: Session, conversation_id: int, chunks: List[str]):
-        """Save text chunks for a conversation"""
-        # Delete existing chunks
-        db.query(Context).filter(Context.conversation_id == conversation_id).delete()
+    async def insert_chunk_rows(db: AsyncSession, rows: List[dict], model=Context):
+        """
+        Bulk insert chunk rows (contexts or document_chunks) in the session's transaction
         
-        # Create new chunks
-        for index, chunk_text in enumerate(chunks):
-            context = Context(
-                conversation_id=conversation_id,
-                chunk_index=index,
-                chunk_text=chunk_text
+        Uses COPY on PostgreSQL (asyncpg), otherwise one executemany
+        INSERT - no ORM objects or per-row round-trips either way. Callers
+        have already executed a statement, so the transaction is open.
+        """
+        if not rows:
+            return
+        
+        connection = await db.connection()
+        if connection.dialect.name == "postgresql" and connection.dialect.driver == "asyncpg":
+            columns = list(rows[0].keys())
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                model.__tablename__,
+                records=[tuple(row[column] for column in columns) for row in rows],
+                columns=columns
             )
-            db.add(context)
+        else:
+            await db.execute(insert(model), rows)
+    
+    @staticmethod
+    async def set_document(db: AsyncSession, conversation_id: int, document_id: int) -> int:
+        """
+        Make a stored document the conversation's context
+        
+        The conversation references the document: its chunks and indexes
+        are shared, nothing is copied. Returns the number of chunks.
+        """
+        await ContextDB.clear_chunks(db, conversation_id)
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(context_document_id=document_id)
+        )
+        result = await db.execute(select(Document.chunks_count).where(Document.id == document_id))
+        return result.scalar() or 0
+    
+    @staticmethod
+    async def get_source(db: AsyncSession, conversation_id: int) -> ChunkSource:
+        """Where a conversation's chunks are: its context document, else its own contexts rows"""
+        result = await db.execute(
+            select(Conversation.context_document_id, Document.chunks_count)
+            .outerjoin(Document, Document.id == Conversation.context_document_id)
+            .where(Conversation.id == conversation_id)
+        )
+        row = result.first()
+        if row is not None and row.context_document_id is not None:
+            return DocumentDB.source(row.context_document_id, row.chunks_count)
         
-        db.commit()
+        result = await db.execute(
+            select(func.count(Context.id), func.max(Context.id))
+            .where(Context.conversation_id == conversation_id)
+        )
+        count, max_id = result.one()
+        return ChunkSource(conversation_id, (count, max_id), None)
     
     @staticmethod
-    def get_chunks(db: Session, conversation_id: int, limit: Optional[int] = None) -> List[str]:
+    def chunk_rows(source: ChunkSource, conversation_id: int, *columns: str):
+        """SELECT of the given chunk columns from the rows holding a source's chunks"""
+        if source.document_id is not None:
+            model, condition = DocumentChunk, DocumentChunk.document_id == source.document_id
+        else:
+            model, condition = Context, Context.conversation_id == conversation_id
+        return select(*(getattr(model, column) for column in columns)).where(condition), model
+    
+    @staticmethod
+    async def get_chunks(db: AsyncSession, conversation_id: int, limit: Optional[int] = None) -> List[str]:
         """Get chunks for a conversation"""
-        query = db.query(Context)\
-            .filter(Context.conversation_id == conversation_id)\
-            .order_by(Context.chunk_index)
+        source = await ContextDB.get_source(db, conversation_id)
+        query, model = ContextDB.chunk_rows(source, conversation_id, "chunk_text")
+        query = query.order_by(model.chunk_index)
         
         if limit:
             query = query.limit(limit)
         
-        contexts = query.all()
-        return [ctx.chunk_text for ctx in contexts]
+        result = await db.execute(query)
+        return list(result.scalars().all())
+    
+    @staticmethod
+    async def get_chunks_version(db: AsyncSession, conversation_id: int) -> tuple:
+        """Get (chunk count, version) - changes whenever chunks are replaced"""
+        return (await ContextDB.get_source(db, conversation_id)).version
+    
+    @staticmethod
+    async def get_chunks_by_index(db: AsyncSession, conversation_id: int, chunk_indexes: List[int], source: Optional[ChunkSource] = None) -> List[str]:
+        """Get chunk texts in the order of the given chunk indexes"""
+        if source is None:
+            source = await ContextDB.get_source(db, conversation_id)
+        query, model = ContextDB.chunk_rows(source, conversation_id, "chunk_index", "chunk_text")
+        result = await db.execute(query.where(model.chunk_index.in_(chunk_indexes)))
+        texts = dict(result.all())
+        return [texts[chunk_index] for chunk_index in chunk_indexes if chunk_index in texts]
+    
+    @staticmethod
+    async def load_lexical_index(db: AsyncSession, conversation_id: int) -> Tuple[ChunkSource, Optional[BM25Index]]:
+        """
+        Get (source, BM25 index) of a conversation's chunks
+        
+        Indexes are keyed by source, so every conversation of a document
+        shares one. The index is rebuilt from the table when this worker
+        doesn't have it or the chunks changed. It is None without chunks.
+        """
+        source = await ContextDB.get_source(db, conversation_id)
+        if source.version[0] == 0:
+            lexical_indexes.drop(source.key)
+            return source, None
+        
+        index = lexical_indexes.get(source.key)
+        if index is None or index.version != source.version:
+            query, _ = ContextDB.chunk_rows(source, conversation_id, "chunk_index", "chunk_text")
+            result = await db.execute(query)
+            index = lexical_indexes.build(source.key, result.all(), version=source.version)
+        return source, index
+    
+    @staticmethod
+    def rank_chunks(
+        source: ChunkSource,
+        index: BM25Index,
+        query: str,
+        limit: int = RETRIEVAL_TOP_K,
+        query_vector=None
+    ) -> List[int]:
+        """Chunk indexes most relevant to a question, best first (in memory, no queries)"""
+        candidates = limit * 3
+        rankings = [[chunk_index for chunk_index, _ in index.search(query, candidates)]]
+        
+        if query_vector is not None:
+            vector_index = vector_indexes.get(source.key, source.version)
+            if vector_index is not None:
+                rankings.append(vector_index.search(query_vector, candidates))
+        
+        # Reciprocal rank fusion (k=60)
+        fused: dict[int, float] = {}
+        for ranking in rankings:
+            for rank, chunk_index in enumerate(ranking):
+                fused[chunk_index] = fused.get(chunk_index, 0.0) + 1.0 / (60 + rank)
+        return sorted(fused, key=fused.get, reverse=True)[:limit]
+    
+    @staticmethod
+    async def search_chunks(
+        db: AsyncSession,
+        conversation_id: int,
+        query: str,
+        limit: int = RETRIEVAL_TOP_K,
+        query_vector=None
+    ) -> List[str]:
+        """
+        Get the chunks most relevant to a question, best first
+        
+        Ranks with BM25 and, when a query embedding and an up-to-date vector
+        index exist, fuses both rankings (reciprocal rank fusion). Falls back
+        to the first chunks when nothing matches (e.g. "Summarize this").
+        """
+        source, index = await ContextDB.load_lexical_index(db, conversation_id)
+        if index is None:
+            return []
+        
+        ranked = ContextDB.rank_chunks(source, index, query, limit, query_vector)
+        if not ranked:
+            ranked = list(range(limit))
+        
+        return await ContextDB.get_chunks_by_index(db, conversation_id, ranked, source=source)
+    
+    @staticmethod
+    async def search_chunks_many(
+        db: AsyncSession,
+        conversation_id: int,
+        queries: List[str],
+        limit: int = RETRIEVAL_TOP_K,
+        query_vectors=None
+    ) -> List[List[str]]:
+        """
+        search_chunks for several questions at once
+        
+        The index is loaded once and the texts of every selected chunk are
+        fetched in a single query, however many questions there are.
+        """
+        source, index = await ContextDB.load_lexical_index(db, conversation_id)
+        if index is None:
+            return [[] for _ in queries]
+        
+        rankings = [
+            ContextDB.rank_chunks(
+                source, index, query, limit,
+                None if query_vectors is None else query_vectors[position]
+            )
+            for position, query in enumerate(queries)
+        ]
+        
+        wanted = sorted({chunk_index for ranked in rankings for chunk_index in ranked})
+        if any(not ranked for ranked in rankings):
+            # Questions without a match get the first chunks
+            wanted = sorted(set(wanted) | set(range(limit)))
+        
+        query, model = ContextDB.chunk_rows(source, conversation_id, "chunk_index", "chunk_text")
+        result = await db.execute(query.where(model.chunk_index.in_(wanted)))
+        texts = dict(result.all())
+        first_chunks = [texts[chunk_index] for chunk_index in sorted(texts)[:limit]]
+        return [
+            [texts[chunk_index] for chunk_index in ranked if chunk_index in texts] if ranked else first_chunks
+            for ranked in rankings
+        ]
+    
+    @staticmethod
+    async def clear_chunks(db: AsyncSession, conversation_id: int):
+        """Clear a conversation's context (its own chunks, or the reference to a document)"""
+        await db.execute(delete(Context).where(Context.conversation_id == conversation_id))
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(context_document_id=None)
+        )
+        lexical_indexes.drop(conversation_id)
+        vector_indexes.drop(conversation_id)
+
+
+class DocumentDB:
+    """Database operations for content-addressed documents"""
+    
+    @staticmethod
+    def hash_content(content: bytes) -> str:
+        """SHA-256 hex digest of uploaded bytes"""
+        return hashlib.sha256(content).hexdigest()
     
     @staticmethod
-    def clear_chunks(db: Session, conversation_id: int):
-        """Clear all chunks for a conversation"""
-        db.query(Context).filter(Context.conversation_id == conversation_id).delete()
-        db.commit()
\ No newline at end of file
+    def index_key(document_id: int) -> str:
+        """Key of a document's shared BM25/vector index"""
+        return f"document_{document_id}"
+    
+    @staticmethod
+    def source(document_id: int, chunks_count: int) -> ChunkSource:
+        """The chunks of a stored document (they never change, so the id versions them)"""
+        return ChunkSource(DocumentDB.index_key(document_id), (chunks_count, document_id), document_id)
+    
+    @staticmethod
+    async def get_by_hash(db: AsyncSession, content_hash: str) -> Optional[Document]:
+        """Get a stored document by content hash"""
+        result = await db.execute(select(Document).where(Document.content_hash == content_hash))
+        return result.scalars().first()
+    
+    @staticmethod
+    async def create_document(
+        db: AsyncSession,
+        content_hash: str,
+        file_type: FileType,
+        byte_size: int,
+        chunks: Union[Iterable[Union[Chunk, str]], AsyncIterable[Chunk]],
+        offsets: Optional[List[int]] = None,
+        on_staged: Optional[Callable[[int, BM25Index], None]] = None
+    ) -> Tuple[Document, bool]:
+        """
+        Store a document and its chunks while they are produced (commits)
+        
+        The document row is inserted first under a staging hash, then
+        every CHUNK_BATCH_SIZE chunks are inserted and committed in a short
+        transaction of their own: a slow extraction holds no transaction
+        or lock between batches and only one batch is in memory. The text
+        itself is not kept - conversations only ever read chunks. The last
+        transaction swaps in the real hash, so lookups never find a
+        partial document. offsets (PDF page offsets) may still be filling
+        while chunks are produced.
+        
+        on_staged(document_id, index) is called once the staging row
+        exists, with the BM25 index being built as chunks arrive.
+        
+        Returns (document, created). If another upload stored the same
+        content first, the staged copy is deleted and that document is
+        returned with created=False.
+        """
+        document = Document(
+            content_hash=f"staging-{uuid.uuid4().hex}",
+            file_type=file_type,
+            byte_size=byte_size,
+            text_content="",
+            chunks_count=0
+        )
+        db.add(document)
+        await db.commit()
+        document_id = document.id
+        
+        index = BM25Index()
+        if on_staged is not None:
+            on_staged(document_id, index)
+        
+        try:
+            count = 0
+            batch = []
+            async for chunk in aiter_chunks(chunks):
+                if isinstance(chunk, str):
+                    chunk = Chunk(count, chunk)
+                count += 1
+                
+                batch.append({
+                    "document_id": document_id,
+                    "chunk_index": chunk.index,
+                    "chunk_text": chunk.text,
+                    "page_number": chunk.page
+                })
+                index.add(chunk.index, chunk.text)
+                if len(batch) >= CHUNK_BATCH_SIZE:
+                    await ContextDB.insert_chunk_rows(db, batch, model=DocumentChunk)
+                    await db.commit()
+                    batch = []
+            if batch:
+                await ContextDB.insert_chunk_rows(db, batch, model=DocumentChunk)
+            
+            document.content_hash = content_hash
+            document.chunks_count = count
+            document.page_offsets = None if offsets is None else json.dumps(offsets)
+            await db.commit()
+        except IntegrityError:
+            # The same content was stored meanwhile: keep that copy
+            await db.rollback()
+            await DocumentDB.discard(db, document_id)
+            existing = await DocumentDB.get_by_hash(db, content_hash)
+            if existing is None:
+                raise
+            return existing, False
+        except BaseException:
+            await db.rollback()
+            await DocumentDB.discard(db, document_id)
+            raise
+        
+        source = DocumentDB.source(document_id, count)
+        index.version = source.version
+        lexical_indexes.put(source.key, index)
+        return document, True
+    
+    @staticmethod
+    async def discard(db: AsyncSession, document_id: int):
+        """Delete a staged document and the chunks stored so far (commits)"""
+        await db.execute(delete(DocumentChunk).where(DocumentChunk.document_id == document_id))
+        await db.execute(delete(Document).where(Document.id == document_id))
+        await db.commit()
+    
+    @staticmethod
+    async def get_chunks_by_index(db: AsyncSession, document_id: int, chunk_indexes: List[int]) -> List[str]:
+        """Chunk texts of a document in the given order (missing ones are skipped)"""
+        if not chunk_indexes:
+            return []
+        result = await db.execute(
+            select(DocumentChunk.chunk_index, DocumentChunk.chunk_text)
+            .where(DocumentChunk.document_id == document_id, DocumentChunk.chunk_index.in_(chunk_indexes))
+        )
+        texts = dict(result.all())
+        return [texts[chunk_index] for chunk_index in chunk_indexes if chunk_index in texts]
+    
+    @staticmethod
+    def iter_chunk_batches(db: Session, document_id: int, batch_size: int = CHUNK_BATCH_SIZE) -> Iterator[List[Tuple[int, str]]]:
+        """Stream a document's (chunk_index, chunk_text) rows, batch by batch (sync, for worker threads)"""
+        result = db.execute(
+            select(DocumentChunk.chunk_index, DocumentChunk.chunk_text)
+            .where(DocumentChunk.document_id == document_id)
+            .order_by(DocumentChunk.chunk_index)
+            .execution_options(yield_per=batch_size)
+        )
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+from utils.metrics import metrics, EXTRACTION_PENDING, STAGE_LATENCY
+
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for CPU-heavy parsing (PyPDF2, python-docx)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 2)))
+# Seconds a request waits for one extraction job
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "60"))
+# Jobs running or queued at once; extra uploads are rejected instead of piling up
+EXTRACTION_MAX_PENDING = int(os.getenv("EXTRACTION_MAX_PENDING", "32"))
+
+
+class ExtractionQueueFull(Exception):
+    """Raised when the extraction pool already has too many pending jobs"""
+
+
+class ExtractionTimeout(Exception):
+    """Raised when an extraction job does not finish within its timeout"""
+
+
+class ExtractionPool:
+    """
+    Process pool for document text extraction
+
+    Parsing runs in worker processes so it never blocks the event loop and
+    spreads across cores. A job counts against max_pending until its worker
+    actually finishes - a timed-out job that is still parsing keeps its slot,
+    so stuck documents can't pile up unbounded work behind the cap.
+    """
+
+    def __init__(self, workers: int, timeout: float, max_pending: int):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs running or waiting for a worker"""
+        return self._pending
+
+    def start(self) -> ProcessPoolExecutor:
+        """Create the worker processes (idempotent)"""
+        if self._executor is None:
+            # spawn: forking a process that already runs the event loop and
+            # DB pool threads is not safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info("Extraction pool started", extra={"workers": self.workers})
+        return self._executor
+
+    async def warm(self, fn: Callable):
+        """Spawn the workers and run fn in each (e.g. to import the parsers ahead of the first upload)"""
+        executor = self.start()
+        # Submitted together, each job gets a worker of its own (not timed as extractions)
+        await asyncio.gather(*(asyncio.wrap_future(executor.submit(fn)) for _ in range(self.workers)))
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _release(self, _future):
+        # Done callbacks run on the executor's management thread
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """
+        Run fn(*args) in a worker process
+
+        Raises:
+            ExtractionQueueFull: max_pending jobs are already in flight
+            ExtractionTimeout: the job did not finish in time
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ExtractionQueueFull(
+                    f"Extraction queue is full ({self.max_pending} pending jobs)"
+                )
+            self._pending += 1
+
+        try:
+            future = self.start().submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            # Includes the wait for a free worker
+            with STAGE_LATENCY.time(stage="extract"):
+                return await asyncio.wait_for(
+                    asyncio.wrap_future(future),
+                    timeout=timeout or self.timeout
+                )
+        except asyncio.TimeoutError:
+            raise ExtractionTimeout(
+                f"Extraction did not finish within {timeout or self.timeout:.0f}s"
+            )
+
+
+extraction_pool = ExtractionPool(
+    workers=EXTRACTION_WORKERS,
+    timeout=EXTRACTION_TIMEOUT,
+    max_pending=EXTRACTION_MAX_PENDING
+)
+metrics.on_collect(lambda: EXTRACTION_PENDING.set(extraction_pool.pending))
@@ -0,0 +1,268 @@
+"""
+Background ingestion of uploaded documents
+
+An upload only hands its bytes to a job here and returns the job id;
+extraction, chunking, storing and embedding run in a bounded number of
+background workers, so upload latency no longer depends on document size.
+
+Jobs of one conversation run one after another, in upload order (the
+last upload is the conversation's context, as before). While a job runs
+its chunks are stored batch by batch and indexed as they arrive, so a
+question asked meanwhile can be answered from the pages processed so far. Jobs live in this worker
+process: finished ones are kept for INGESTION_JOB_TTL seconds for status
+polling, unfinished ones are lost on restart.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterable, Awaitable, Callable, Dict, List, Optional
+
+from utils.chunker import Chunk, aiter_chunks
+from utils.lexical_index import BM25Index, RETRIEVAL_TOP_K
+from utils.metrics import metrics, STAGE_LATENCY
+
+
+logger = logging.getLogger(__name__)
+
+# Upload jobs run in the background (false: uploads are ingested inline, as before)
+INGESTION_ASYNC = os.getenv("INGESTION_ASYNC", "true").lower() == "true"
+# Jobs extracting/indexing at once, and jobs accepted but not finished
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_MAX_PENDING = int(os.getenv("INGESTION_MAX_PENDING", "64"))
+# Seconds a question waits for its conversation's running job before
+# it is answered from the chunks processed so far
+INGESTION_WAIT_SECONDS = float(os.getenv("INGESTION_WAIT_SECONDS", "5"))
+# Finished jobs kept for status requests: seconds, and at most this many
+INGESTION_JOB_TTL = int(os.getenv("INGESTION_JOB_TTL", "3600"))
+INGESTION_MAX_JOBS = int(os.getenv("INGESTION_MAX_JOBS", "1000"))
+
+INGESTION_JOBS = metrics.gauge("chatbot_ingestion_jobs", "Upload ingestion jobs by status", ("status",))
+
+QUEUED, EXTRACTING, INDEXING, DONE, FAILED = "queued", "extracting", "indexing", "done", "failed"
+STATUSES = (QUEUED, EXTRACTING, INDEXING, DONE, FAILED)
+
+
+class IngestionQueueFull(Exception):
+    """Raised when too many uploads are already waiting to be ingested"""
+
+
+class IngestionJob:
+    """One uploaded document on its way into a conversation's context"""
+
+    def __init__(self, conversation_id: int, session_id: str, filename: str, file_type, content: bytes):
+        self.id = uuid.uuid4().hex
+        self.conversation_id = conversation_id
+        self.session_id = session_id
+        self.filename = filename
+        self.file_type = file_type
+        self.size_bytes = len(content)
+        self.content: Optional[bytes] = content  # dropped once the job ends
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.pages_done = 0
+        self.chunks_done = 0
+        self.chunks_count: Optional[int] = None
+        self.deduplicated: Optional[bool] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.finished = asyncio.Event()
+        # The document being stored and its growing BM25 index, for
+        # questions asked before the job is done (texts stay in the database)
+        self.document_id: Optional[int] = None
+        self._index: Optional[BM25Index] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def page_done(self):
+        self.pages_done += 1
+
+    def staged(self, document_id: int, index: BM25Index):
+        """DocumentDB.create_document started storing the job's document"""
+        self.document_id = document_id
+        self._index = index
+
+    async def track(self, chunks: AsyncIterable[Chunk]):
+        """Pass chunks through, counting them"""
+        async for chunk in aiter_chunks(chunks):
+            self.chunks_done += 1
+            yield chunk
+
+    def search(self, query: str, limit: int = RETRIEVAL_TOP_K) -> List[int]:
+        """Indexes of the chunks seen so far most relevant to a question (the first ones if none match)"""
+        if self._index is None:
+            return []
+        hits = [chunk_index for chunk_index, _ in self._index.search(query, limit)]
+        return hits or list(range(min(limit, len(self._index))))
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for the job to end; returns whether it did"""
+        try:
+            await asyncio.wait_for(self.finished.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.done
+
+    def _finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self.content = None
+        self._index = None
+        self.finished.set()
+
+    def snapshot(self) -> dict:
+        """JSON status of the job"""
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "session_id": self.session_id,
+            "filename": self.filename,
+            "status": self.status,
+            "size_bytes": self.size_bytes,
+            "pages_done": self.pages_done,
+            "chunks_done": self.chunks_done,
+            "chunks_count": self.chunks_count,
+            "deduplicated": self.deduplicated,
+            "error": self.error,
+            "queued_seconds": round((self.started or end) - self.created, 3),
+            "elapsed_seconds": round(end - self.created, 3)
+        }
+
+
+IngestFn = Callable[[IngestionJob], Awaitable[None]]
+
+
+class IngestionQueue:
+    """
+    Bounded background worker pool for upload jobs
+
+    At most `workers` jobs ingest at once and at most `max_pending` are
+    accepted before uploads are refused (IngestionQueueFull) - the bytes
+    of pending jobs are held in memory until their turn.
+    """
+
+    def __init__(self, workers: int, max_pending: int, job_ttl: int, max_jobs: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._latest: Dict[int, IngestionJob] = {}  # conversation id -> last submitted job
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Jobs accepted and not finished"""
+        return len(self._tasks)
+
+    def submit(self, job: IngestionJob, ingest: IngestFn) -> IngestionJob:
+        """
+        Start ingest(job) in the background (returns at once)
+
+        ingest does the work and sets chunks_count/deduplicated; the job
+        is marked done when it returns and failed when it raises.
+
+        Raises:
+            IngestionQueueFull: max_pending jobs are already unfinished
+        """
+        if self._slots is None:
+            # Created on first use, inside the running event loop
+            self._slots = asyncio.Semaphore(self.workers)
+
+        with self._lock:
+            self._prune()
+            if len(self._tasks) >= self.max_pending:
+                raise IngestionQueueFull(
+                    f"Ingestion queue is full ({self.max_pending} pending uploads)"
+                )
+            previous = self._latest.get(job.conversation_id)
+            self._jobs[job.id] = job
+            self._latest[job.conversation_id] = job
+
+        task = asyncio.create_task(self._run(job, ingest, previous))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        logger.info("Ingestion job queued", extra={"job_id": job.id, "conversation_id": job.conversation_id, "file_name": job.filename, "size_bytes": job.size_bytes})
+        return job
+
+    async def _run(self, job: IngestionJob, ingest: IngestFn, previous: Optional[IngestionJob]):
+        try:
+            if previous is not None and not previous.done:
+                # Uploads of one conversation are applied in order
+                await previous.finished.wait()
+            async with self._slots:
+                job.started = time.time()
+                STAGE_LATENCY.observe(job.started - job.created, stage="ingest_wait")
+                job.status = EXTRACTING
+                with STAGE_LATENCY.time(stage="ingest"):
+                    await ingest(job)
+        except asyncio.CancelledError:
+            job._finish(FAILED, "Ingestion was interrupted (server shutting down)")
+            raise
+        except Exception as e:
+            # HTTPException carries its message in detail
+            error = getattr(e, "detail", None) or str(e) or type(e).__name__
+            logger.warning("Ingestion job failed", extra={"job_id": job.id, "conversation_id": job.conversation_id, "error": error})
+            job._finish(FAILED, error)
+        else:
+            job._finish(DONE)
+            logger.info("Ingestion job done", extra={"job_id": job.id, "conversation_id": job.conversation_id, "chunks": job.chunks_count, "seconds": round(job.finished_at - job.created, 3)})
+
+    def _prune(self):
+        """Forget finished jobs past their TTL, or the oldest beyond max_jobs (caller holds the lock)"""
+        cutoff = time.time() - self.job_ttl
+        excess = len(self._jobs) - self.max_jobs
+        for job_id, job in list(self._jobs.items()):
+            if not job.done:
+                continue
+            if excess > 0 or job.finished_at < cutoff:
+                del self._jobs[job_id]
+                excess -= 1
+                if self._latest.get(job.conversation_id) is job:
+                    del self._latest[job.conversation_id]
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def latest(self, conversation_id: int) -> Optional[IngestionJob]:
+        """The conversation's most recent job still known to this worker"""
+        return self._latest.get(conversation_id)
+
+    def active(self, conversation_id: int) -> Optional[IngestionJob]:
+        """The conversation's most recent job if it is still queued or running"""
+        job = self._latest.get(conversation_id)
+        return job if job is not None and not job.done else None
+
+    def collect_metrics(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        for job in list(self._jobs.values()):
+            counts[job.status] += 1
+        for status, count in counts.items():
+            INGESTION_JOBS.set(count, status=status)
+
+    async def shutdown(self):
+        """Cancel unfinished jobs (their uploads have to be sent again)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+ingestion_queue = IngestionQueue(
+    workers=INGESTION_WORKERS,
+    max_pending=INGESTION_MAX_PENDING,
+    job_ttl=INGESTION_JOB_TTL,
+    max_jobs=INGESTION_MAX_JOBS
+)
+metrics.on_collect(ingestion_queue.collect_metrics)
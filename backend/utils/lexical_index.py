@@ -0,0 +1,135 @@
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Hashable, Iterable, List, Optional, Tuple
+
+
+# Chunks returned per question
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+# Conversations whose index is kept in memory (least recently used are dropped)
+LEXICAL_INDEX_MAX_CONVERSATIONS = int(os.getenv("LEXICAL_INDEX_MAX_CONVERSATIONS", "256"))
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i if in into is it its me my
+of on or our so that the their them then there these they this to was we were
+what when where which who why will with you your about can do does did
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords or single characters"""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of one document or conversation
+
+    Postings are kept per term, so a query only touches the chunks that
+    contain one of its terms instead of scoring the whole document.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, version: Optional[tuple] = None):
+        self.k1 = k1
+        self.b = b
+        self.version = version  # ChunkSource.version of the chunks the index was built from
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+        self.doc_lengths: dict[int, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def with_version(self, version: Optional[tuple]) -> "BM25Index":
+        """A view of this index tagged with another version (postings are shared)"""
+        view = BM25Index(self.k1, self.b, version=version)
+        view.postings = self.postings
+        view.doc_lengths = self.doc_lengths
+        view.total_length = self.total_length
+        return view
+
+    def add(self, doc_id: int, text: str):
+        """Index one chunk"""
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, []).append((doc_id, tf))
+
+        self.doc_lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> List[Tuple[int, float]]:
+        """Return the top-k (doc_id, score) pairs for a query"""
+        if not self.doc_lengths:
+            return []
+
+        n_docs = len(self.doc_lengths)
+        avg_length = self.total_length / n_docs or 1.0
+        scores: dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+
+            df = len(postings)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class LexicalIndexRegistry:
+    """
+    In-memory BM25 indexes keyed by a document's index key (or a
+    conversation id for chunks of its own)
+
+    Bounded LRU: evicted or missing indexes are rebuilt from the chunk
+    tables on the next question, so the DB stays the source of truth.
+    """
+
+    def __init__(self, max_conversations: int = LEXICAL_INDEX_MAX_CONVERSATIONS):
+        self.max_conversations = max_conversations
+        self._indexes: "OrderedDict[Hashable, BM25Index]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, conversation_id: Hashable, chunks: Iterable[Tuple[int, str]], version: Optional[tuple] = None) -> BM25Index:
+        """Build and register the index for (chunk_index, chunk_text) pairs"""
+        index = BM25Index(version=version)
+        for chunk_index, chunk_text in chunks:
+            index.add(chunk_index, chunk_text)
+        self.put(conversation_id, index)
+        return index
+
+    def put(self, conversation_id: Hashable, index: BM25Index):
+        """Register an index, evicting the least recently used one if full"""
+        with self._lock:
+            self._indexes[conversation_id] = index
+            self._indexes.move_to_end(conversation_id)
+            while len(self._indexes) > self.max_conversations:
+                self._indexes.popitem(last=False)
+
+    def get(self, conversation_id: Hashable) -> Optional[BM25Index]:
+        """Get a conversation's index if it is loaded"""
+        with self._lock:
+            index = self._indexes.get(conversation_id)
+            if index is not None:
+                self._indexes.move_to_end(conversation_id)
+            return index
+
+    def drop(self, conversation_id: Hashable):
+        """Forget a conversation's index"""
+        with self._lock:
+            self._indexes.pop(conversation_id, None)
+
+
+lexical_indexes = LexicalIndexRegistry()
@@ -0,0 +1,823 @@
+"""
+In-process session store for running without a database
+
+Used instead of utils.database_utils when DATABASE_URL is unset. The
+ConversationDB, MessageDB, FileDB, ContextDB and DocumentDB classes below
+have the same methods and signatures as the database helpers, so the
+controller doesn't know which backend it talks to; the `db` argument is a
+lib.Database_config.MemorySession whose commit/rollback do nothing (every
+write applies at once).
+
+State lives in one SessionStore per process:
+- one ConversationRecord per session, with its messages, files and chunks
+  (compact __slots__ records; chunks are shared tuples, not copies)
+- least recently used sessions are evicted beyond MEMORY_STORE_MAX_SESSIONS
+  or MEMORY_STORE_MAX_BYTES, and idle ones after MEMORY_STORE_SESSION_TTL
+- extracted documents are kept (for deduplication) up to
+  MEMORY_STORE_MAX_DOCUMENTS and are evicted first when memory is short
+- a document's chunks are counted once, however many sessions share
+  them, until neither the document nor any session holds them
+
+All access goes through one lock and never awaits while holding it, so it
+is safe from the event loop and from worker threads alike. Nothing
+survives a restart, and every worker process has its own sessions - run a
+single worker (or sticky sessions) in this mode.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from lib.Database_config import MemorySession
+from models.database_models import FileType, MessageRole, utcnow
+from utils import database_utils
+from utils.database_utils import ChunkSource
+from utils.chunker import Chunk, aiter_chunks
+from utils.lexical_index import BM25Index, lexical_indexes, RETRIEVAL_TOP_K
+from utils.metrics import metrics
+from utils.vector_index import vector_indexes
+
+
+logger = logging.getLogger(__name__)
+
+MEMORY_STORE_MAX_SESSIONS = int(os.getenv("MEMORY_STORE_MAX_SESSIONS", "1000"))
+# Approximate size of all stored text (messages, chunks, documents)
+MEMORY_STORE_MAX_BYTES = int(os.getenv("MEMORY_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Sessions idle this long (seconds) are dropped
+MEMORY_STORE_SESSION_TTL = float(os.getenv("MEMORY_STORE_SESSION_TTL", "7200"))
+# Newest messages kept per session (older ones are dropped)
+MEMORY_STORE_MAX_MESSAGES = int(os.getenv("MEMORY_STORE_MAX_MESSAGES", "1000"))
+# Extracted documents kept for deduplicating uploads
+MEMORY_STORE_MAX_DOCUMENTS = int(os.getenv("MEMORY_STORE_MAX_DOCUMENTS", "100"))
+# Newest file records kept per session (only the latest one is the context)
+MEMORY_STORE_MAX_FILES = int(os.getenv("MEMORY_STORE_MAX_FILES", "50"))
+
+# Rough per-record overhead added to the text size
+RECORD_OVERHEAD = 200
+
+SESSIONS = metrics.gauge("chatbot_memory_store_sessions", "Sessions held by the in-memory store")
+STORED_BYTES = metrics.gauge("chatbot_memory_store_bytes", "Approximate size of the in-memory store")
+EVICTIONS = metrics.counter(
+    "chatbot_memory_store_evictions_total", "Sessions and documents dropped by the in-memory store", ("kind", "reason")
+)
+
+
+class MessageRecord:
+    __slots__ = ("id", "role", "content", "model_used", "mode", "cached", "created_at")
+
+    def __init__(self, id: int, role: MessageRole, content: str, model_used: Optional[str] = None,
+                 mode: Optional[str] = None, cached: bool = False):
+        self.id = id
+        self.role = role
+        self.content = content
+        self.model_used = model_used
+        self.mode = mode
+        self.cached = cached
+        self.created_at = utcnow()
+
+    def history_row(self) -> dict:
+        return {
+            "id": self.id,
+            "role": self.role,
+            "content": self.content,
+            "model_used": self.model_used,
+            "created_at": self.created_at
+        }
+
+
+class FileRecord:
+    __slots__ = (
+        "id", "filename", "file_type", "file_size", "chunks_count", "is_image",
+        "blob_ref", "media_type", "document_id", "cloudinary_url", "created_at"
+    )
+
+    def __init__(self, id: int, filename: str, file_type: FileType, **fields):
+        self.id = id
+        self.filename = filename
+        self.file_type = file_type
+        self.file_size = fields.get("file_size")
+        self.chunks_count = fields.get("chunks_count")
+        self.is_image = fields.get("is_image", False)
+        self.blob_ref = fields.get("blob_ref")
+        self.media_type = fields.get("media_type")
+        self.document_id = fields.get("document_id")
+        self.cloudinary_url = fields.get("cloudinary_url")
+        self.created_at = utcnow()
+
+
+class DocumentRecord:
+    __slots__ = ("id", "content_hash", "file_type", "byte_size", "chunks_count", "chunks", "page_offsets", "size")
+
+    def __init__(self, id: int, content_hash: str, file_type: FileType, byte_size: int, chunks: List[tuple],
+                 page_offsets: Optional[List[int]] = None):
+        self.id = id
+        self.content_hash = content_hash
+        self.file_type = file_type
+        self.byte_size = byte_size
+        self.chunks = chunks  # (chunk_index, chunk_text, page_number)
+        self.page_offsets = page_offsets  # PDFs: where each page starts in the text
+        self.chunks_count = len(chunks)
+        self.size = RECORD_OVERHEAD + sum(len(chunk[1]) for chunk in chunks)
+
+
+class ConversationRecord:
+    __slots__ = (
+        "id", "session_id", "title", "created_at", "updated_at", "message_count",
+        "summary", "summary_message_id", "messages", "files", "chunks", "chunks_version",
+        "document_id", "size", "last_access"
+    )
+
+    def __init__(self, id: int, session_id: str, title: str):
+        self.id = id
+        self.session_id = session_id
+        self.title = title
+        self.created_at = utcnow()
+        self.updated_at = self.created_at
+        self.message_count = 0
+        self.summary: Optional[str] = None
+        self.summary_message_id = 0
+        self.messages: List[MessageRecord] = []  # ascending ids
+        self.files: List[FileRecord] = []
+        self.chunks: List[tuple] = []  # (chunk_index, chunk_text, page_number)
+        self.chunks_version: Optional[int] = None
+        self.document_id: Optional[int] = None  # chunks shared with this document (not in size)
+        self.size = RECORD_OVERHEAD
+        self.last_access = time.monotonic()
+
+
+class SessionStore:
+    """Bounded LRU of conversations plus a small LRU of extracted documents"""
+
+    def __init__(
+        self,
+        max_sessions: int = MEMORY_STORE_MAX_SESSIONS,
+        max_bytes: int = MEMORY_STORE_MAX_BYTES,
+        session_ttl: float = MEMORY_STORE_SESSION_TTL,
+        max_messages: int = MEMORY_STORE_MAX_MESSAGES,
+        max_documents: int = MEMORY_STORE_MAX_DOCUMENTS,
+        max_files: int = MEMORY_STORE_MAX_FILES
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.session_ttl = session_ttl
+        self.max_messages = max_messages
+        self.max_documents = max_documents
+        self.max_files = max_files
+
+        self._sessions: "OrderedDict[str, ConversationRecord]" = OrderedDict()  # LRU order
+        self._by_id: Dict[int, ConversationRecord] = {}
+        self._documents: "OrderedDict[int, DocumentRecord]" = OrderedDict()
+        self._documents_by_hash: Dict[str, int] = {}
+        self._staging: Dict[int, DocumentRecord] = {}  # documents still receiving chunks
+        # document id -> [chunk bytes, holders]: the document record and
+        # every session whose chunks are that document's
+        self._shared: Dict[int, list] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        self._ids = itertools.count(1)
+        # Chunk versions must not repeat across restarts: vector indexes on
+        # disk are matched by (conversation id, version)
+        self._versions = itertools.count(int(time.time() * 1000))
+
+    # ---- bookkeeping (call with the lock held) ----
+
+    def _resize(self, record, delta: int):
+        record.size += delta
+        self._bytes += delta
+
+    def _hold(self, document: DocumentRecord):
+        """Count a document's chunks, once for all holders"""
+        shared = self._shared.get(document.id)
+        if shared is None:
+            shared = self._shared[document.id] = [document.size, 0]
+            self._bytes += document.size
+        shared[1] += 1
+
+    def _release(self, document_id: int):
+        shared = self._shared[document_id]
+        shared[1] -= 1
+        if shared[1] == 0:
+            del self._shared[document_id]
+            self._bytes -= shared[0]
+
+    def _evict_session(self, record: ConversationRecord, reason: str):
+        self._sessions.pop(record.session_id, None)
+        self._by_id.pop(record.id, None)
+        self._bytes -= record.size
+        if record.document_id is not None:
+            self._release(record.document_id)
+        lexical_indexes.drop(record.id)
+        vector_indexes.drop(record.id)
+        EVICTIONS.inc(kind="session", reason=reason)
+
+    def _evict_document(self, document: DocumentRecord, reason: str):
+        self._documents.pop(document.id, None)
+        self._documents_by_hash.pop(document.content_hash, None)
+        self._release(document.id)
+        lexical_indexes.drop(database_utils.DocumentDB.index_key(document.id))
+        EVICTIONS.inc(kind="document", reason=reason)
+
+    def _expire(self):
+        """Drop idle sessions (oldest first, so the scan stops at the first live one)"""
+        cutoff = time.monotonic() - self.session_ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_access > cutoff:
+                break
+            self._evict_session(oldest, "idle")
+
+    def _enforce_limits(self, keep: Optional[ConversationRecord] = None):
+        while len(self._documents) > self.max_documents:
+            self._evict_document(next(iter(self._documents.values())), "count")
+        while self._bytes > self.max_bytes and self._documents:
+            self._evict_document(next(iter(self._documents.values())), "memory")
+        while len(self._sessions) > self.max_sessions:
+            self._evict_session(next(iter(self._sessions.values())), "count")
+        while self._bytes > self.max_bytes and self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest is keep:
+                # The session being written is never dropped for its own write
+                break
+            self._evict_session(oldest, "memory")
+
+    def _touch(self, record: ConversationRecord):
+        record.last_access = time.monotonic()
+        self._sessions.move_to_end(record.session_id)
+
+    # ---- conversations ----
+
+    def create_conversation(self, title: str) -> ConversationRecord:
+        with self._lock:
+            self._expire()
+            record = ConversationRecord(next(self._ids), str(uuid.uuid4()), title)
+            self._sessions[record.session_id] = record
+            self._by_id[record.id] = record
+            self._bytes += record.size
+            self._enforce_limits(keep=record)
+            return record
+
+    def get_by_session(self, session_id: str) -> Optional[ConversationRecord]:
+        with self._lock:
+            self._expire()
+            record = self._sessions.get(session_id)
+            if record is not None:
+                self._touch(record)
+            return record
+
+    def get(self, conversation_id: int) -> Optional[ConversationRecord]:
+        """A conversation by id (None once evicted - writes to it are dropped)"""
+        with self._lock:
+            record = self._by_id.get(conversation_id)
+            if record is not None:
+                self._touch(record)
+            return record
+
+    def conversations(self) -> List[ConversationRecord]:
+        with self._lock:
+            self._expire()
+            return list(self._sessions.values())
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                return False
+            self._evict_session(record, "deleted")
+            return True
+
+    # ---- messages ----
+
+    def add_messages(self, conversation_id: int, messages: List[tuple]) -> List[Optional[MessageRecord]]:
+        """Append (role, content, model_used, mode, cached) messages in order"""
+        with self._lock:
+            record = self.get(conversation_id)
+            if record is None:
+                return [None] * len(messages)
+
+            added = []
+            for role, content, model_used, mode, cached in messages:
+                message = MessageRecord(next(self._ids), role, content, model_used, mode, cached)
+                record.messages.append(message)
+                self._resize(record, RECORD_OVERHEAD + len(content))
+                added.append(message)
+            record.message_count += len(messages)
+            record.updated_at = utcnow()
+
+            overflow = len(record.messages) - self.max_messages
+            if overflow > 0:
+                dropped = record.messages[:overflow]
+                del record.messages[:overflow]
+                self._resize(record, -sum(RECORD_OVERHEAD + len(message.content) for message in dropped))
+
+            self._enforce_limits(keep=record)
+            return added
+
+    def message_range(self, conversation_id: int, after_id: int = 0, before_id: Optional[int] = None) -> List[MessageRecord]:
+        """Messages with after_id < id < before_id, oldest first"""
+        with self._lock:
+            record = self.get(conversation_id)
+            if record is None:
+                return []
+            messages = record.messages
+            start = bisect_right(messages, after_id, key=lambda message: message.id)
+            end = len(messages) if before_id is None else bisect_left(messages, before_id, key=lambda message: message.id)
+            return messages[start:max(start, end)]
+
+    # ---- files ----
+
+    def add_file(self, conversation_id: int, filename: str, file_type: FileType, fields: dict) -> Optional[FileRecord]:
+        with self._lock:
+            record = self.get(conversation_id)
+            if record is None:
+                return None
+            file_record = FileRecord(next(self._ids), filename, file_type, **fields)
+            record.files.append(file_record)
+            self._resize(record, RECORD_OVERHEAD)
+
+            overflow = len(record.files) - self.max_files
+            if overflow > 0:
+                del record.files[:overflow]
+                self._resize(record, -overflow * RECORD_OVERHEAD)
+
+            self._enforce_limits(keep=record)
+            return file_record
+
+    # ---- chunks and documents ----
+
+    def replace_chunks(self, conversation_id: int, chunks: List[tuple],
+                       document: Optional[DocumentRecord] = None) -> Tuple[int, Optional[int]]:
+        """
+        Swap a conversation's chunks; returns the new (count, version)
+
+        With a document, chunks are that document's (shared, counted once).
+        """
+        with self._lock:
+            record = self.get(conversation_id)
+            if record is None:
+                return 0, None
+            if record.document_id is not None:
+                self._release(record.document_id)
+            else:
+                self._resize(record, -sum(len(chunk[1]) for chunk in record.chunks))
+            if document is not None:
+                self._hold(document)
+                record.document_id = document.id
+            else:
+                record.document_id = None
+                self._resize(record, sum(len(chunk[1]) for chunk in chunks))
+            record.chunks = chunks
+            record.chunks_version = next(self._versions) if chunks else None
+            self._enforce_limits(keep=record)
+            return len(chunks), record.chunks_version
+
+    def chunks(self, conversation_id: int) -> Tuple[ChunkSource, List[tuple]]:
+        """(source, chunks) of a conversation - a document's chunks are keyed and versioned by the document"""
+        with self._lock:
+            record = self.get(conversation_id)
+            if record is None or not record.chunks:
+                return ChunkSource(conversation_id, (0, None), None), []
+            if record.document_id is not None:
+                return database_utils.DocumentDB.source(record.document_id, len(record.chunks)), record.chunks
+            return ChunkSource(conversation_id, (len(record.chunks), record.chunks_version), None), record.chunks
+
+    def stage_document(self, file_type: FileType, byte_size: int) -> DocumentRecord:
+        """A document to append chunks to; not found by hash nor counted until add_document"""
+        with self._lock:
+            document = DocumentRecord(next(self._ids), None, file_type, byte_size, [])
+            self._staging[document.id] = document
+        # Ids restart with the process: forget vectors a previous run stored under this one
+        vector_indexes.drop(database_utils.DocumentDB.index_key(document.id))
+        return document
+
+    def discard_document(self, document_id: int):
+        with self._lock:
+            self._staging.pop(document_id, None)
+
+    def add_document(self, document: DocumentRecord, content_hash: str,
+                     page_offsets: Optional[List[int]] = None) -> Tuple[DocumentRecord, bool]:
+        """Publish a staged document, or return the one stored first for the same content"""
+        with self._lock:
+            self._staging.pop(document.id, None)
+            existing = self.get_document_by_hash(content_hash)
+            if existing is not None:
+                return existing, False
+            document.content_hash = content_hash
+            document.page_offsets = page_offsets
+            document.chunks_count = len(document.chunks)
+            document.size = RECORD_OVERHEAD + sum(len(chunk[1]) for chunk in document.chunks)
+            self._documents[document.id] = document
+            self._documents_by_hash[content_hash] = document.id
+            self._hold(document)
+            self._enforce_limits()
+            return document, True
+
+    def get_document(self, document_id: int) -> Optional[DocumentRecord]:
+        """A stored document, or one still being staged"""
+        with self._lock:
+            document = self._documents.get(document_id)
+            if document is not None:
+                self._documents.move_to_end(document_id)
+                return document
+            return self._staging.get(document_id)
+
+    def get_document_by_hash(self, content_hash: str) -> Optional[DocumentRecord]:
+        with self._lock:
+            document_id = self._documents_by_hash.get(content_hash)
+            return None if document_id is None else self.get_document(document_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "documents": len(self._documents),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "session_ttl_seconds": self.session_ttl
+            }
+
+    def collect_metrics(self):
+        with self._lock:
+            self._expire()
+            SESSIONS.set(len(self._sessions))
+            STORED_BYTES.set(self._bytes)
+
+
+session_store = SessionStore()
+metrics.on_collect(session_store.collect_metrics)
+
+
+class ConversationDB:
+    """In-memory conversations (same interface as database_utils.ConversationDB)"""
+
+    @staticmethod
+    async def create_conversation(db: MemorySession, title: str = "New Conversation") -> ConversationRecord:
+        return session_store.create_conversation(title)
+
+    @staticmethod
+    async def get_conversation(db: MemorySession, session_id: str) -> Optional[ConversationRecord]:
+        return session_store.get_by_session(session_id)
+
+    @staticmethod
+    async def get_or_create_conversation(db: MemorySession, session_id: Optional[str] = None) -> ConversationRecord:
+        if session_id:
+            conversation = session_store.get_by_session(session_id)
+            if conversation:
+                return conversation
+        return session_store.create_conversation("New Conversation")
+
+    @staticmethod
+    async def list_conversations(
+        db: MemorySession,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """One page of conversations, most recently active first (same cursors as the database)"""
+        limit = max(1, min(limit, database_utils.MAX_PAGE_SIZE))
+        conversations = sorted(
+            session_store.conversations(),
+            key=lambda conversation: (conversation.updated_at, conversation.id),
+            reverse=True
+        )
+
+        if cursor:
+            values = database_utils.decode_cursor(cursor)
+            try:
+                after = (datetime.fromisoformat(values[0]), int(values[1]))
+            except (IndexError, TypeError, ValueError):
+                raise ValueError("Invalid cursor")
+            conversations = [c for c in conversations if (c.updated_at, c.id) < after]
+
+        page = [
+            {
+                "id": c.id,
+                "session_id": c.session_id,
+                "title": c.title,
+                "created_at": c.created_at,
+                "updated_at": c.updated_at,
+                "message_count": c.message_count
+            }
+            for c in conversations[:limit]
+        ]
+        next_cursor = None
+        if len(conversations) > limit:
+            next_cursor = database_utils.encode_cursor(page[-1]["updated_at"], page[-1]["id"])
+        return page, next_cursor
+
+    @staticmethod
+    async def get_summary(db: MemorySession, conversation_id: int) -> Tuple[Optional[str], int]:
+        conversation = session_store.get(conversation_id)
+        if conversation is None:
+            return None, 0
+        return conversation.summary, conversation.summary_message_id
+
+    @staticmethod
+    async def save_summary(
+        db: MemorySession,
+        conversation_id: int,
+        summary: str,
+        message_id: int,
+        previous_message_id: int
+    ) -> bool:
+        """Set the summary if it still covers previous_message_id (see the database version)"""
+        with session_store._lock:
+            conversation = session_store.get(conversation_id)
+            if conversation is None or conversation.summary_message_id != previous_message_id:
+                return False
+            old_size = len(conversation.summary or "")
+            conversation.summary = summary
+            conversation.summary_message_id = message_id
+            session_store._resize(conversation, len(summary) - old_size)
+            return True
+
+    @staticmethod
+    async def delete_conversation(db: MemorySession, session_id: str) -> bool:
+        return session_store.delete(session_id)
+
+
+class MessageDB:
+    """In-memory messages (same interface as database_utils.MessageDB)"""
+
+    @staticmethod
+    async def create_message(
+        db: MemorySession,
+        conversation_id: int,
+        role: MessageRole,
+        content: str,
+        model_used: Optional[str] = None,
+        mode: Optional[str] = None,
+        cached: bool = False
+    ) -> Optional[MessageRecord]:
+        return session_store.add_messages(conversation_id, [(role, content, model_used, mode, cached)])[0]
+
+    @staticmethod
+    async def create_turn(
+        db: MemorySession,
+        conversation_id: int,
+        question: str,
+        answer: str,
+        model_used: Optional[str] = None,
+        mode: Optional[str] = None,
+        cached: bool = False
+    ) -> Tuple[Optional[MessageRecord], Optional[MessageRecord]]:
+        user_message, assistant_message = session_store.add_messages(conversation_id, [
+            (MessageRole.USER, question, None, None, False),
+            (MessageRole.ASSISTANT, answer, model_used, mode, cached)
+        ])
+        return user_message, assistant_message
+
+    @staticmethod
+    async def get_history_page(
+        db: MemorySession,
+        conversation_id: int,
+        limit: int = 50,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None
+    ) -> Tuple[List[dict], bool]:
+        """One page of messages in chronological order (keyset on the id, like the database)"""
+        limit = max(1, min(limit, database_utils.MAX_PAGE_SIZE))
+        if after_id is not None:
+            messages = session_store.message_range(conversation_id, after_id=after_id)
+            page = messages[:limit]
+        else:
+            messages = session_store.message_range(conversation_id, before_id=before_id)
+            page = messages[-limit:]
+        return [message.history_row() for message in page], len(messages) > limit
+
+    @staticmethod
+    async def iter_history(db: MemorySession, conversation_id: int, batch_size: int = database_utils.HISTORY_BATCH_SIZE) -> AsyncIterator[dict]:
+        """All messages, oldest first, read batch by batch"""
+        after_id = 0
+        while True:
+            batch = session_store.message_range(conversation_id, after_id=after_id)[:batch_size]
+            if not batch:
+                return
+            for message in batch:
+                yield message.history_row()
+            after_id = batch[-1].id
+            # Let other requests run between batches, as a database read would
+            await asyncio.sleep(0)
+
+    @staticmethod
+    async def get_memory_messages(
+        db: MemorySession,
+        conversation_id: int,
+        after_id: int = 0,
+        before_id: Optional[int] = None,
+        limit: int = 50,
+        newest_first: bool = True
+    ) -> List[dict]:
+        messages = session_store.message_range(conversation_id, after_id=after_id, before_id=before_id)
+        selected = messages[::-1][:limit] if newest_first else messages[:limit]
+        return [{"id": message.id, "role": message.role, "content": message.content} for message in selected]
+
+
+class FileDB:
+    """In-memory file records (same interface as database_utils.FileDB)"""
+
+    @staticmethod
+    async def create_file(
+        db: MemorySession,
+        conversation_id: int,
+        filename: str,
+        file_type: FileType,
+        file_size: Optional[int] = None,
+        text_content: Optional[str] = None,
+        chunks_count: Optional[int] = None,
+        is_image: bool = False,
+        blob_ref: Optional[str] = None,
+        media_type: Optional[str] = None,
+        document_id: Optional[int] = None,
+        cloudinary_url: Optional[str] = None
+    ) -> Optional[FileRecord]:
+        """Record a file (text_content is not kept: chunks and documents hold the text)"""
+        return session_store.add_file(conversation_id, filename, file_type, {
+            "file_size": file_size,
+            "chunks_count": chunks_count,
+            "is_image": is_image,
+            "blob_ref": blob_ref,
+            "media_type": media_type,
+            "document_id": document_id,
+            "cloudinary_url": cloudinary_url
+        })
+
+    @staticmethod
+    async def get_latest_file(db: MemorySession, conversation_id: int) -> Optional[FileRecord]:
+        conversation = session_store.get(conversation_id)
+        if conversation is None or not conversation.files:
+            return None
+        return conversation.files[-1]
+
+    @staticmethod
+    async def get_legacy_image(db: MemorySession, file_id: int) -> Optional[str]:
+        """No legacy rows exist in memory: images always have a blob_ref"""
+        return None
+
+
+class ContextDB:
+    """In-memory conversation chunks and retrieval (same interface as database_utils.ContextDB)"""
+
+    @staticmethod
+    async def set_document(db: MemorySession, conversation_id: int, document_id: int) -> int:
+        """Make a stored document the conversation's context (its chunk tuples and indexes are shared)"""
+        lexical_indexes.drop(conversation_id)
+        vector_indexes.drop(conversation_id)
+        document = session_store.get_document(document_id)
+        if document is not None and document.chunks:
+            count, _ = session_store.replace_chunks(conversation_id, document.chunks, document)
+        else:
+            count, _ = session_store.replace_chunks(conversation_id, [])
+        return count
+
+    @staticmethod
+    async def get_source(db: MemorySession, conversation_id: int) -> ChunkSource:
+        source, _ = session_store.chunks(conversation_id)
+        return source
+
+    @staticmethod
+    async def get_chunks(db: MemorySession, conversation_id: int, limit: Optional[int] = None) -> List[str]:
+        _, rows = session_store.chunks(conversation_id)
+        texts = [row[1] for row in sorted(rows)]
+        return texts[:limit] if limit else texts
+
+    @staticmethod
+    async def get_chunks_version(db: MemorySession, conversation_id: int) -> tuple:
+        """(chunk count, version) - changes whenever chunks are replaced"""
+        source, _ = session_store.chunks(conversation_id)
+        return source.version
+
+    @staticmethod
+    async def get_chunks_by_index(db: MemorySession, conversation_id: int, chunk_indexes: List[int]) -> List[str]:
+        _, rows = session_store.chunks(conversation_id)
+        texts = {row[0]: row[1] for row in rows}
+        return [texts[chunk_index] for chunk_index in chunk_indexes if chunk_index in texts]
+
+    @staticmethod
+    def load_lexical_index(conversation_id: int) -> Tuple[ChunkSource, Optional[BM25Index], List[tuple]]:
+        """(source, BM25 index, chunks); the index is rebuilt if it was evicted"""
+        source, rows = session_store.chunks(conversation_id)
+        if not rows:
+            lexical_indexes.drop(source.key)
+            return source, None, rows
+
+        index = lexical_indexes.get(source.key)
+        if index is None or index.version != source.version:
+            index = lexical_indexes.build(source.key, ((row[0], row[1]) for row in rows), version=source.version)
+        return source, index, rows
+
+    @staticmethod
+    async def search_chunks(
+        db: MemorySession,
+        conversation_id: int,
+        query: str,
+        limit: int = RETRIEVAL_TOP_K,
+        query_vector=None
+    ) -> List[str]:
+        """Chunks most relevant to a question, best first (ranked like the database version)"""
+        results = await ContextDB.search_chunks_many(
+            db, conversation_id, [query], limit,
+            None if query_vector is None else [query_vector]
+        )
+        return results[0]
+
+    @staticmethod
+    async def search_chunks_many(
+        db: MemorySession,
+        conversation_id: int,
+        queries: List[str],
+        limit: int = RETRIEVAL_TOP_K,
+        query_vectors=None
+    ) -> List[List[str]]:
+        source, index, rows = ContextDB.load_lexical_index(conversation_id)
+        if index is None:
+            return [[] for _ in queries]
+
+        texts = {row[0]: row[1] for row in rows}
+        first_chunks = [texts[chunk_index] for chunk_index in sorted(texts)[:limit]]
+        results = []
+        for position, query in enumerate(queries):
+            ranked = database_utils.ContextDB.rank_chunks(
+                source, index, query, limit,
+                None if query_vectors is None else query_vectors[position]
+            )
+            results.append([texts[chunk_index] for chunk_index in ranked if chunk_index in texts] if ranked else first_chunks)
+        return results
+
+    @staticmethod
+    async def clear_chunks(db: MemorySession, conversation_id: int):
+        session_store.replace_chunks(conversation_id, [])
+        lexical_indexes.drop(conversation_id)
+        vector_indexes.drop(conversation_id)
+
+
+class DocumentDB:
+    """In-memory content-addressed documents (same interface as database_utils.DocumentDB)"""
+
+    hash_content = staticmethod(database_utils.DocumentDB.hash_content)
+    index_key = staticmethod(database_utils.DocumentDB.index_key)
+    source = staticmethod(database_utils.DocumentDB.source)
+
+    @staticmethod
+    async def get_by_hash(db: MemorySession, content_hash: str) -> Optional[DocumentRecord]:
+        return session_store.get_document_by_hash(content_hash)
+
+    @staticmethod
+    async def create_document(
+        db: MemorySession,
+        content_hash: str,
+        file_type: FileType,
+        byte_size: int,
+        chunks: Union[Iterable[Union[Chunk, str]], AsyncIterable[Chunk]],
+        offsets: Optional[List[int]] = None,
+        on_staged: Optional[Callable[[int, BM25Index], None]] = None
+    ) -> Tuple[DocumentRecord, bool]:
+        """
+        Store a document's chunks and BM25 index as they are produced
+
+        The full text is not kept - conversations only ever read chunks.
+        Chunks are appended to a staged document that on_staged(document_id,
+        index) can read from meanwhile, like the database version; it is
+        published once complete. Returns (document, created).
+        """
+        document = session_store.stage_document(file_type, byte_size)
+        index = BM25Index()
+        if on_staged is not None:
+            on_staged(document.id, index)
+        try:
+            async for chunk in aiter_chunks(chunks):
+                if isinstance(chunk, str):
+                    chunk = Chunk(len(document.chunks), chunk)
+                document.chunks.append((chunk.index, chunk.text, chunk.page))
+                index.add(chunk.index, chunk.text)
+        except BaseException:
+            session_store.discard_document(document.id)
+            raise
+
+        document, created = session_store.add_document(document, content_hash, offsets)
+        if created:
+            source = DocumentDB.source(document.id, document.chunks_count)
+            index.version = source.version
+            lexical_indexes.put(source.key, index)
+        return document, created
+
+    @staticmethod
+    async def get_chunks_by_index(db: MemorySession, document_id: int, chunk_indexes: List[int]) -> List[str]:
+        document = session_store.get_document(document_id)
+        texts = {row[0]: row[1] for row in document.chunks} if document is not None else {}
+        return [texts[chunk_index] for chunk_index in chunk_indexes if chunk_index in texts]
+
+    @staticmethod
+    def iter_chunk_batches(db: MemorySession, document_id: int, batch_size: int = database_utils.CHUNK_BATCH_SIZE) -> Iterator[List[Tuple[int, str]]]:
+        """A document's (chunk_index, chunk_text) rows, batch by batch (for worker threads)"""
+        document = session_store.get_document(document_id)
+        rows = document.chunks if document is not None else []
+        for start in range(0, len(rows), batch_size):
+            yield [(row[0], row[1]) for row in rows[start:start + batch_size]]
@@ -0,0 +1,332 @@
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Seconds; from a cache hit to a slow model answer
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Seconds; single DB statements are mostly well under a millisecond
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+# Prometheus text exposition format (Starlette appends the utf-8 charset)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """A named metric with fixed label names; one series per label combination"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: dict = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames) or any(name not in labels for name in self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        """Forget every series (collectors that rebuild their label sets)"""
+        with self._lock:
+            self._series.clear()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}"
+        ]
+        return lines + self.samples()
+
+
+class Counter(Metric):
+    """Monotonic total (name it with a _total suffix)"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in series]
+
+
+class Gauge(Metric):
+    """Current value, usually set by a collector right before rendering"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = float(value)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in series]
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        # Bucket upper bounds are inclusive (le)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last one is +Inf) and the sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the duration of a with-block (also when it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(names, key + (format_value(bound),))} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    In-process metrics rendered in the Prometheus text format
+
+    Every worker process has its own registry, so with several workers
+    each one must be scraped (Prometheus sums the series).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def on_collect(self, collector: Callable[[], None]):
+        """Run collector before each render (to set gauges from live state)"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Metrics collector failed", extra={"collector": getattr(collector, "__qualname__", repr(collector))})
+
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda metric: metric.name):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUESTS = metrics.counter(
+    "chatbot_http_requests_total", "HTTP requests by route and status code", ("method", "route", "status")
+)
+HTTP_LATENCY = metrics.histogram(
+    "chatbot_http_request_duration_seconds", "Time until the response starts (streams keep running after)", ("method", "route")
+)
+STAGE_LATENCY = metrics.histogram(
+    "chatbot_stage_duration_seconds", "Time spent in one stage of handling a request", ("stage",)
+)
+DB_QUERY_LATENCY = metrics.histogram(
+    "chatbot_db_query_duration_seconds", "Duration of single database statements", ("operation",), buckets=DB_BUCKETS
+)
+LLM_LATENCY = metrics.histogram(
+    "chatbot_llm_request_duration_seconds",
+    "Model call latency (time to first token for streams) by routing role and outcome",
+    ("model", "role", "outcome")
+)
+LLM_TOKENS = metrics.counter(
+    "chatbot_llm_tokens_total", "Prompt (in) and completion (out) tokens", ("model", "direction")
+)
+CACHE_LOOKUPS = metrics.counter(
+    "chatbot_llm_cache_lookups_total", "LLM response cache lookups (hit, disk_hit, miss, bypass)", ("result",)
+)
+RATE_LIMIT_WAIT = metrics.histogram(
+    "chatbot_rate_limit_wait_seconds", "Time model calls queued for rate-limit capacity", ("model",)
+)
+RATE_LIMIT_REJECTIONS = metrics.counter(
+    "chatbot_rate_limit_rejections_total", "Model calls refused by the client-side rate limiter", ("model", "reason")
+)
+
+# Live state, set by the owning modules' collectors at scrape time
+RATE_LIMIT_QUEUED = metrics.gauge(
+    "chatbot_rate_limit_queued", "Model calls waiting for rate-limit capacity", ("model",)
+)
+CIRCUIT_STATE = metrics.gauge(
+    "chatbot_model_circuit_state", "Model circuit breaker state (0 closed, 1 half-open, 2 open)", ("model",)
+)
+CACHE_ENTRIES = metrics.gauge("chatbot_llm_cache_entries", "Answers in the in-process LLM cache")
+CACHE_BYTES = metrics.gauge("chatbot_llm_cache_bytes", "Size of the in-process LLM cache")
+EXTRACTION_PENDING = metrics.gauge("chatbot_extraction_pending", "Extraction jobs running or queued")
+
+
+def timed_iter(iterable: Iterable, stage: str) -> Iterator:
+    """
+    Yield from iterable, observing the time spent producing its items
+
+    For lazy pipelines (e.g. chunking consumed by the DB insert), where
+    timing the consumer would count the consumer's own work too.
+    """
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+
+
+def statement_operation(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return "read" if keyword in ("SELECT", "WITH", "EXPLAIN", "PRAGMA") else "write"
+
+
+def instrument_engine(engine):
+    """Time every statement an Engine (or an AsyncEngine's sync_engine) sends"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is not None:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - start, operation=statement_operation(statement))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and timing them to the response start
+
+    Routes are labelled by their path template (/chat/ rather than the
+    URL), so label values stay bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        observed = False
+
+        def observe():
+            nonlocal observed
+            if observed:
+                return
+            observed = True
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": getattr(route, "path", "unmatched")}
+            HTTP_LATENCY.observe(time.perf_counter() - start, **labels)
+            HTTP_REQUESTS.inc(status=status, **labels)
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                observe()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            observe()
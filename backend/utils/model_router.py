@@ -0,0 +1,327 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from utils.metrics import metrics, CIRCUIT_STATE, LLM_LATENCY
+from utils.rate_limiter import AdmissionQueueFull, RateLimited
+
+
+logger = logging.getLogger(__name__)
+
+# Time budget for one completion, fallbacks and hedges included
+MODEL_DEADLINE_SECONDS = float(os.getenv("MODEL_DEADLINE_SECONDS", "30"))
+# Time budget for the first token of a stream
+MODEL_FIRST_TOKEN_SECONDS = float(os.getenv("MODEL_FIRST_TOKEN_SECONDS", "15"))
+# Send the request to the fallback too if the primary is slower than its p95
+MODEL_HEDGE_ENABLED = os.getenv("MODEL_HEDGE_ENABLED", "true").lower() == "true"
+MODEL_HEDGE_MIN_SAMPLES = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))
+MODEL_HEDGE_MIN_DELAY = float(os.getenv("MODEL_HEDGE_MIN_DELAY", "0.5"))
+# Consecutive failures that open a model's circuit, and how long it stays open
+MODEL_BREAKER_FAILURES = int(os.getenv("MODEL_BREAKER_FAILURES", "5"))
+MODEL_BREAKER_COOLDOWN = float(os.getenv("MODEL_BREAKER_COOLDOWN", "30"))
+# Calls kept per model for the rolling stats
+MODEL_STATS_WINDOW = int(os.getenv("MODEL_STATS_WINDOW", "200"))
+
+
+class ModelUnavailable(Exception):
+    """Every candidate model failed or the deadline passed"""
+
+    def __init__(self, message: str, timed_out: bool = False):
+        super().__init__(message)
+        self.timed_out = timed_out
+
+
+class ModelStats:
+    """Rolling latency and error stats of one model (last MODEL_STATS_WINDOW calls)"""
+
+    def __init__(self, window: int = MODEL_STATS_WINDOW):
+        self.samples: deque = deque(maxlen=window)  # (latency seconds or None, ok)
+        self.calls = 0
+        self.failures = 0
+        self.hedges_won = 0
+
+    def record(self, latency: Optional[float], ok: bool):
+        self.samples.append((latency, ok))
+        self.calls += 1
+        self.failures += not ok
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Latency percentile of successful calls in the window"""
+        latencies = sorted(latency for latency, ok in self.samples if ok and latency is not None)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile))]
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def timed_successes(self) -> int:
+        return sum(1 for latency, ok in self.samples if ok and latency is not None)
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit: closed -> open after consecutive failures -> half-open
+
+    While open, requests skip the model. After the cooldown one probe
+    request is let through; its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    # Gauge values for /metrics
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, failure_threshold: int = MODEL_BREAKER_FAILURES, cooldown: float = MODEL_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def available(self) -> bool:
+        """Whether a request may be sent now"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.cooldown
+        if self.state == self.HALF_OPEN:
+            return not self.probe_in_flight
+        return True
+
+    def acquire(self):
+        """A request is being sent (it becomes the probe after the cooldown)"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            self.probe_in_flight = True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if it opened the circuit"""
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            opened = self.state != self.OPEN
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            return opened
+        return False
+
+    def release(self):
+        """A claimed probe ended without an outcome (e.g. cancelled)"""
+        self.probe_in_flight = False
+
+
+class ModelRouter:
+    """
+    Routes completions across a task's primary and fallback models
+
+    - Models with an open circuit are skipped (if all are open, they are
+      tried anyway rather than failing without a call)
+    - Every request has a deadline covering all attempts
+    - Hedging: if the primary hasn't answered within its observed p95
+      latency, the same request goes to the fallback and the first answer
+      wins; the slower call is cancelled
+    """
+
+    def __init__(self):
+        self.stats: Dict[str, ModelStats] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def _stats(self, model: str) -> ModelStats:
+        if model not in self.stats:
+            self.stats[model] = ModelStats()
+        return self.stats[model]
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        if model not in self.breakers:
+            self.breakers[model] = CircuitBreaker()
+        return self.breakers[model]
+
+    def candidates(self, models: List[str]) -> List[str]:
+        """Models in preference order whose circuit lets a request through"""
+        unique = list(dict.fromkeys(models))
+        allowed = [model for model in unique if self._breaker(model).available()]
+        return allowed or unique
+
+    def hedge_delay(self, model: str, remaining: float) -> Optional[float]:
+        """Seconds to wait on a model before hedging, None to not hedge"""
+        if not MODEL_HEDGE_ENABLED:
+            return None
+        stats = self._stats(model)
+        if stats.timed_successes() < MODEL_HEDGE_MIN_SAMPLES:
+            return None
+        delay = max(stats.latency_percentile(0.95), MODEL_HEDGE_MIN_DELAY)
+        return delay if delay < remaining else None
+
+    def acquire(self, model: str):
+        """A request is being sent to the model"""
+        self._breaker(model).acquire()
+
+    def release(self, model: str):
+        """A request ended without a verdict on the model (cancelled)"""
+        self._breaker(model).release()
+
+    def record(self, model: str, latency: Optional[float], ok: bool):
+        """Outcome of a call; latency None keeps it out of the percentiles (streams)"""
+        self._stats(model).record(latency, ok)
+        if ok:
+            self._breaker(model).record_success()
+        elif self._breaker(model).record_failure():
+            logger.warning("Circuit opened", extra={"model": model, "cooldown_seconds": MODEL_BREAKER_COOLDOWN})
+
+    async def _attempt(self, call, model: str, timeout: float, admit=None, role: str = "primary"):
+        """
+        One call under a timeout, recorded in the model's stats and circuit
+
+        admit(model, max_wait) is awaited first (client-side rate limiting);
+        a hedge never waits for capacity. Time spent waiting there is not
+        model latency, and a rejection is no verdict on the model. role
+        (primary, fallback or hedge) labels the call's latency metric.
+        """
+        loop = asyncio.get_running_loop()
+        expires = loop.time() + timeout
+        start = time.monotonic()
+        try:
+            if admit is not None:
+                await admit(model, 0.0 if role == "hedge" else max(expires - loop.time(), 0.0))
+                start = time.monotonic()
+            result = await asyncio.wait_for(call(model), timeout=max(expires - loop.time(), 0.001))
+        except (asyncio.CancelledError, RateLimited, AdmissionQueueFull):
+            # Lost a hedge race, the client went away or no capacity: no verdict on the model
+            self.release(model)
+            raise
+        except Exception as e:
+            latency = time.monotonic() - start
+            self.record(model, latency, ok=False)
+            outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            LLM_LATENCY.observe(latency, model=model, role=role, outcome=outcome)
+            raise
+        latency = time.monotonic() - start
+        self.record(model, latency, ok=True)
+        LLM_LATENCY.observe(latency, model=model, role=role, outcome="ok")
+        return result
+
+    async def complete(self, call, models: List[str], deadline: float = MODEL_DEADLINE_SECONDS, admit=None):
+        """
+        Run call(model) on the first model that answers
+
+        call is an async function of the model name, admit an optional
+        async admission check (see _attempt). Returns (result, model).
+        Raises ModelUnavailable when every model failed or the deadline
+        passed, or the admission error if a model was refused capacity.
+        """
+        loop = asyncio.get_running_loop()
+        expires = loop.time() + deadline
+        queue = self.candidates(models)
+        running: Dict[asyncio.Task, str] = {}
+        errors = []
+        refused = None
+        hedges = set()
+        hedging = True
+
+        def launch():
+            model = queue.pop(0)
+            self.acquire(model)
+            role = "hedge" if running else ("primary" if model == models[0] else "fallback")
+            logger.info("Calling model", extra={"model": model, "role": role})
+            task = asyncio.create_task(
+                self._attempt(call, model, expires - loop.time(), admit=admit, role=role)
+            )
+            if running:
+                hedges.add(task)
+            running[task] = model
+
+        try:
+            launch()
+            while running:
+                remaining = expires - loop.time()
+                if remaining <= 0:
+                    break
+
+                # Hedge only while exactly one call is in flight and a spare model exists
+                timeout = remaining
+                hedge_after = None
+                if hedging and len(running) == 1 and queue:
+                    hedge_after = self.hedge_delay(next(iter(running.values())), remaining)
+                    if hedge_after is not None:
+                        timeout = hedge_after
+
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedge_after is not None:
+                        launch()
+                    continue
+
+                for task in done:
+                    model = running.pop(task)
+                    if task.exception() is None:
+                        if model != models[0] and len(running):
+                            self._stats(model).hedges_won += 1
+                        return task.result(), model
+                    error = task.exception()
+                    if isinstance(error, (RateLimited, AdmissionQueueFull)):
+                        if task in hedges:
+                            # No spare capacity to hedge: keep the model as a plain fallback
+                            queue.insert(0, model)
+                            hedging = False
+                            continue
+                        refused = error
+                    kind = "timeout" if isinstance(error, asyncio.TimeoutError) else str(error)
+                    logger.warning("Model call failed", extra={"model": model, "error": kind})
+                    errors.append(f"{model}: {kind}")
+
+                if not running and queue:
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        if refused is not None:
+            raise refused
+        if loop.time() >= expires:
+            raise ModelUnavailable(f"No answer within {deadline:.0f}s. {' | '.join(errors)}".strip(), timed_out=True)
+        raise ModelUnavailable(" | ".join(errors) or "No model available")
+
+    def snapshot(self) -> dict:
+        """Per-model circuit state, latency percentiles and error rates"""
+        models = {}
+        for model, stats in self.stats.items():
+            breaker = self._breaker(model)
+            p50 = stats.latency_percentile(0.5)
+            p95 = stats.latency_percentile(0.95)
+            models[model] = {
+                "circuit": breaker.state,
+                "consecutive_failures": breaker.consecutive_failures,
+                "calls": stats.calls,
+                "failures": stats.failures,
+                "error_rate": round(stats.error_rate(), 4),
+                "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+                "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+                "hedges_won": stats.hedges_won
+            }
+        return {
+            "deadline_seconds": MODEL_DEADLINE_SECONDS,
+            "hedging": MODEL_HEDGE_ENABLED,
+            "models": models
+        }
+
+    def collect_metrics(self):
+        for model, breaker in self.breakers.items():
+            CIRCUIT_STATE.set(CircuitBreaker.STATE_VALUES[breaker.state], model=model)
+
+
+model_router = ModelRouter()
+metrics.on_collect(model_router.collect_metrics)
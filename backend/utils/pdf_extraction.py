@@ -0,0 +1,72 @@
+"""
+Page-parallel PDF text extraction
+
+A PDF is split into page ranges that are extracted by the extraction
+process pool side by side, so a long document takes about
+pages / workers instead of pages. Page texts are yielded in order
+as soon as the next range is done - chunking and indexing start on the
+first pages while later ones are still being parsed.
+
+The first range also reports the page count. The rest is split into at
+most two ranges per worker (every job re-opens the PDF, so more would
+only add overhead), kept running up to one per worker so one big upload
+can't take every slot of the pool (EXTRACTION_MAX_PENDING applies per job).
+"""
+import asyncio
+import math
+import os
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from utils.extraction_pool import extraction_pool
+from utils.text_extractor import parse_pdf_page_range
+
+
+# Pages of the first job, and the least pages of any later one
+PDF_PAGES_PER_JOB = int(os.getenv("PDF_PAGES_PER_JOB", "16"))
+# Later ranges per worker: >1 evens out pages that are slower to parse
+RANGES_PER_WORKER = 2
+
+
+async def iter_pdf_pages(content: bytes, pages_per_job: int = PDF_PAGES_PER_JOB, max_parallel: Optional[int] = None) -> AsyncIterator[str]:
+    """
+    Yield the text of each page in order (blank pages as "")
+
+    Raises ValueError for PDFs without pages or without any text (the
+    latter only once every page has been seen).
+
+    Raises:
+        ExtractionQueueFull, ExtractionTimeout: from the extraction pool, per job
+    """
+    max_parallel = max_parallel or extraction_pool.workers
+    page_count, first_pages = await extraction_pool.run(parse_pdf_page_range, content, 0, pages_per_job)
+
+    has_text = False
+    for text in first_pages:
+        has_text = has_text or bool(text.strip())
+        yield text
+
+    remaining = page_count - pages_per_job
+    range_size = max(pages_per_job, math.ceil(remaining / (max_parallel * RANGES_PER_WORKER))) if remaining > 0 else 1
+    ranges = deque((start, start + range_size) for start in range(pages_per_job, page_count, range_size))
+    running: deque = deque()
+    try:
+        while ranges or running:
+            while ranges and len(running) < max_parallel:
+                start, stop = ranges.popleft()
+                running.append(asyncio.ensure_future(extraction_pool.run(parse_pdf_page_range, content, start, stop)))
+
+            # In page order: later ranges keep running meanwhile
+            _, range_pages = await running.popleft()
+            for text in range_pages:
+                has_text = has_text or bool(text.strip())
+                yield text
+    finally:
+        # Consumer stopped early or a job failed: don't leave jobs unobserved
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    if not has_text:
+        raise ValueError("No text could be extracted from PDF")
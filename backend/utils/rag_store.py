@@ -1,6 +0,0 @@
-VECTOR_STORE = {
-    "chunks": [],           # Text chunks for document-based files
-    "filename": None,       # Original filename
-    "type": None,           # File type: pdf, image, text, word, etc.
-    "image_data": None      # Base64 image data for images
-}
\ No newline at end of file
@@ -0,0 +1,284 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from typing import Dict, Optional
+
+from utils.chunker import estimate_tokens
+from utils.metrics import metrics, RATE_LIMIT_QUEUED, RATE_LIMIT_REJECTIONS, RATE_LIMIT_WAIT
+
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Workers sharing one API key - each gets this share of the provider limits
+RATE_LIMIT_WORKERS = max(1, int(os.getenv("RATE_LIMIT_WORKERS", "1")))
+# Limits for models missing from ModelConfig.RATE_LIMITS
+RATE_LIMIT_DEFAULT_RPM = float(os.getenv("RATE_LIMIT_DEFAULT_RPM", "30"))
+RATE_LIMIT_DEFAULT_TPM = float(os.getenv("RATE_LIMIT_DEFAULT_TPM", "6000"))
+# Calls allowed to wait per model; more get 503 at once
+RATE_LIMIT_MAX_QUEUE = int(os.getenv("RATE_LIMIT_MAX_QUEUE", "64"))
+# Longest a call may wait for capacity; if the queue ahead needs more, 429 at once
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "10"))
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 5
+PRIORITY_BACKGROUND = 10
+
+
+class RateLimited(Exception):
+    """The call can't get capacity within its wait budget (HTTP 429)"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionQueueFull(Exception):
+    """Too many calls are already waiting for this model (HTTP 503)"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_request_tokens(messages: list, max_tokens: int) -> int:
+    """Tokens a completion counts against TPM: prompt estimate plus max_tokens"""
+    prompt = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            prompt += estimate_tokens(content) + 4
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    prompt += estimate_tokens(part.get("text", ""))
+                else:
+                    prompt += 1000  # images are billed as a block of tokens
+    return prompt + max_tokens
+
+
+class TokenBucket:
+    """Refills continuously up to capacity (rate per second)"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (amounts above capacity wait for a full bucket)"""
+        return self.deficit_time(min(amount, self.capacity))
+
+    def deficit_time(self, amount: float) -> float:
+        """Seconds of refill needed to cover amount (may exceed one bucket)"""
+        self._refill()
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, seconds: float):
+        """Empty the bucket and keep it empty for about `seconds` (provider 429)"""
+        self._refill()
+        self.level = min(self.level, -seconds * self.rate)
+
+
+class ModelLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets of one model, with a
+    priority queue of waiting calls
+
+    Waiters are granted strictly in (priority, arrival) order, so a large
+    request at the head isn't starved by small ones behind it.
+    """
+
+    def __init__(self, model: str, rpm: float, tpm: float):
+        self.model = model
+        self.requests = TokenBucket(rpm, rpm / 60)
+        self.tokens = TokenBucket(tpm, tpm / 60)
+        self._waiters: list = []  # heap of [priority, seq, cost, future]
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._pump: Optional[asyncio.Task] = None
+        self.admitted = 0
+        self.rejected = 0
+        self.waited_seconds = 0.0
+
+    def wait_time(self, cost: int) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(cost))
+
+    def _take(self, cost: int):
+        self.requests.take(1)
+        self.tokens.take(cost)
+        self.admitted += 1
+
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter[3].done())
+
+    async def acquire(self, cost: int, priority: int = PRIORITY_INTERACTIVE, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        """Wait for capacity; raises RateLimited or AdmissionQueueFull instead of waiting too long"""
+        if not self._waiters and self.wait_time(cost) == 0:
+            self._take(cost)
+            RATE_LIMIT_WAIT.observe(0.0, model=self.model)
+            return
+
+        # Capacity needed by the calls served before this one, plus its own
+        ahead = [waiter for waiter in self._waiters if waiter[0] <= priority and not waiter[3].done()]
+        expected = max(
+            self.requests.deficit_time(len(ahead) + 1),
+            self.tokens.deficit_time(sum(waiter[2] for waiter in ahead) + cost)
+        )
+        if self.queued() >= RATE_LIMIT_MAX_QUEUE:
+            self.rejected += 1
+            RATE_LIMIT_REJECTIONS.inc(model=self.model, reason="queue_full")
+            raise AdmissionQueueFull(f"{self.model}: {RATE_LIMIT_MAX_QUEUE} calls already waiting", retry_after=expected)
+        if expected > max_wait:
+            self.rejected += 1
+            RATE_LIMIT_REJECTIONS.inc(model=self.model, reason="over_budget")
+            raise RateLimited(f"{self.model}: rate limit, about {expected:.1f}s of queued work", retry_after=expected)
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = [priority, next(self._sequence), cost, future]
+        heapq.heappush(self._waiters, waiter)
+        self._wakeup.set()
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=max(max_wait, 0.001))
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._wakeup.set()
+                self.rejected += 1
+                RATE_LIMIT_REJECTIONS.inc(model=self.model, reason="timeout")
+                raise RateLimited(f"{self.model}: no capacity within {max_wait:.1f}s", retry_after=self.wait_time(cost))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller went away: return the capacity
+                self.requests.give_back(1)
+                self.tokens.give_back(cost)
+            future.cancel()
+            self._wakeup.set()
+            raise
+        waited = time.monotonic() - start
+        self.waited_seconds += waited
+        RATE_LIMIT_WAIT.observe(waited, model=self.model)
+
+    async def _run_pump(self):
+        """Grant waiters in order as the buckets refill"""
+        while self._waiters:
+            priority, _, cost, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            delay = self.wait_time(cost)
+            if delay == 0:
+                heapq.heappop(self._waiters)
+                self._take(cost)
+                future.set_result(None)
+                continue
+
+            # Sleep until the head can go, or a more urgent waiter arrives
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """Correct the TPM bucket with the usage the provider reported"""
+        if actual is None:
+            return
+        # take() clips at capacity, so only that much was debited for the estimate
+        debited = min(estimated, self.tokens.capacity)
+        used = min(actual, self.tokens.capacity)
+        if used < debited:
+            self.tokens.give_back(debited - used)
+        else:
+            self.tokens.take(used - debited)
+
+    def pause(self, seconds: float):
+        """The provider said 429: send nothing for a while"""
+        self.requests.drain(seconds)
+
+    def snapshot(self) -> dict:
+        self.requests._refill()
+        self.tokens._refill()
+        return {
+            "rpm": self.requests.capacity,
+            "tpm": self.tokens.capacity,
+            "requests_available": round(self.requests.level, 2),
+            "tokens_available": round(self.tokens.level),
+            "queued": self.queued(),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "waited_seconds": round(self.waited_seconds, 3)
+        }
+
+
+class RateLimiter:
+    """Per-model limiters created on first use from ModelConfig.RATE_LIMITS"""
+
+    def __init__(self):
+        self._limiters: Dict[str, ModelLimiter] = {}
+
+    def for_model(self, model: str) -> ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            from lib.Groq_models_config import ModelConfig
+            limits = ModelConfig.RATE_LIMITS.get(model, {})
+            limiter = ModelLimiter(
+                model,
+                rpm=limits.get("rpm", RATE_LIMIT_DEFAULT_RPM) / RATE_LIMIT_WORKERS,
+                tpm=limits.get("tpm", RATE_LIMIT_DEFAULT_TPM) / RATE_LIMIT_WORKERS
+            )
+            self._limiters[model] = limiter
+        return limiter
+
+    async def acquire(self, model: str, cost: int, priority: int = PRIORITY_INTERACTIVE, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        if not RATE_LIMIT_ENABLED:
+            return
+        await self.for_model(model).acquire(cost, priority, max_wait)
+
+    def settle(self, model: str, estimated: int, actual: Optional[int]):
+        if RATE_LIMIT_ENABLED:
+            self.for_model(model).settle(estimated, actual)
+
+    def pause(self, model: str, seconds: float):
+        if RATE_LIMIT_ENABLED:
+            self.for_model(model).pause(seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": RATE_LIMIT_ENABLED,
+            "workers": RATE_LIMIT_WORKERS,
+            "models": {model: limiter.snapshot() for model, limiter in self._limiters.items()}
+        }
+
+    def collect_metrics(self):
+        for model, limiter in self._limiters.items():
+            RATE_LIMIT_QUEUED.set(limiter.queued(), model=model)
+
+
+def retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+rate_limiter = RateLimiter()
+metrics.on_collect(rate_limiter.collect_metrics)
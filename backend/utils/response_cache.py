@@ -0,0 +1,239 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from utils.metrics import metrics, CACHE_BYTES, CACHE_ENTRIES, CACHE_LOOKUPS
+
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+# Seconds a cached answer stays valid
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+# In-process tier limits
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Optional on-disk tier (SQLite file shared by the workers of one host)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH") or None
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "50000"))
+
+
+def make_cache_key(config: dict, messages: list) -> str:
+    """SHA-256 over the models, settings and messages of a completion"""
+    payload = json.dumps(
+        {
+            "model": config["model"],
+            "fallback": config["fallback"],
+            "settings": config["settings"],
+            "messages": messages
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """SQLite tier: survives restarts, evicts expired then least recently used rows"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        # One connection per process, used under the lock from worker threads
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, answer TEXT NOT NULL, model TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_used ON llm_cache (last_used)")
+
+    def get(self, key: str) -> Optional[Tuple[str, str, float]]:
+        now = time.time()
+        with self._lock, self._conn as conn:
+            row = conn.execute(
+                "SELECT answer, model, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] <= now:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            return row
+
+    def put(self, key: str, answer: str, model: str, expires_at: float):
+        now = time.time()
+        with self._lock, self._conn as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, answer, model, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, answer, model, expires_at, now)
+            )
+            self._writes += 1
+            # Evict every 100 writes rather than on each one
+            if self._writes % 100 == 0:
+                conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM answers
+
+    In-process LRU bounded by entry count and bytes, with TTL, in front of
+    an optional SQLite tier. Disk operations run in a thread.
+    """
+
+    def __init__(
+        self,
+        ttl: float = LLM_CACHE_TTL,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        disk_path: Optional[str] = LLM_CACHE_PATH,
+        enabled: bool = LLM_CACHE_ENABLED
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.disk = DiskCache(disk_path, LLM_CACHE_DISK_MAX_ENTRIES) if (enabled and disk_path) else None
+
+        # key -> (expires_at, answer, model, size)
+        self._entries: "OrderedDict[str, Tuple[float, str, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, answer: str, model: str, expires_at: float):
+        size = len(answer.encode("utf-8")) + len(key) + len(model)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+            self._entries[key] = (expires_at, answer, model, size)
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[3]
+                self.evictions += 1
+
+    def _lookup_memory(self, key: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                self._bytes -= entry[3]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    async def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """Return (answer, model) for a key, or None"""
+        if not self.enabled:
+            return None
+
+        found = self._lookup_memory(key)
+        if found is not None:
+            self.hits += 1
+            CACHE_LOOKUPS.inc(result="hit")
+            return found
+
+        if self.disk is not None:
+            try:
+                row = await asyncio.to_thread(self.disk.get, key)
+            except sqlite3.Error as e:
+                logger.warning("LLM cache disk read failed", extra={"error": str(e)})
+                row = None
+            if row is not None:
+                answer, model, expires_at = row
+                self._remember(key, answer, model, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                CACHE_LOOKUPS.inc(result="disk_hit")
+                return answer, model
+
+        self.misses += 1
+        CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    async def put(self, key: str, answer: str, model: str):
+        """Store an answer in both tiers"""
+        if not self.enabled:
+            return
+
+        expires_at = time.time() + self.ttl
+        self._remember(key, answer, model, expires_at)
+
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.put, key, answer, model, expires_at)
+            except sqlite3.Error as e:
+                logger.warning("LLM cache disk write failed", extra={"error": str(e)})
+
+    def record_bypass(self):
+        """Count a request that skipped the cache on purpose"""
+        self.bypassed += 1
+        CACHE_LOOKUPS.inc(result="bypass")
+
+    def clear(self):
+        """Drop the in-process tier"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "ttl_seconds": self.ttl,
+            "disk_tier": self.disk.path if self.disk else None
+        }
+
+    def collect_metrics(self):
+        CACHE_ENTRIES.set(len(self._entries))
+        CACHE_BYTES.set(self._bytes)
+
+
+response_cache = ResponseCache()
+metrics.on_collect(response_cache.collect_metrics)
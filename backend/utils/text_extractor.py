@@ -1,10 +1,71 @@
-import requests
 import io
-import PyPDF2
-from typing import Optional
+import sys
+from typing import List, Optional, Tuple
+
+
+# ═══════════════════════════════════════════════════
+# Byte parsers - top-level so they can run in the extraction process pool
+# ═══════════════════════════════════════════════════
+
+def preload_parsers():
+    """Import the parser libraries (run once in each extraction worker at startup)"""
+    import PyPDF2  # noqa: F401
+    try:
+        import docx  # noqa: F401
+    except ImportError:
+        pass
+
+
+def parse_pdf_page_range(content: bytes, start: int, stop: int) -> Tuple[int, List[str]]:
+    """
+    Extract the text of pages [start, stop) of a PDF
+
+    Returns (page count of the whole PDF, page texts); blank pages stay as
+    "" to keep numbering. Each extraction worker opens its own reader, so
+    ranges of one PDF can be parsed in parallel.
+    """
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(content))
+    page_count = len(reader.pages)
+    if page_count == 0:
+        raise ValueError("PDF has no pages")
+
+    return page_count, [reader.pages[number].extract_text() or "" for number in range(start, min(stop, page_count))]
+
+
+def parse_pdf_pages(content: bytes) -> List[str]:
+    """Extract the text of each PDF page (blank pages stay as "" to keep numbering)"""
+    _, pages = parse_pdf_page_range(content, 0, sys.maxsize)
+
+    if not any(page.strip() for page in pages):
+        raise ValueError("No text could be extracted from PDF")
+
+    return pages
+
+
+def parse_word_bytes(content: bytes) -> str:
+    """Extract text from Word document bytes"""
+    try:
+        import docx
+    except ImportError:
+        raise ValueError("python-docx not installed. Run: pip install python-docx")
+
+    doc_file = io.BytesIO(content)
+    doc = docx.Document(doc_file)
+    text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+
+    if not text.strip():
+        raise ValueError("No text found in Word document")
+
+    return text
 
 
 def extract_text_from_pdf(url: str) -> str:
+    # Only the URL path needs requests; keep it out of the extraction workers
+    import requests
+    import PyPDF2
+
     try:
         # Download with timeout
         response = requests.get(url, timeout=30)
@@ -14,24 +75,8 @@ def extract_text_from_pdf(url: str) -> str:
         if not response.content:
             raise ValueError("Empty response from Cloudinary")
 
-        # Try to read PDF
-        pdf_file = io.BytesIO(response.content)
-        reader = PyPDF2.PdfReader(pdf_file)
-
-        # Check if PDF has pages
-        if len(reader.pages) == 0:
-            raise ValueError("PDF has no pages")
-
-        text = ""
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-
-        if not text.strip():
-            raise ValueError("No text could be extracted from PDF")
-
-        return text
+        pages = parse_pdf_pages(response.content)
+        return "\n".join(page for page in pages if page)
 
     except PyPDF2.errors.PdfReadError as e:
         raise ValueError(
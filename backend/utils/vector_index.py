@@ -0,0 +1,245 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence, Tuple, Union
+
+# numpy is imported where it is used: nothing needs it before the first
+# document is embedded or searched, so it stays off the startup path
+if TYPE_CHECKING:
+    import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Local sentence-transformers model (name in the HF cache, or a directory)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR") or None
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Set to true to let the first load download the model; default is offline only
+EMBEDDING_ALLOW_DOWNLOAD = os.getenv("EMBEDDING_ALLOW_DOWNLOAD", "false").lower() == "true"
+EMBEDDINGS_ENABLED = os.getenv("EMBEDDINGS_ENABLED", "true").lower() == "true"
+
+# Where the vectors of documents (and legacy per-conversation chunks) are persisted
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(os.getcwd(), "vector_indexes"))
+# float16 halves memory and disk; scoring is done in float32 blocks
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float16")
+VECTOR_INDEX_MAX_CONVERSATIONS = int(os.getenv("VECTOR_INDEX_MAX_CONVERSATIONS", "128"))
+
+# Rows scored per float32 block, bounds temporary memory for big documents
+SCORE_BLOCK_ROWS = 8192
+
+
+class Embedder:
+    """
+    Lazily loaded sentence-transformers model (CPU, offline)
+
+    If the package or the cached model is missing, embeddings are disabled
+    for the process and retrieval stays lexical only.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._failed = not EMBEDDINGS_ENABLED
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return not self._failed
+
+    def load(self):
+        """Load the model once; returns None when embeddings are unavailable"""
+        if self._model is not None or self._failed:
+            return self._model
+
+        with self._lock:
+            if self._model is not None or self._failed:
+                return self._model
+
+            if not EMBEDDING_ALLOW_DOWNLOAD:
+                os.environ.setdefault("HF_HUB_OFFLINE", "1")
+                os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+            try:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(
+                    self.model_name,
+                    device="cpu",
+                    cache_folder=EMBEDDING_CACHE_DIR
+                )
+                logger.info("Embedding model loaded", extra={"model": self.model_name})
+            except Exception as e:
+                self._failed = True
+                logger.warning("Embeddings disabled", extra={"model": self.model_name, "error": str(e)})
+
+        return self._model
+
+    def embed(self, texts: Sequence[str]) -> Optional["np.ndarray"]:
+        """Embed texts in batches as L2-normalized float32 rows (blocking)"""
+        model = self.load()
+        if model is None:
+            return None
+
+        return model.encode(
+            list(texts),
+            batch_size=EMBEDDING_BATCH_SIZE,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ).astype("float32", copy=False)
+
+
+class VectorIndex:
+    """Normalized chunk embeddings of one document (or one conversation's own chunks)"""
+
+    def __init__(self, vectors: "np.ndarray", ids: "np.ndarray", version: Optional[tuple] = None):
+        self.vectors = vectors.astype(VECTOR_DTYPE, copy=False)
+        self.ids = ids.astype("int32", copy=False)
+        self.version = version  # ChunkSource.version of the chunks the vectors belong to
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query_vector: "np.ndarray", k: int) -> List[int]:
+        """Return the chunk indexes of the top-k cosine matches, best first"""
+        import numpy as np
+
+        if len(self.ids) == 0:
+            return []
+
+        query = query_vector.astype(np.float32, copy=False).ravel()
+        scores = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), SCORE_BLOCK_ROWS):
+            block = self.vectors[start:start + SCORE_BLOCK_ROWS].astype(np.float32, copy=False)
+            scores[start:start + len(block)] = block @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [int(self.ids[i]) for i in top]
+
+
+class VectorIndexRegistry:
+    """
+    Vector indexes keyed by a document's index key (or a conversation id
+    for chunks of its own): bounded in-memory LRU over .npz files
+
+    Every conversation of a document searches the document's index.
+
+    Files are written atomically, so several workers on one host can share
+    VECTOR_INDEX_DIR.
+    """
+
+    def __init__(self, directory: str = VECTOR_INDEX_DIR, max_conversations: int = VECTOR_INDEX_MAX_CONVERSATIONS):
+        self.directory = directory
+        self.max_conversations = max_conversations
+        self._indexes: "OrderedDict[int, VectorIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: Union[int, str]) -> str:
+        # Conversations are keyed by id, shared document indexes by name
+        name = f"conversation_{key}" if isinstance(key, int) else key
+        return os.path.join(self.directory, f"{name}.npz")
+
+    def _remember(self, conversation_id: Union[int, str], index: VectorIndex):
+        with self._lock:
+            self._indexes[conversation_id] = index
+            self._indexes.move_to_end(conversation_id)
+            while len(self._indexes) > self.max_conversations:
+                self._indexes.popitem(last=False)
+
+    def build(self, conversation_id: Union[int, str], batches: Iterable[Sequence[Tuple[int, str]]], version: Optional[tuple] = None) -> Optional[VectorIndex]:
+        """
+        Embed (chunk_index, chunk_text) batches and persist the index
+
+        Blocking - run off the event loop. Only one batch of texts is held
+        at a time; the result is a single compact matrix.
+        """
+        import numpy as np
+
+        vector_blocks = []
+        id_blocks = []
+        for batch in batches:
+            if not batch:
+                continue
+            vectors = embedder.embed([text for _, text in batch])
+            if vectors is None:
+                return None
+            vector_blocks.append(vectors.astype(VECTOR_DTYPE, copy=False))
+            id_blocks.append(np.fromiter((chunk_index for chunk_index, _ in batch), dtype=np.int32, count=len(batch)))
+
+        if not vector_blocks:
+            return None
+
+        index = VectorIndex(np.concatenate(vector_blocks), np.concatenate(id_blocks), version=version)
+        self._save(conversation_id, index)
+        return index
+
+    def _save(self, key: Union[int, str], index: VectorIndex):
+        import numpy as np
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            vectors=index.vectors,
+            ids=index.ids,
+            version=np.asarray(
+                [] if index.version is None else [-1 if v is None else v for v in index.version],
+                dtype=np.int64
+            )
+        )
+        os.replace(tmp_path, path)
+        self._remember(key, index)
+
+    def has(self, conversation_id: Union[int, str]) -> bool:
+        """Cheap check whether a conversation has an index (any version)"""
+        with self._lock:
+            if conversation_id in self._indexes:
+                return True
+        return os.path.exists(self._path(conversation_id))
+
+    def get(self, conversation_id: Union[int, str], version: Optional[tuple] = None) -> Optional[VectorIndex]:
+        """
+        Get an index, loading it from disk if needed
+
+        With a version, only an index built from exactly those chunks is
+        returned.
+        """
+        with self._lock:
+            index = self._indexes.get(conversation_id)
+            if index is not None:
+                self._indexes.move_to_end(conversation_id)
+
+        if index is None:
+            path = self._path(conversation_id)
+            if not os.path.exists(path):
+                return None
+            try:
+                import numpy as np
+                with np.load(path) as data:
+                    stored_version = tuple(None if v == -1 else int(v) for v in data["version"]) or None
+                    index = VectorIndex(data["vectors"], data["ids"], version=stored_version)
+            except Exception as e:
+                logger.warning("Could not load vector index", extra={"path": path, "error": str(e)})
+                return None
+            self._remember(conversation_id, index)
+
+        if version is not None and index.version != tuple(version):
+            return None
+        return index
+
+    def drop(self, conversation_id: Union[int, str]):
+        """Forget a conversation's index in memory and on disk"""
+        with self._lock:
+            self._indexes.pop(conversation_id, None)
+        try:
+            os.remove(self._path(conversation_id))
+        except FileNotFoundError:
+            pass
+
+
+embedder = Embedder()
+vector_indexes = VectorIndexRegistry()
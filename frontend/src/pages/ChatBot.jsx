@@ -58,9 +58,10 @@ export default function ChatBot() {
         const conversationsWithTitles = await Promise.all(
           conversationsWithMessages.map(async (conv) => {
             try {
+              // Oldest messages only: the title is the first user message
               const historyFormData = new FormData();
               const historyResponse = await fetch(
-                `${API_BASE_URL}/chat/?action=get_history&session_id=${conv.session_id}`,
+                `${API_BASE_URL}/chat/?action=get_history&session_id=${conv.session_id}&after=0&limit=10`,
                 { method: "POST", body: historyFormData }
               );
               const historyData = await historyResponse.json();
@@ -120,17 +121,28 @@ export default function ChatBot() {
 
   const loadConversationHistory = useCallback(async (convSessionId) => {
     try {
-      const formData = new FormData();
-      const response = await fetch(
-        `${API_BASE_URL}/chat/?action=get_history&session_id=${convSessionId}`,
-        {
-          method: "POST",
-          body: formData,
-        }
-      );
-      const data = await response.json();
+      // History comes in pages, newest first: follow `before` while has_more
+      let history = [];
+      let before = null;
+      let data;
+      do {
+        const formData = new FormData();
+        const response = await fetch(
+          `${API_BASE_URL}/chat/?action=get_history&session_id=${convSessionId}&limit=200` +
+            (before !== null ? `&before=${before}` : ""),
+          {
+            method: "POST",
+            body: formData,
+          }
+        );
+        data = await response.json();
+        if (data.status !== "success") break;
+        history = data.messages.concat(history);
+        before = data.messages.length ? data.messages[0].id : null;
+      } while (data.has_more && before !== null);
+
       if (data.status === "success") {
-        const formattedMessages = data.messages.map((msg) => ({
+        const formattedMessages = history.map((msg) => ({
           role: msg.role,
           content: msg.content,
           model: msg.model_used,